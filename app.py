@@ -1,19 +1,81 @@
-"""Application entry point for the LMS."""
+"""Application entry point for the LMS.
 
+``create_app(config)`` builds a configured app. Settings are read in this
+order, later ones winning:
+
+1. ``DEFAULT_CONFIG`` below
+2. ``LMS_*`` environment variables, e.g. ``LMS_DATABASE=/srv/lms.db`` or
+   ``LMS_DB_POOL_SIZE=4`` (values are parsed as JSON where possible)
+3. the ``config`` dict passed in
+
+Nothing is built at import time, so ``import app`` is cheap and tests and
+benchmarks can create apps against their own databases. ``flask --app app``
+finds the factory by itself; ``wsgi.py`` is the entry point for pre-fork
+servers.
+"""
+
+import gc
 from flask import Flask, session, render_template
+import database
+from routes.api import register_api_routes
 from routes.auth import register_auth_routes
+from routes.read_api import register_read_api_routes
+from routes.reports import register_report_routes
 from routes.courses import register_course_routes
-from helpers import is_admin  # Add this import
+from assets import init_assets
+from cache import cached_page, init_page_cache
+from changes import init_changes
+from commands import register_commands
+from hashing import init_hasher
+from helpers import init_user_cache, is_admin
+from metrics import init_metrics
+from ratelimit import init_rate_limiter
+from sessions import init_sessions
+from writebehind import init_write_behind
+
+DEFAULT_CONFIG = {
+    'SECRET_KEY': 'your-secret-key-here-change-this-later',  # Set LMS_SECRET_KEY in production
+    'DATABASE': 'lms.db',
+    'DB_POOL_SIZE': 8,  # Idle connections kept per worker process
+    'DB_PROFILE': 'wal',  # See database.DATABASE_PROFILES
+    # 'replicated' reads from DB_REPLICAS and keeps enrollments and progress
+    # in DB_SHARDS (see database.py and storage.py)
+    'DB_BACKEND': 'sqlite',
+    'DB_REPLICAS': [],
+    'DB_SHARDS': [],
+    # Cache resolved users (id, username, is_admin) briefly across requests
+    'USER_CACHE_TTL': 30,
+    # Seconds before other workers reject a revoked session
+    'SESSION_REVOCATION_INTERVAL': 5,
+    # Seconds before other workers' /api/v1 ETags and page caches see a change
+    'API_CHANGE_INTERVAL': 1,
+    # Cache the HTML of catalogue pages for logged-out visitors
+    'PAGE_CACHE_TTL': 60,
+    # Hash passwords in a bounded process pool, off the request threads
+    'HASH_WORKERS': 2,
+    'HASH_MAX_PENDING': 32,
+    # Login/registration attempts per client address and per username from
+    # that address, as [burst, refill seconds]; RATE_LIMIT_DATABASE shares them
+    # between workers (see ratelimit.py)
+    'RATE_LIMIT': True,
+    'RATE_LIMIT_PER_IP': [20, 60],
+    'RATE_LIMIT_PER_USERNAME': [5, 60],
+    # Dashboard counters come from user_progress_summary (see migrations.py)
+    'PROGRESS_SUMMARY': True,
+    # Stream /courses and /dashboard HTML as it renders (see helpers.render_page)
+    'STREAM_TEMPLATES': False,
+    # Commit enroll/complete clicks in the background, in group transactions
+    # (see writebehind.py); off by default
+    'WRITE_BEHIND': False,
+    # Query, route and template timing, served at /metrics (see metrics.py)
+    'SLOW_QUERY_MS': 100,
+    'METRICS_SERVER_TIMING': False,
+}
 
-# Create a Flask application instance
-app = Flask(__name__)
-app.secret_key = 'your-secret-key-here-change-this-later'
+# Anonymous pages rendered into the page cache by warm_app()
+WARM_PATHS = ('/', '/courses')
 
-# Register routes from different modules
-register_auth_routes(app)
-register_course_routes(app)
 
-@app.route('/')
 def home():
     """Home page route"""
     user = session.get('username')
@@ -21,16 +83,78 @@ def home():
     return render_template('home.html', username=user, is_admin=admin)
 
 
-@app.errorhandler(404)
 def not_found_error(error):
     """Handles 404 Not Found errors."""
     return render_template('404.html'), 404
 
-@app.errorhandler(500)
+
 def internal_error(error):
     """Handles 500 Internal Server errors."""
     return render_template('500.html'), 500
 
+
+def create_app(config=None):
+    """Create and configure an LMS app; ``config`` overrides the defaults.
+
+    Cache backends are chosen with ``USER_CACHE_BACKEND`` and
+    ``PAGE_CACHE_BACKEND`` (see ``cache.make_cache``).
+    """
+    app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
+    app.config.from_prefixed_env('LMS')
+    app.config.update(config or {})
+
+    # Share one pooled connection per request across helpers and routes
+    database.init_app(app)
+    init_user_cache(app)
+    # Signed id/role claims in the session cookie (see sessions.py)
+    init_sessions(app)
+    # Change counters behind the /api/v1 ETags (see changes.py)
+    init_changes(app)
+    init_page_cache(app)
+    init_hasher(app)
+    init_rate_limiter(app)
+    init_write_behind(app)
+    init_metrics(app)
+    # Fingerprinted, precompressed static files (see assets.py)
+    init_assets(app)
+
+    # Register routes from different modules
+    register_auth_routes(app)
+    register_course_routes(app)
+    register_api_routes(app)
+    register_read_api_routes(app)
+    register_report_routes(app)
+    app.add_url_rule('/', 'home', cached_page(home))
+    app.register_error_handler(404, not_found_error)
+    app.register_error_handler(500, internal_error)
+
+    # 'flask lms ...' commands (bulk import/export)
+    register_commands(app)
+    return app
+
+
+def warm_app(app):
+    """Get an app ready to serve before a pre-fork server forks its workers.
+
+    Compiles every template, builds the URL matcher, renders the anonymous
+    catalogue pages into the page cache, then closes the database
+    connections (they must not cross fork) and freezes the heap so the
+    garbage collector does not touch, and so copy, the shared pages in
+    each worker.
+    """
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    with app.test_client() as client:
+        for path in WARM_PATHS:
+            client.get(path)
+    for pool in database.get_backend(app).pools():
+        pool.close_all()
+    gc.collect()
+    gc.freeze()
+    return app
+
+
 # Run the app
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
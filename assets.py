@@ -0,0 +1,182 @@
+"""Fingerprinted, precompressed static assets.
+
+``build_assets`` (``flask --app app lms build-assets``) copies every file
+under ``static/`` to ``static/dist/`` with a content hash in its name, e.g.
+``css/style.3f2a9c1b7d4e.css``, writes ``.gz`` and ``.br`` versions of the
+text files next to it, and records the names in ``manifest.json``. Before
+that it checks that every asset the templates reference exists, and fails
+with ``MissingAsset`` otherwise.
+
+Templates link assets with ``{{ asset('css/style.css') }}``. With a
+manifest, that gives ``/assets/css/style.3f2a9c1b7d4e.css``, served with
+the best precompressed variant the client accepts and a one-year immutable
+Cache-Control: a changed file gets a new name, so browsers never need to
+revalidate. Without a manifest (in development) it falls back to the plain
+``/static/`` URL. Either way an unknown asset raises ``MissingAsset``.
+
+Brotli needs the optional ``brotli`` package; without it only gzip
+variants are written.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+from flask import abort, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # Optional: pip install brotli
+    brotli = None
+
+MANIFEST_NAME = 'manifest.json'
+FINGERPRINT_LENGTH = 12
+ASSET_MAX_AGE = 365 * 24 * 3600  # Seconds; fingerprinted names never change content
+
+# Only text compresses well; images and fonts are already compressed
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map', '.xml'}
+
+# (suffix, Content-Encoding), best first
+ENCODINGS = (('.br', 'br'), ('.gz', 'gzip'))
+
+# asset('...') and url_for('static', filename='...') in templates
+_TEMPLATE_REFERENCE = re.compile(
+    r'''(?:\basset\(\s*|url_for\(\s*['"]static['"]\s*,\s*filename\s*=\s*)['"]([^'"]+)['"]'''
+)
+
+
+class MissingAsset(Exception):
+    """An asset referenced by a template or asset() call does not exist."""
+
+
+def fingerprinted_name(path, digest):
+    """Insert a content hash before the extension: css/a.css -> css/a.<hash>.css."""
+    root, ext = os.path.splitext(path)
+    return f'{root}.{digest[:FINGERPRINT_LENGTH]}{ext}'
+
+
+def source_files(static_dir, dist_dir):
+    """Yield the asset paths under ``static_dir``, relative and with '/' separators."""
+    dist_dir = os.path.abspath(dist_dir)
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) != dist_dir)
+        for name in sorted(files):
+            path = os.path.relpath(os.path.join(root, name), static_dir)
+            yield path.replace(os.sep, '/')
+
+
+def template_references(template_dir):
+    """Return ``{asset path: ['template:line', ...]}`` for every template reference."""
+    references = {}
+    for root, _, files in os.walk(template_dir):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            with open(path, encoding='utf-8') as f:
+                for number, line in enumerate(f, 1):
+                    for asset_path in _TEMPLATE_REFERENCE.findall(line):
+                        where = f'{os.path.relpath(path, template_dir)}:{number}'
+                        references.setdefault(asset_path, []).append(where)
+    return references
+
+
+def check_references(static_dir, template_dir, dist_dir):
+    """Raise MissingAsset listing every referenced asset that does not exist."""
+    available = set(source_files(static_dir, dist_dir))
+    missing = {path: where for path, where in template_references(template_dir).items()
+               if path not in available}
+    if missing:
+        raise MissingAsset('Templates reference missing assets: ' + '; '.join(
+            f"{path} (in {', '.join(where)})" for path, where in sorted(missing.items())
+        ))
+
+
+def _compress(data, dest):
+    """Write the .gz (and .br) variants of ``data`` next to ``dest``."""
+    with open(dest + '.gz', 'wb') as f:
+        # mtime=0 keeps rebuilds of the same file byte-identical
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(dest + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+
+
+def build_assets(static_dir, template_dir, dist_dir):
+    """Fingerprint and precompress every static file into ``dist_dir``.
+
+    Returns the manifest (``{source path: fingerprinted path}``). The
+    previous build is replaced, so stale files do not pile up; serve the
+    old build until the new one is deployed if pages may still link it.
+    """
+    check_references(static_dir, template_dir, dist_dir)
+    if os.path.isdir(dist_dir):
+        shutil.rmtree(dist_dir)
+    manifest = {}
+    for path in source_files(static_dir, dist_dir):
+        with open(os.path.join(static_dir, path), 'rb') as f:
+            data = f.read()
+        name = fingerprinted_name(path, hashlib.sha256(data).hexdigest())
+        dest = os.path.join(dist_dir, name)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with open(dest, 'wb') as f:
+            f.write(data)
+        if os.path.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+            _compress(data, dest)
+        manifest[path] = name
+    with open(os.path.join(dist_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(dist_dir):
+    """Return the manifest of a build, or None if nothing has been built."""
+    try:
+        with open(os.path.join(dist_dir, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def init_assets(app):
+    """Add the asset() template helper and the /assets route to an app."""
+    app.config.setdefault('ASSETS_DIST', os.path.join(app.static_folder, 'dist'))
+    app.config.setdefault('ASSETS_MAX_AGE', ASSET_MAX_AGE)
+    dist_dir = app.config['ASSETS_DIST']
+    manifest = load_manifest(dist_dir)
+    app.extensions['lms_assets'] = manifest
+
+    @app.template_global()
+    def asset(path):
+        """URL of a static asset: fingerprinted once built, else the plain one."""
+        if manifest is not None:
+            if path not in manifest:
+                raise MissingAsset(f'{path} is not in the asset manifest; '
+                                   "run 'flask lms build-assets'")
+            return url_for('assets', filename=manifest[path])
+        if not os.path.isfile(os.path.join(app.static_folder, path)):
+            raise MissingAsset(f'{path} does not exist in {app.static_folder}')
+        return url_for('static', filename=path)
+
+    @app.route('/assets/<path:filename>', endpoint='assets')
+    def serve_asset(filename):
+        """Serve a fingerprinted asset, precompressed if the client accepts it."""
+        if filename.endswith(('.gz', '.br')) or filename == MANIFEST_NAME:
+            abort(404)
+        encoding, served = None, filename
+        for suffix, name in ENCODINGS:
+            if request.accept_encodings[name] and os.path.isfile(
+                    os.path.join(dist_dir, filename + suffix)):
+                encoding, served = name, filename + suffix
+                break
+        # The type comes from the real name, not the .gz/.br one
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(dist_dir, served, mimetype=mimetype,
+                                       max_age=app.config['ASSETS_MAX_AGE'])
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
@@ -0,0 +1,106 @@
+"""Benchmark catalogue browsing during a burst of logins.
+
+Runs the app in-process against a freshly migrated database, with some
+threads logging in over and over while others browse /courses as a signed-in
+user. Prints browse throughput and latency next to login latency, once with
+password hashes computed inline on the request threads and once with the
+hashing process pool.
+
+Usage:
+    python benchmarks/login_storm.py [--seconds 5] [--logins 8] [--browsers 4]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def percentile(samples, fraction):
+    """Return the given percentile of a list of timings, in milliseconds."""
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000
+
+
+def login_loop(app, deadline, timings, busy):
+    """Log the admin in and out until the deadline."""
+    client = app.test_client()
+    while time.time() < deadline:
+        started = time.monotonic()
+        response = client.post('/login', data={'username': 'admin', 'password': 'password'})
+        if response.status_code == 503:
+            busy.append(1)
+        else:
+            timings.append(time.monotonic() - started)
+        client.get('/logout')
+
+
+def browse_loop(app, deadline, timings):
+    """Fetch the course list as a signed-in user until the deadline."""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = 'admin'
+    while time.time() < deadline:
+        started = time.monotonic()
+        client.get('/courses')
+        timings.append(time.monotonic() - started)
+
+
+def run_mode(db_path, workers, args):
+    """Run one timed round with the given number of hashing processes."""
+    from app import create_app
+
+    app = create_app({'DATABASE': db_path, 'HASH_WORKERS': workers, 'RATE_LIMIT': False})
+    login_timings, browse_timings, busy = [], [], []
+    deadline = time.time() + args.seconds
+    threads = [
+        threading.Thread(target=login_loop, args=(app, deadline, login_timings, busy))
+        for _ in range(args.logins)
+    ] + [
+        threading.Thread(target=browse_loop, args=(app, deadline, browse_timings))
+        for _ in range(args.browsers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    app.extensions['lms_hasher'].shutdown()
+    return login_timings, browse_timings, len(busy)
+
+
+def main():
+    """Parse arguments and print an inline vs pool table."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--logins', type=int, default=8)
+    parser.add_argument('--browsers', type=int, default=4)
+    parser.add_argument('--hash-workers', type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        from migrations import migrate
+        db_path = os.path.join(tmp, 'lms.db')
+        conn = sqlite3.connect(db_path)
+        migrate(conn, verbose=False)
+        conn.close()
+
+        print(f"{'hashing':<10}{'browse/s':>10}{'browse p95':>12}"
+              f"{'logins/s':>10}{'login p50':>11}{'login p95':>11}{'busy':>6}")
+        for label, workers in (('inline', 0), ('pool', args.hash_workers)):
+            logins, browses, busy = run_mode(db_path, workers, args)
+            print(f"{label:<10}{len(browses) / args.seconds:>10.0f}"
+                  f"{percentile(browses, 0.95):>10.1f}ms"
+                  f"{len(logins) / args.seconds:>10.1f}"
+                  f"{percentile(logins, 0.5):>9.1f}ms{percentile(logins, 0.95):>9.1f}ms"
+                  f"{busy:>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Benchmark buffered against streamed rendering of large pages.
+
+Builds a synthetic database with one heavy user (progress on --progress
+courses), then fetches a large /courses page (--page-size cards) and that
+user's /dashboard through the test client, once with STREAM_TEMPLATES off
+and once with it on. Each mode runs in a fresh process so its peak RSS is
+its own. Reported per page:
+
+- time to first byte and to the last byte (p50 over --requests)
+- peak Python allocation during one request (tracemalloc)
+- the process's peak RSS after the run
+
+Usage:
+    python benchmarks/streaming.py [--courses 5000] [--progress 3000]
+        [--page-size 1000] [--requests 50]
+"""
+import argparse
+import json
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import build_database  # noqa: E402
+
+HEAVY_USER = 'user0'
+PAGES = ('/courses', '/dashboard')
+
+
+def add_heavy_user(db_path, progress):
+    """Give HEAVY_USER enrollments and progress on the first ``progress`` courses."""
+    from progress import rebuild_progress_summary
+
+    conn = sqlite3.connect(db_path)
+    user_id = conn.execute('SELECT id FROM users WHERE username = ?', (HEAVY_USER,)).fetchone()[0]
+    course_ids = [row[0] for row in conn.execute('SELECT id FROM courses ORDER BY id LIMIT ?',
+                                                 (progress,))]
+    conn.execute('DELETE FROM enrollments WHERE user_id = ?', (user_id,))
+    conn.execute('DELETE FROM course_progress WHERE user_id = ?', (user_id,))
+    conn.executemany('INSERT INTO enrollments (user_id, course_id) VALUES (?, ?)',
+                     [(user_id, course_id) for course_id in course_ids])
+    conn.executemany('INSERT INTO course_progress (user_id, course_id, completed) VALUES (?, ?, ?)',
+                     [(user_id, course_id, index % 2) for index, course_id in enumerate(course_ids)])
+    rebuild_progress_summary(conn)
+    conn.commit()
+    conn.close()
+
+
+def fetch(client, path):
+    """GET a page unbuffered; return (seconds to first byte, seconds to last, bytes)."""
+    started = time.perf_counter()
+    response = client.get(path, buffered=False)
+    first = None
+    size = 0
+    for chunk in response.response:
+        if first is None and chunk:
+            first = time.perf_counter() - started
+        size += len(chunk)
+    response.close()
+    return first, time.perf_counter() - started, size
+
+
+def run_mode(db_path, stream, args):
+    """Measure every page in this process; return the results as a dict."""
+    from app import create_app
+
+    app = create_app({'DATABASE': db_path, 'STREAM_TEMPLATES': stream,
+                      'COURSES_PAGE_SIZE': args.page_size})
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = HEAVY_USER
+    results = {}
+    for path in PAGES:
+        for _ in range(3):
+            fetch(client, path)  # Warm the templates and the page cache of SQLite
+        firsts, totals = [], []
+        for _ in range(args.requests):
+            first, total, size = fetch(client, path)
+            firsts.append(first)
+            totals.append(total)
+        tracemalloc.start()
+        fetch(client, path)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[path] = {
+            'ttfb_ms': sorted(firsts)[len(firsts) // 2] * 1000,
+            'total_ms': sorted(totals)[len(totals) // 2] * 1000,
+            'alloc_peak_kib': peak / 1024,
+            'bytes': size,
+        }
+    # ru_maxrss is in KiB on Linux
+    results['max_rss_mib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return results
+
+
+def main():
+    """Parse arguments, run both modes in child processes and print a table."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--courses', type=int, default=5000)
+    parser.add_argument('--progress', type=int, default=3000)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--db', help=argparse.SUPPRESS)  # Child process: database to use
+    parser.add_argument('--stream', type=int, help=argparse.SUPPRESS)  # Child process: mode
+    args = parser.parse_args()
+
+    if args.db:
+        print(json.dumps(run_mode(args.db, bool(args.stream), args)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        build_database(db_path, courses=args.courses, users=100, enrollments=5)
+        add_heavy_user(db_path, min(args.progress, args.courses))
+
+        print(f"{'mode':<10}{'page':<12}{'ttfb p50':>10}{'total p50':>11}"
+              f"{'alloc peak':>12}{'max rss':>10}{'size':>10}")
+        for label, stream in (('buffered', 0), ('streamed', 1)):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--db', db_path,
+                 '--stream', str(stream), '--page-size', str(args.page_size),
+                 '--requests', str(args.requests)],
+                check=True, capture_output=True, text=True, cwd=ROOT,
+            ).stdout
+            results = json.loads(output.splitlines()[-1])
+            for path in PAGES:
+                page = results[path]
+                print(f"{label:<10}{path:<12}{page['ttfb_ms']:>8.1f}ms{page['total_ms']:>9.1f}ms"
+                      f"{page['alloc_peak_kib']:>9.0f}KiB{results['max_rss_mib']:>7.0f}MiB"
+                      f"{page['bytes'] / 1024:>7.0f}KiB")
+
+
+if __name__ == '__main__':
+    main()
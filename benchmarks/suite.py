@@ -0,0 +1,366 @@
+"""Benchmark every main route against a synthetic database.
+
+Builds a database with benchmarks/synthetic.py, then drives each scenario
+below through Flask's test client (one thread, no network) and/or through
+a real pre-forked WSGI server (several worker processes sharing one
+listening socket, many client threads). For each scenario it reports
+throughput, p50/p95/p99 latency and SQL queries per request, the last
+read from the Server-Timing header (see metrics.py).
+
+Use --json to save the results and --compare to diff two runs, e.g. before
+and after a change:
+
+    python benchmarks/suite.py --json before.json
+    git checkout my-branch
+    python benchmarks/suite.py --json after.json --compare before.json
+
+Usage:
+    python benchmarks/suite.py [--mode client|server|both] [--requests 300]
+        [--workers 2] [--concurrency 8] [--courses 2000] [--users 5000]
+        [--json results.json] [--compare baseline.json]
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import CATEGORIES, PASSWORD, WORDS, build_database  # noqa: E402
+
+# ``make_request(rng, ctx)`` returns (path, form data or None). ``share`` scales
+# the request count (logins are slow on purpose, so they get fewer).
+Scenario = namedtuple('Scenario', ['name', 'method', 'make_request', 'login', 'share'])
+
+SCENARIOS = [
+    Scenario('courses', 'GET', lambda rng, ctx: ('/courses', None), True, 1),
+    Scenario('courses_anonymous', 'GET', lambda rng, ctx: ('/courses', None), False, 1),
+    Scenario('courses_category', 'GET',
+             lambda rng, ctx: ('/courses?' + urlencode({'category': rng.choice(CATEGORIES)}), None),
+             True, 1),
+    Scenario('courses_search', 'GET',
+             lambda rng, ctx: ('/courses?' + urlencode({'search': rng.choice(WORDS)}), None),
+             True, 1),
+    Scenario('course_detail', 'GET',
+             lambda rng, ctx: (f'/course/{rng.choice(ctx["course_ids"])}', None), True, 1),
+    Scenario('dashboard', 'GET', lambda rng, ctx: ('/dashboard', None), True, 1),
+    Scenario('enroll', 'POST',
+             lambda rng, ctx: (f'/enroll/{rng.choice(ctx["course_ids"])}', {}), True, 1),
+    Scenario('toggle_complete', 'POST',
+             lambda rng, ctx: (f'/toggle-complete/{rng.choice(ctx["course_ids"])}', {}), True, 1),
+    Scenario('login', 'POST',
+             lambda rng, ctx: ('/login', {'username': f'user{rng.randrange(ctx["users"])}',
+                                          'password': PASSWORD}), False, 0.1),
+]
+
+QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+def queries_from_header(server_timing):
+    """Read the query count from a Server-Timing header, or None."""
+    match = QUERIES_RE.search(server_timing or '')
+    return int(match.group(1)) if match else None
+
+
+def summarize(latencies, queries, errors, seconds):
+    """Turn raw timings into the reported numbers."""
+    latencies = sorted(latencies)
+
+    def percentile(fraction):
+        if not latencies:
+            return 0.0
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000, 2)
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / seconds, 1) if seconds else 0.0,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def load_context(db_path, counts):
+    """Collect the ids the scenarios pick from."""
+    import sqlite3
+    conn = sqlite3.connect(db_path)
+    course_ids = [row[0] for row in conn.execute('SELECT id FROM courses')]
+    conn.close()
+    return {'course_ids': course_ids, 'users': counts['users']}
+
+
+# --- test client --------------------------------------------------------------
+
+def run_client(app, ctx, args):
+    """Run every scenario through the test client, one request at a time."""
+    results = {}
+    for scenario in SCENARIOS:
+        rng = random.Random(args.seed)
+        client = app.test_client()
+        if scenario.login:
+            with client.session_transaction() as session:
+                session['username'] = f'user{rng.randrange(ctx["users"])}'
+        for _ in range(args.warmup):
+            path, data = scenario.make_request(rng, ctx)
+            client.open(path, method=scenario.method, data=data)
+        latencies, queries, errors = [], [], 0
+        count = max(1, int(args.requests * scenario.share))
+        started = time.perf_counter()
+        for _ in range(count):
+            path, data = scenario.make_request(rng, ctx)
+            request_started = time.perf_counter()
+            if scenario.method == 'GET':
+                response = client.get(path)
+            else:
+                response = client.post(path, data=data)
+            latencies.append(time.perf_counter() - request_started)
+            errors += response.status_code >= 400
+            query_count = queries_from_header(response.headers.get('Server-Timing'))
+            if query_count is not None:
+                queries.append(query_count)
+        results[scenario.name] = summarize(latencies, queries, errors,
+                                           time.perf_counter() - started)
+    return results
+
+
+# --- WSGI server --------------------------------------------------------------
+
+def serve(port, workers, db_path):
+    """Pre-fork ``workers`` threaded WSGI servers on one listening socket."""
+    from werkzeug.serving import make_server
+    from app import create_app, warm_app
+
+    # Built and warmed once, before forking, like gunicorn --preload
+    # Every simulated login comes from this host, so no rate limit
+    app = warm_app(create_app({'DATABASE': db_path, 'METRICS_SERVER_TIMING': True,
+                               'RATE_LIMIT': False}))
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # No access log
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', port))
+    listener.listen(256)
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            # Exit normally on SIGTERM, so the hashing pool's processes are stopped too
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            server = make_server('127.0.0.1', port, app, threaded=True, fd=listener.fileno())
+            server.serve_forever()
+        children.append(pid)
+
+    def stop(signum, frame):
+        for child in children:
+            os.kill(child, signal.SIGTERM)
+        for child in children:
+            os.waitpid(child, 0)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    while True:
+        signal.pause()
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def wait_for_server(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('Benchmark server did not start')
+
+
+class HttpClient:
+    """A keep-alive HTTP client with one session cookie."""
+
+    def __init__(self, port):
+        self.port = port
+        self.cookie = None
+        self.conn = None
+
+    def request(self, method, path, data=None):
+        body = urlencode(data) if data is not None else None
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'} if body is not None else {}
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None  # Server closed the keep-alive connection; reconnect
+                if attempt:
+                    raise
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie:
+            self.cookie = set_cookie.split(';', 1)[0]
+        if response.getheader('Connection', '').lower() == 'close':
+            self.conn.close()
+            self.conn = None
+        return response
+
+
+def run_server(ctx, args, db_path):
+    """Run every scenario against a pre-forked server with many client threads."""
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', str(port),
+         '--workers', str(args.workers), '--db', db_path],
+    )
+    try:
+        wait_for_server(port)
+        results = {}
+        for scenario in SCENARIOS:
+            count = max(args.concurrency, int(args.requests * scenario.share))
+            per_thread = count // args.concurrency
+            latencies, queries, errors = [], [], [0]
+            lock = threading.Lock()
+
+            def worker(index):
+                rng = random.Random(args.seed + index)
+                client = HttpClient(port)
+                if scenario.login:
+                    client.request('POST', '/login', {
+                        'username': f'user{rng.randrange(ctx["users"])}', 'password': PASSWORD,
+                    })
+                for _ in range(max(1, args.warmup // args.concurrency)):
+                    client.request(scenario.method, *scenario.make_request(rng, ctx))
+                ready.wait()  # Everyone logged in and warmed up
+                ready.wait()  # Clock started
+                for _ in range(per_thread):
+                    path, data = scenario.make_request(rng, ctx)
+                    request_started = time.perf_counter()
+                    response = client.request(scenario.method, path, data)
+                    elapsed = time.perf_counter() - request_started
+                    query_count = queries_from_header(response.getheader('Server-Timing'))
+                    with lock:
+                        latencies.append(elapsed)
+                        errors[0] += response.status >= 400
+                        if query_count is not None:
+                            queries.append(query_count)
+
+            ready = threading.Barrier(args.concurrency + 1)
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+            for thread in threads:
+                thread.start()
+            ready.wait()
+            started = time.perf_counter()
+            ready.wait()
+            for thread in threads:
+                thread.join()
+            results[scenario.name] = summarize(latencies, queries, errors[0],
+                                               time.perf_counter() - started)
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+
+# --- reporting ----------------------------------------------------------------
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(mode, results, baseline=None):
+    print(f"\n[{mode}]")
+    print(f"{'scenario':<20}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'queries':>9}{'errors':>8}" + (f"{'p95 vs base':>13}" if baseline else ''))
+    for name, row in results.items():
+        line = (f"{name:<20}{row['throughput_rps']:>9.1f}{row['p50_ms']:>9.2f}"
+                f"{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}"
+                f"{row['queries_per_request'] if row['queries_per_request'] is not None else '-':>9}"
+                f"{row['errors']:>8}")
+        base = (baseline or {}).get(name)
+        if base and base['p95_ms']:
+            line += f"{(row['p95_ms'] / base['p95_ms'] - 1) * 100:>+12.0f}%"
+        print(line)
+
+
+def main():
+    """Parse arguments, build the database and run the chosen modes."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=('client', 'server', 'both'), default='both')
+    parser.add_argument('--requests', type=int, default=300, help='requests per scenario')
+    parser.add_argument('--workers', type=int, default=2, help='server worker processes')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads (server mode)')
+    parser.add_argument('--courses', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--enrollments', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--warmup', type=int, default=10, help='untimed requests per scenario')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='show p95 changes against an earlier --json file')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.workers, args.db)
+        return
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'lms.db')
+        counts = build_database(db_path, args.courses, args.users, args.enrollments,
+                                seed=args.seed)
+        ctx = load_context(db_path, counts)
+        report = {'commit': git_commit(), 'scale': counts, 'results': {}}
+
+        if args.mode in ('client', 'both'):
+            from app import create_app
+            app = create_app({'DATABASE': db_path, 'METRICS_SERVER_TIMING': True,
+                              'RATE_LIMIT': False})
+            report['results']['client'] = run_client(app, ctx, args)
+            app.extensions['lms_hasher'].shutdown()
+        if args.mode in ('server', 'both'):
+            report['results']['server'] = run_server(ctx, args, db_path)
+
+    for mode, results in report['results'].items():
+        print_table(mode, results, (baseline or {}).get(mode))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✅ Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
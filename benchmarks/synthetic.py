@@ -0,0 +1,120 @@
+"""Generate a synthetic LMS database at a chosen scale.
+
+The schema comes from migrations.py, so the database matches what the app
+runs against. Rows are generated from a seeded random generator, so the
+same arguments always produce the same data. Every synthetic user's
+password is ``password``.
+
+Usage:
+    python benchmarks/synthetic.py bench.db [--courses 2000] [--users 5000]
+        [--enrollments 10] [--completion 0.3] [--seed 1]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+from migrations import migrate  # noqa: E402
+from progress import rebuild_progress_summary  # noqa: E402
+from related import rebuild_related_courses  # noqa: E402
+
+PASSWORD = 'password'
+CATEGORIES = ['Photography', 'Video Production', 'Design', 'Robotics',
+              'Machine Learning', 'Programming', 'Business', 'General']
+WORDS = ('learn master basics advanced practical guide design camera lighting '
+         'editing python data models robots sensors budget marketing layout colour '
+         'composition workflow projects tools theory').split()
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def build_database(path, courses=2000, users=5000, enrollments=10, completion=0.3, seed=1):
+    """Create ``path`` with the given numbers of rows and return the counts.
+
+    ``enrollments`` is the average number of courses per user; about
+    ``completion`` of each user's enrollments get a completed progress row
+    and as many again an in-progress one.
+    """
+    for stale in (path, path + '-wal', path + '-shm'):
+        if os.path.exists(stale):
+            os.remove(stale)
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    migrate(conn, verbose=False)  # Leaves the connection in autocommit mode
+
+    conn.execute('BEGIN')
+    conn.executemany(
+        'INSERT INTO courses (title, description, video_url, embed_url, category) '
+        'VALUES (?, ?, ?, ?, ?)',
+        ((f'{_text(rng, 3).title()} {i}', _text(rng, 40),
+          f'https://youtu.be/vid{i}', f'https://www.youtube.com/embed/vid{i}',
+          rng.choice(CATEGORIES))
+         for i in range(courses))
+    )
+    password_hash = generate_password_hash(PASSWORD)  # One hash, shared by every user
+    conn.executemany(
+        'INSERT INTO users (username, password_hash) VALUES (?, ?)',
+        ((f'user{i}', password_hash) for i in range(users))
+    )
+    course_ids = [row[0] for row in conn.execute('SELECT id FROM courses')]
+    user_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE username LIKE 'user%'")]
+
+    enrollment_rows, progress_rows = [], []
+    for user_id in user_ids:
+        count = min(len(course_ids), max(0, int(rng.gauss(enrollments, enrollments / 3))))
+        for course_id in rng.sample(course_ids, count):
+            day = rng.randrange(1, 365)
+            enrollment_rows.append((user_id, course_id, day))
+            roll = rng.random()
+            if roll < completion:
+                progress_rows.append((user_id, course_id, 1, day + rng.randrange(1, 60)))
+            elif roll < 2 * completion:
+                progress_rows.append((user_id, course_id, 0, day))
+    conn.executemany(
+        "INSERT INTO enrollments (user_id, course_id, enrolled_at) "
+        "VALUES (?, ?, datetime('2025-01-01', ? || ' days'))",
+        enrollment_rows
+    )
+    conn.executemany(
+        "INSERT INTO course_progress (user_id, course_id, completed, completed_at) "
+        "VALUES (?, ?, ?, datetime('2025-01-01', ? || ' days'))",
+        progress_rows
+    )
+    rebuild_progress_summary(conn)
+    rebuild_related_courses(conn)
+    conn.execute('COMMIT')
+    conn.execute('ANALYZE')
+    conn.close()
+    return {
+        'courses': courses, 'users': users, 'enrollments': len(enrollment_rows),
+        'progress': len(progress_rows), 'seed': seed,
+    }
+
+
+def main():
+    """Parse arguments and build the database."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path')
+    parser.add_argument('--courses', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--enrollments', type=int, default=10, help='average courses per user')
+    parser.add_argument('--completion', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    started = time.time()
+    counts = build_database(args.path, args.courses, args.users, args.enrollments,
+                            args.completion, args.seed)
+    print(f"✅ Built {args.path} in {time.time() - started:.1f}s: "
+          + ', '.join(f'{value} {name}' for name, value in counts.items() if name != 'seed'))
+
+
+if __name__ == '__main__':
+    main()
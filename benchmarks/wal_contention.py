@@ -0,0 +1,147 @@
+"""Benchmark catalogue reads during concurrent enrollment bursts.
+
+Runs the same workload against each database profile (rollback journal vs
+WAL) and prints read throughput and lock errors for readers, plus write
+throughput for the enrolling workers.
+
+Usage:
+    python benchmarks/wal_contention.py [--seconds 5] [--readers 4] [--writers 4]
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import (  # noqa: E402
+    DEFAULT_WRITE_BACKOFF, DEFAULT_WRITE_RETRIES, apply_startup_pragmas,
+    connection_pragmas, resolve_profile, write_with_retry,
+)
+
+
+def build_database(path, course_count, user_count):
+    """Create a small LMS schema with synthetic courses and users."""
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE courses (id INTEGER PRIMARY KEY, title TEXT NOT NULL,
+            description TEXT NOT NULL, video_url TEXT, category TEXT DEFAULT 'General');
+        CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL, is_admin INTEGER DEFAULT 0);
+        CREATE TABLE enrollments (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
+            course_id INTEGER NOT NULL, enrolled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, course_id));
+    ''')
+    conn.executemany(
+        'INSERT INTO courses (title, description, category) VALUES (?, ?, ?)',
+        ((f'Course {i}', f'Description of course {i} ' * 10, f'Category {i % 7}')
+         for i in range(course_count))
+    )
+    conn.executemany(
+        'INSERT INTO users (username, password_hash) VALUES (?, ?)',
+        ((f'user{i}', 'x') for i in range(user_count))
+    )
+    conn.commit()
+    conn.close()
+
+
+def connect(path, pragmas):
+    """Open a connection the way the app's pool does."""
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    for pragma in pragmas:
+        conn.execute(f'PRAGMA {pragma}')
+    return conn
+
+
+def reader(path, pragmas, deadline, results):
+    """Repeat the /courses and /dashboard read queries until the deadline."""
+    conn = connect(path, pragmas)
+    reads = errors = 0
+    while time.time() < deadline:
+        try:
+            conn.execute('SELECT * FROM courses WHERE category = ?', ('Category 3',)).fetchall()
+            conn.execute('SELECT COUNT(*) FROM enrollments WHERE user_id = ?', (reads % 50 + 1,)).fetchone()
+            reads += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    conn.close()
+    results.put(('read', reads, errors))
+
+
+def writer(path, pragmas, deadline, user_count, course_count, seed, results):
+    """Enroll users in courses in bursts, one transaction per enrollment."""
+    conn = connect(path, pragmas)
+    writes = errors = 0
+    i = seed
+    while time.time() < deadline:
+        user_id, course_id = i % user_count + 1, (i * 7) % course_count + 1
+        i += 13
+        try:
+            write_with_retry(conn, lambda c: c.execute(
+                'INSERT OR IGNORE INTO enrollments (user_id, course_id) VALUES (?, ?)',
+                (user_id, course_id)
+            ), retries=DEFAULT_WRITE_RETRIES, backoff=DEFAULT_WRITE_BACKOFF)
+            writes += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    conn.close()
+    results.put(('write', writes, errors))
+
+
+def run_profile(profile, args):
+    """Run one timed contention round and return the summed counters."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        build_database(path, args.courses, args.users)
+        settings = resolve_profile(profile)
+        apply_startup_pragmas(path, settings)
+        pragmas = connection_pragmas(settings)
+
+        results = multiprocessing.Queue()
+        deadline = time.time() + args.seconds
+        workers = [
+            multiprocessing.Process(target=reader, args=(path, pragmas, deadline, results))
+            for _ in range(args.readers)
+        ] + [
+            multiprocessing.Process(
+                target=writer,
+                args=(path, pragmas, deadline, args.users, args.courses, seed, results)
+            )
+            for seed in range(args.writers)
+        ]
+        for worker in workers:
+            worker.start()
+        totals = {'read': [0, 0], 'write': [0, 0]}
+        for _ in workers:
+            kind, ok, failed = results.get()
+            totals[kind][0] += ok
+            totals[kind][1] += failed
+        for worker in workers:
+            worker.join()
+        return totals
+
+
+def main():
+    """Parse arguments and print a before/after table."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--courses', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'profile':<10}{'reads/s':>12}{'read errors':>14}{'writes/s':>12}{'write errors':>14}")
+    for profile in ('default', 'wal'):
+        totals = run_profile(profile, args)
+        print(f"{profile:<10}"
+              f"{totals['read'][0] / args.seconds:>12.0f}{totals['read'][1]:>14}"
+              f"{totals['write'][0] / args.seconds:>12.0f}{totals['write'][1]:>14}")
+
+
+if __name__ == '__main__':
+    main()
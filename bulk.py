@@ -0,0 +1,327 @@
+"""Bulk import and export of courses and enrollments.
+
+Rows stream from CSV or JSONL files through generators and are written in
+large batches with ``executemany``, one write transaction per batch, so
+memory stays flat however big the file is. For big loads the secondary
+indexes and the triggers on the target table (full-text search sync,
+catalogue counters, course statistics) are dropped first and rebuilt once
+at the end, which is much faster than updating them row by row.
+
+The dropped SQL is saved in ``pending_schema_restores`` in the same
+transaction as the drop, and deleted in the one that recreates it. If the
+import process dies in between (SIGKILL, out of memory, power loss) the
+rows stay behind, and ``python migrations.py`` or the next import of any
+kind recreates the indexes and triggers and rebuilds what they maintain.
+Re-run the interrupted import afterwards; rows it already wrote are
+updated or skipped, and the dashboard counters are recounted.
+
+The commands are registered on the ``flask lms`` group (see commands.py).
+"""
+
+import csv
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+from itertools import islice
+from catalogue import rebuild_category_counts
+from database import run_write
+from changes import record_change
+from progress import rebuild_progress_summary
+from related import rebuild_related_courses
+from reports import rebuild_course_stats
+from video import get_embed_url
+
+DEFAULT_BATCH_SIZE = 5000
+# Files at least this big drop and rebuild indexes and triggers around the load
+DEFAULT_REBUILD_THRESHOLD = 8 * 1024 * 1024  # Bytes
+
+FORMATS = ('csv', 'jsonl')
+
+COURSE_FIELDS = ['id', 'title', 'description', 'video_url', 'category']
+ENROLLMENT_FIELDS = ['user_id', 'username', 'course_id', 'enrolled_at']
+
+ImportResult = namedtuple('ImportResult', ['read', 'written', 'skipped', 'seconds'])
+
+# Courses with an id are upserted, so re-running an import updates them
+_COURSE_SQL = '''
+    INSERT INTO courses (id, title, description, video_url, embed_url, category)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        title = excluded.title,
+        description = excluded.description,
+        video_url = excluded.video_url,
+        embed_url = excluded.embed_url,
+        category = excluded.category
+'''
+
+# Enrollments name their user by id or username; unknown users and
+# courses, and enrollments that already exist, are skipped
+_ENROLLMENT_SQL = '''
+    INSERT OR IGNORE INTO enrollments (user_id, course_id, enrolled_at)
+    SELECT u.id, c.id, COALESCE(?, CURRENT_TIMESTAMP)
+    FROM users u, courses c
+    WHERE (u.id = ? OR u.username = ?) AND c.id = ?
+'''
+
+
+def detect_format(path, file_format=None):
+    """Pick the file format from the option, or from the file extension."""
+    if file_format:
+        return file_format
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension in ('jsonl', 'ndjson', 'json'):
+        return 'jsonl'
+    return 'csv'
+
+
+def read_rows(stream, file_format):
+    """Yield one dict per CSV row or JSONL line, skipping blank lines."""
+    if file_format == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def write_rows(stream, rows, fields, file_format):
+    """Write dict-like rows as CSV (with a header) or JSONL. Returns the count."""
+    count = 0
+    if file_format == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(fields)
+        for row in rows:
+            writer.writerow([row[field] for field in fields])
+            count += 1
+    else:
+        for row in rows:
+            stream.write(json.dumps({field: row[field] for field in fields}) + '\n')
+            count += 1
+    return count
+
+
+def batches(rows, size):
+    """Group an iterable into lists of at most ``size`` items."""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _blank_to_none(value):
+    """CSV has no NULL; treat empty cells as missing."""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    return value
+
+
+def course_params(row):
+    """Turn one input row into parameters for ``_COURSE_SQL``."""
+    title = _blank_to_none(row.get('title'))
+    if title is None:
+        return None  # title is required
+    video_url = _blank_to_none(row.get('video_url'))
+    return (
+        _blank_to_none(row.get('id')),
+        title.strip(),
+        (row.get('description') or '').strip(),
+        video_url,
+        get_embed_url(video_url),
+        _blank_to_none(row.get('category')) or 'General',
+    )
+
+
+def enrollment_params(row):
+    """Turn one input row into parameters for ``_ENROLLMENT_SQL``."""
+    user_id = _blank_to_none(row.get('user_id'))
+    username = _blank_to_none(row.get('username'))
+    course_id = _blank_to_none(row.get('course_id'))
+    if course_id is None or (user_id is None and username is None):
+        return None
+    return (_blank_to_none(row.get('enrolled_at')), user_id, username, course_id)
+
+
+def secondary_schema(conn, table):
+    """Return ``[(type, name, sql), ...]`` for a table's droppable indexes and triggers.
+
+    Indexes that back a UNIQUE or PRIMARY KEY constraint have no SQL and
+    are never dropped; the imports rely on them to skip duplicates.
+    """
+    return conn.execute('''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL
+        ORDER BY type, name
+    ''', (table,)).fetchall()
+
+
+def drop_secondary_schema(conn, table):
+    """Drop a table's indexes and triggers, saving their SQL for the restore.
+
+    Returns what was dropped, as ``secondary_schema`` does.
+    """
+    schema = secondary_schema(conn, table)
+    conn.executemany('INSERT OR REPLACE INTO pending_schema_restores (type, name, sql) '
+                     'VALUES (?, ?, ?)', schema)
+    for kind, name, _ in schema:
+        conn.execute(f'DROP {kind.upper()} IF EXISTS "{name}"')
+    return schema
+
+
+def restore_secondary_schema(conn, schema):
+    """Recreate dropped indexes and triggers, and rebuild what they maintained."""
+    for _, name, sql in schema:
+        exists = conn.execute('SELECT 1 FROM sqlite_master WHERE name = ?', (name,)).fetchone()
+        if not exists:
+            conn.execute(sql)
+        conn.execute('DELETE FROM pending_schema_restores WHERE name = ?', (name,))
+    names = {name for _, name, _ in schema}
+    if 'courses_fts_insert' in names:
+        conn.execute("INSERT INTO courses_fts (courses_fts) VALUES ('rebuild')")
+    if 'catalogue_stats_insert' in names:
+        conn.execute('UPDATE catalogue_stats SET course_count = (SELECT COUNT(*) FROM courses) '
+                     'WHERE id = 1')
+    if 'category_counts_insert' in names:
+        rebuild_category_counts(conn)
+    if 'course_stats_enroll' in names:
+        rebuild_course_stats(conn)
+
+
+def restore_pending_schema(conn):
+    """Restore whatever an interrupted bulk load left dropped. Returns the count."""
+    schema = conn.execute('SELECT type, name, sql FROM pending_schema_restores '
+                          'ORDER BY type, name').fetchall()
+    if schema:
+        restore_secondary_schema(conn, schema)
+    return len(schema)
+
+
+def bulk_load(table, sql, param_rows, batch_size=DEFAULT_BATCH_SIZE,
+              rebuild=False, progress=None):
+    """Write parameter tuples with ``sql`` in batches, one transaction each.
+
+    ``param_rows`` may contain None for rows that failed validation; those
+    are counted as skipped. With ``rebuild`` the table's secondary indexes
+    and triggers are dropped for the load and recreated afterwards, even if
+    the load fails (and by the next load or migration if the process dies;
+    see the module docstring). ``progress(read, written)`` is called after
+    each batch.
+    """
+    started = time.monotonic()
+    read = written = skipped = 0
+    run_write(restore_pending_schema)
+    schema = run_write(lambda c: drop_secondary_schema(c, table)) if rebuild else []
+    try:
+        for batch in batches(param_rows, batch_size):
+            read += len(batch)
+            valid = [params for params in batch if params is not None]
+            skipped += len(batch) - len(valid)
+            # rowcount sums the rows each statement changed, not trigger work
+            changed = run_write(lambda c, valid=valid: c.executemany(sql, valid).rowcount)
+            written += changed
+            skipped += len(valid) - changed
+            if progress:
+                progress(read, written)
+    finally:
+        if schema:
+            run_write(lambda c: restore_secondary_schema(c, schema))
+    return ImportResult(read, written, skipped, time.monotonic() - started)
+
+
+def should_rebuild(path, threshold=DEFAULT_REBUILD_THRESHOLD):
+    """Decide whether a file is big enough to drop indexes around its load."""
+    if path == '-':
+        return False  # Unknown size; stdin loads keep their indexes
+    return os.path.getsize(path) >= threshold
+
+
+def _open_input(path):
+    if path == '-':
+        return sys.stdin
+    return open(path, newline='', encoding='utf-8')
+
+
+def _open_output(path):
+    if path == '-':
+        return sys.stdout
+    return open(path, 'w', newline='', encoding='utf-8')
+
+
+def import_courses(path, file_format=None, batch_size=DEFAULT_BATCH_SIZE,
+                   rebuild=None, progress=None):
+    """Import courses from a CSV or JSONL file (``-`` for stdin).
+
+    Rows need a title; id, description, video_url and category are
+    optional. Rows whose id already exists update that course. Related
+    course lists are recomputed afterwards.
+    """
+    if rebuild is None:
+        rebuild = should_rebuild(path)
+    stream = _open_input(path)
+    try:
+        rows = read_rows(stream, detect_format(path, file_format))
+        result = bulk_load('courses', _COURSE_SQL, (course_params(row) for row in rows),
+                           batch_size=batch_size, rebuild=rebuild, progress=progress)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    if result.written:
+        run_write(rebuild_related_courses)
+        run_write(lambda c: record_change(c, 'courses'))
+    return result
+
+
+def import_enrollments(path, file_format=None, batch_size=DEFAULT_BATCH_SIZE,
+                       rebuild=None, progress=None, related=True):
+    """Import enrollments from a CSV or JSONL file (``-`` for stdin).
+
+    Rows need a course_id and a user_id or username; enrolled_at is
+    optional. The dashboard counters are recomputed afterwards, and the
+    related course lists too unless ``related`` is False (then run
+    ``python related.py`` later).
+    """
+    if rebuild is None:
+        rebuild = should_rebuild(path)
+    stream = _open_input(path)
+    try:
+        rows = read_rows(stream, detect_format(path, file_format))
+        result = bulk_load('enrollments', _ENROLLMENT_SQL,
+                           (enrollment_params(row) for row in rows),
+                           batch_size=batch_size, rebuild=rebuild, progress=progress)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    if result.written:
+        run_write(rebuild_progress_summary)
+        if related:
+            run_write(rebuild_related_courses)
+        run_write(lambda c: record_change(c, 'progress', 'courses'))
+    return result
+
+
+def export_table(conn, kind, path, file_format=None):
+    """Stream every course or enrollment to a CSV or JSONL file (``-`` for stdout).
+
+    Returns the number of rows written.
+    """
+    if kind == 'courses':
+        fields = COURSE_FIELDS
+        rows = conn.execute(
+            'SELECT id, title, description, video_url, category FROM courses ORDER BY id'
+        )
+    else:
+        fields = ENROLLMENT_FIELDS
+        rows = conn.execute('''
+            SELECT e.user_id, u.username, e.course_id, e.enrolled_at
+            FROM enrollments e JOIN users u ON u.id = e.user_id
+            ORDER BY e.id
+        ''')
+    stream = _open_output(path)
+    try:
+        return write_rows(stream, rows, fields, detect_format(path, file_format))
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
@@ -0,0 +1,166 @@
+"""Small in-process caches shared by the helpers and routes."""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, g, make_response, request, session
+from changes import get_changes
+from database import get_db
+
+_MISSING = object()
+
+
+class TTLCache:
+    """A thread-safe LRU cache whose entries expire after ``ttl`` seconds.
+
+    A ``max_size`` or ``ttl`` of 0 disables the cache: ``get`` always misses
+    and ``set`` stores nothing.
+    """
+
+    def __init__(self, max_size=1024, ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """Whether the cache stores anything at all."""
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, key, default=None):
+        """Return a fresh cached value, or ``default``."""
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entry if full."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        """Drop one entry, if present."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        """Return the cache counters as a dict."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+            }
+
+
+def make_cache(app, prefix):
+    """Build the cache configured by ``<prefix>_SIZE``, ``_TTL`` and ``_BACKEND``.
+
+    ``<prefix>_BACKEND`` is a callable taking ``(max_size, ttl)`` and
+    returning an object with TTLCache's get/set/pop/clear/stats methods,
+    e.g. a client for a cache shared between workers. TTLCache by default.
+    """
+    backend = app.config.get(f'{prefix}_BACKEND') or TTLCache
+    return backend(max_size=app.config[f'{prefix}_SIZE'], ttl=app.config[f'{prefix}_TTL'])
+
+
+DEFAULT_PAGE_CACHE_SIZE = 512
+DEFAULT_PAGE_CACHE_TTL = 60  # Seconds
+
+# A rendered page, with the validators sent for conditional requests
+CachedPage = namedtuple('CachedPage', ['body', 'content_type', 'etag', 'last_modified'])
+
+
+def init_page_cache(app):
+    """Create the full-page cache for anonymous visitors."""
+    app.config.setdefault('PAGE_CACHE_SIZE', DEFAULT_PAGE_CACHE_SIZE)
+    app.config.setdefault('PAGE_CACHE_TTL', DEFAULT_PAGE_CACHE_TTL)
+    app.extensions['lms_page_cache'] = make_cache(app, 'PAGE_CACHE')
+
+
+def clear_page_cache():
+    """Drop every cached page of this worker, to free the memory at once.
+
+    Not needed for correctness: pages are keyed by the catalogue's change
+    counter, so every worker stops serving old copies within
+    API_CHANGE_INTERVAL of any write that calls ``record_change``.
+    """
+    current_app.extensions['lms_page_cache'].clear()
+
+
+def _page_cache_key(role):
+    """Key a page by path, query arguments, the visitor's role and the catalogue version.
+
+    The version comes from the in-memory change counters (see changes.py),
+    so a catalogue change by any worker or by ``flask lms import`` makes
+    the old pages unreachable; they age out of the LRU.
+    """
+    args = tuple(sorted(request.args.items(multi=True)))
+    return (request.path, args, role, get_changes().version('courses', get_db))
+
+
+def cached_page(view):
+    """Serve a view's HTML from the page cache for logged-out visitors.
+
+    Logged-in users see their name and role in every page, so their
+    requests always go to the view. Cached responses carry an ETag and
+    Last-Modified, so browsers and proxies can revalidate with a 304.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if 'username' in session:
+            return view(*args, **kwargs)
+
+        page_cache = current_app.extensions['lms_page_cache']
+        key = _page_cache_key('anonymous')
+        page = page_cache.get(key)
+        if page is None:
+            g.filling_page_cache = True  # Render whole; see helpers.render_page
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            body = response.get_data()
+            page = CachedPage(
+                body,
+                response.content_type,
+                hashlib.sha1(body).hexdigest(),
+                datetime.now(timezone.utc).replace(microsecond=0),
+            )
+            page_cache.set(key, page)
+
+        response = current_app.response_class(page.body, content_type=page.content_type)
+        response.set_etag(page.etag)
+        response.last_modified = page.last_modified
+        response.cache_control.public = True
+        response.cache_control.no_cache = True  # Always revalidate; a 304 is cheap
+        return response.make_conditional(request)
+    return wrapper
@@ -0,0 +1,157 @@
+"""Course catalogue queries: lean card columns, keyset pagination and category facets."""
+
+import base64
+import binascii
+import json
+from collections import namedtuple
+
+DEFAULT_PAGE_SIZE = 20
+DESCRIPTION_PREVIEW_LENGTH = 200
+
+# Only what a course card renders, with the description cut to a preview
+COURSE_CARD_COLUMNS = f'''c.id, c.title, c.category,
+    CASE WHEN length(c.description) > {DESCRIPTION_PREVIEW_LENGTH}
+         THEN substr(c.description, 1, {DESCRIPTION_PREVIEW_LENGTH}) || '…'
+         ELSE c.description END AS description'''
+
+class LazyRows:
+    """A query's rows, fetched from the cursor as they are iterated.
+
+    Testing it for truth reads only the first row, so a template can check
+    for an empty result without the whole list in memory. Iterate once.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._first = None
+        self._has_rows = None
+
+    def __bool__(self):
+        if self._has_rows is None:
+            self._first = self._cursor.fetchone()
+            self._has_rows = self._first is not None
+        return self._has_rows
+
+    def __iter__(self):
+        if self and self._first is not None:
+            first, self._first = self._first, None
+            yield first
+            yield from self._cursor
+
+
+# One page of rows plus the cursors for the neighbouring pages (None at the ends)
+Page = namedtuple('Page', ['items', 'next_cursor', 'prev_cursor'])
+
+
+def encode_cursor(values):
+    """Encode the sort key of a row as an opaque, URL-safe cursor."""
+    raw = json.dumps(list(values), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Decode a cursor into its sort key values, or None if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, binascii.Error):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    if not all(isinstance(value, (int, float)) for value in values):
+        return None
+    return values
+
+
+def fetch_page(conn, select_sql, conditions, params, sort_exprs, sort_keys,
+               page_size=DEFAULT_PAGE_SIZE, after=None, before=None):
+    """Fetch one page of a query with keyset (cursor) pagination.
+
+    ``select_sql`` is the ``SELECT ... FROM ...`` part and ``conditions`` the
+    SQL fragments ANDed into its WHERE clause. Rows are ordered by
+    ``sort_exprs`` (which must end with a unique column), and ``sort_keys``
+    names the selected columns holding those values, used to build cursors.
+
+    Instead of OFFSET, the query seeks straight past the cursor row with a
+    row-value comparison, so every page costs the same however deep it is.
+    """
+    conditions = list(conditions)
+    params = list(params)
+    key = ', '.join(sort_exprs)
+
+    cursor = before or after
+    values = decode_cursor(cursor, len(sort_exprs)) if cursor else None
+    backwards = bool(before) and values is not None
+    if values is not None:
+        placeholders = ', '.join('?' for _ in values)
+        conditions.append(f"({key}) {'<' if backwards else '>'} ({placeholders})")
+        params.extend(values)
+
+    sql = select_sql
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    direction = 'DESC' if backwards else 'ASC'
+    sql += ' ORDER BY ' + ', '.join(f'{expr} {direction}' for expr in sort_exprs)
+    sql += ' LIMIT ?'
+    params.append(page_size + 1)  # One extra row tells us if there is another page
+
+    rows = conn.execute(sql, params).fetchall()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+    if not rows:
+        return Page([], None, None)
+
+    first_key = encode_cursor(rows[0][name] for name in sort_keys)
+    last_key = encode_cursor(rows[-1][name] for name in sort_keys)
+    if backwards:
+        return Page(rows, last_key, first_key if has_more else None)
+    return Page(rows, last_key if has_more else None,
+                first_key if values is not None else None)
+
+
+def list_courses(conn, category_filter='', page_size=DEFAULT_PAGE_SIZE, after=None, before=None):
+    """List course cards in id order, optionally within one category."""
+    conditions, params = [], []
+    if category_filter:
+        conditions.append('c.category = ?')
+        params.append(category_filter)
+    return fetch_page(
+        conn,
+        f'SELECT {COURSE_CARD_COLUMNS} FROM courses c',
+        conditions, params,
+        sort_exprs=('c.id',), sort_keys=('id',),
+        page_size=page_size, after=after, before=before,
+    )
+
+
+def course_exists(conn, course_id):
+    """Check if a course exists (one primary-key lookup)."""
+    return conn.execute('SELECT 1 FROM courses WHERE id = ?', (course_id,)).fetchone() is not None
+
+
+# A category with its number of courses, for the /courses filter buttons
+CategoryFacet = namedtuple('CategoryFacet', ['name', 'course_count'])
+
+
+def category_facets(conn):
+    """Return every category with its course count, by name.
+
+    Reads the trigger-maintained category_counts table (see migrations.py),
+    so the cost grows with the number of categories, not courses.
+    """
+    return [CategoryFacet(row[0], row[1]) for row in conn.execute(
+        "SELECT category, course_count FROM category_counts "
+        "WHERE course_count > 0 AND category != '' ORDER BY category"
+    )]
+
+
+def rebuild_category_counts(conn):
+    """Recount category_counts from scratch (after bulk loads or manual edits)."""
+    conn.execute('DELETE FROM category_counts')
+    conn.execute('''
+        INSERT INTO category_counts (category, course_count)
+        SELECT category, COUNT(*) FROM courses
+        WHERE category IS NOT NULL GROUP BY category
+    ''')
@@ -0,0 +1,103 @@
+"""Per-table change counters behind the JSON read API's ETags.
+
+The ``change_counters`` table (migration 15) holds one version number per
+kind of data: ``courses`` (the catalogue) and ``progress`` (enrollments and
+completion). The mutation routes bump them with ``record_change`` inside
+their own write transactions, so a counter changes exactly when the data
+does. With ``DB_SHARDS`` every shard file has its own ``progress`` row,
+bumped by the writes to that shard.
+
+Each worker process keeps the versions in memory and reads them again at
+most once every ``API_CHANGE_INTERVAL`` seconds, so an unchanged poll is
+answered with a 304 without touching SQLite. The worker that made a change
+sees it at once; the others within the interval.
+"""
+
+import hashlib
+import threading
+import time
+from flask import current_app, g, has_app_context
+
+DEFAULT_API_CHANGE_INTERVAL = 1.0  # Seconds between counter reads
+
+# Kinds of data with a counter, and the tables they cover
+CHANGE_COUNTERS = {
+    'courses': ('courses', 'related_courses', 'category_counts'),
+    'progress': ('enrollments', 'course_progress', 'user_progress_summary'),
+}
+
+
+def record_change(conn, *names):
+    """Bump the named counters in the caller's write transaction.
+
+    Within an app context, this process re-reads the counters once the
+    context ends (after the commit).
+    """
+    conn.executemany('UPDATE change_counters SET version = version + 1 WHERE name = ?',
+                     [(name,) for name in names])
+    if has_app_context():
+        g.data_changed = True
+
+
+class ChangeCounters:
+    """The counter versions of one process, re-read at most once per ``interval``.
+
+    Versions are keyed by ``(name, shard)``; without shards the shard is 0.
+    """
+
+    def __init__(self, interval=DEFAULT_API_CHANGE_INTERVAL):
+        self.interval = interval
+        self.refreshes = 0
+        self._versions = {}
+        self._checked_at = {}
+        self._lock = threading.Lock()
+
+    def version(self, name, connect, shard=0):
+        """Return a counter's version, reading it through ``connect()`` if it is due."""
+        key = (name, shard)
+        checked_at = self._checked_at.get(key)
+        if checked_at is None or time.monotonic() - checked_at >= self.interval:
+            return self.refresh(name, connect(), shard)
+        return self._versions[key]
+
+    def refresh(self, name, conn, shard=0):
+        """Read a counter now and remember it."""
+        row = conn.execute('SELECT version FROM change_counters WHERE name = ?',
+                           (name,)).fetchone()
+        with self._lock:
+            self._versions[(name, shard)] = row[0] if row else 0
+            self._checked_at[(name, shard)] = time.monotonic()
+            self.refreshes += 1
+            return self._versions[(name, shard)]
+
+    def invalidate(self):
+        """Forget every version, after this process changed data."""
+        with self._lock:
+            self._checked_at.clear()
+
+    def stats(self):
+        """Return the counter statistics as a dict."""
+        with self._lock:
+            return {'counters': len(self._versions), 'refreshes': self.refreshes}
+
+
+def init_changes(app):
+    """Create the per-process change counters for an app."""
+    app.config.setdefault('API_CHANGE_INTERVAL', DEFAULT_API_CHANGE_INTERVAL)
+    counters = ChangeCounters(app.config['API_CHANGE_INTERVAL'])
+    app.extensions['lms_changes'] = counters
+
+    @app.teardown_appcontext
+    def forget_changed_versions(error=None):
+        if g.pop('data_changed', False):
+            counters.invalidate()
+
+
+def get_changes():
+    """Return the current app's ChangeCounters."""
+    return current_app.extensions['lms_changes']
+
+
+def make_etag(*parts):
+    """Build a strong ETag value from counter versions and request details."""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
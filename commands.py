@@ -0,0 +1,142 @@
+"""``flask lms ...`` maintenance commands.
+
+Usage:
+    flask --app app lms import courses courses.csv
+    flask --app app lms import enrollments enrollments.jsonl --batch-size 10000
+    flask --app app lms export courses courses.jsonl
+    flask --app app lms build-assets
+    flask --app app lms make-admin alice [--revoke]
+    flask --app app lms split-shards
+    flask --app app lms upgrade-shards
+    flask --app app lms sync-replicas
+"""
+
+import os
+import time
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from assets import MissingAsset, brotli, build_assets
+from bulk import (
+    DEFAULT_BATCH_SIZE, FORMATS, export_table, import_courses, import_enrollments,
+)
+from database import get_db
+from helpers import set_admin
+from storage import split_into_shards, sync_replica, upgrade_shard
+
+lms_cli = AppGroup('lms', help='LMS maintenance commands.')
+
+KINDS = ('courses', 'enrollments')
+
+
+def _rate(rows, seconds):
+    return rows / seconds if seconds > 0 else float(rows)
+
+
+@lms_cli.command('import')
+@click.argument('kind', type=click.Choice(KINDS))
+@click.argument('path', type=click.Path(allow_dash=True))
+@click.option('--format', 'file_format', type=click.Choice(FORMATS),
+              help='File format (default: from the file extension, else csv).')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True,
+              help='Rows written per transaction.')
+@click.option('--rebuild-indexes/--keep-indexes', 'rebuild', default=None,
+              help='Drop indexes and triggers during the load (default: for big files).')
+@click.option('--no-related', is_flag=True,
+              help='Skip recomputing related courses after an enrollment import.')
+def import_command(kind, path, file_format, batch_size, rebuild, no_related):
+    """Import courses or enrollments from a CSV or JSONL file ('-' for stdin)."""
+    def progress(read, written):
+        click.echo(f"  {read} rows read, {written} written", err=True)
+
+    if kind == 'enrollments' and current_app.config['DB_SHARDS']:
+        raise click.ClickException('Enrollment imports write the primary; import before '
+                                   "'flask lms split-shards', or into each shard file")
+    if kind == 'courses':
+        result = import_courses(path, file_format, batch_size, rebuild, progress)
+    else:
+        result = import_enrollments(path, file_format, batch_size, rebuild, progress,
+                                    related=not no_related)
+    click.echo(f"✅ Imported {result.written} {kind} ({result.skipped} skipped) in "
+               f"{result.seconds:.1f}s, {_rate(result.read, result.seconds):.0f} rows/sec.")
+
+
+@lms_cli.command('export')
+@click.argument('kind', type=click.Choice(KINDS))
+@click.argument('path', type=click.Path(allow_dash=True), default='-')
+@click.option('--format', 'file_format', type=click.Choice(FORMATS),
+              help='File format (default: from the file extension, else csv).')
+def export_command(kind, path, file_format):
+    """Export courses or enrollments to a CSV or JSONL file (default: stdout)."""
+    started = time.monotonic()
+    count = export_table(get_db(), kind, path, file_format)
+    seconds = time.monotonic() - started
+    click.echo(f"✅ Exported {count} {kind} in {seconds:.1f}s, "
+               f"{_rate(count, seconds):.0f} rows/sec.", err=True)
+
+
+@lms_cli.command('build-assets')
+def build_assets_command():
+    """Fingerprint and precompress static/ into ASSETS_DIST."""
+    app = current_app
+    started = time.monotonic()
+    try:
+        manifest = build_assets(app.static_folder,
+                                os.path.join(app.root_path, app.template_folder),
+                                app.config['ASSETS_DIST'])
+    except MissingAsset as e:
+        raise click.ClickException(str(e))
+    if brotli is None:
+        click.echo("⚠️ brotli is not installed, so only .gz variants were written "
+                   "(pip install brotli)", err=True)
+    click.echo(f"✅ Built {len(manifest)} assets into {app.config['ASSETS_DIST']} "
+               f"in {time.monotonic() - started:.1f}s.")
+
+
+@lms_cli.command('make-admin')
+@click.argument('username')
+@click.option('--revoke', is_flag=True, help='Take admin rights away instead.')
+def make_admin_command(username, revoke):
+    """Grant (or revoke) admin rights; the user's current sessions are signed out."""
+    if not set_admin(username, admin=not revoke):
+        raise click.ClickException(f"No user named '{username}'")
+    action = 'is no longer an admin' if revoke else 'is now an admin'
+    click.echo(f"✅ {username} {action}; their sessions were signed out.")
+
+
+@lms_cli.command('split-shards')
+def split_shards_command():
+    """Move enrollments and progress from DATABASE into the DB_SHARDS files."""
+    config = current_app.config
+    if not config['DB_SHARDS']:
+        raise click.ClickException('Set DB_SHARDS to the shard file paths first')
+    counts = split_into_shards(config['DATABASE'], config['DB_SHARDS'])
+    for table, per_shard in counts.items():
+        click.echo(f"  {table}: " + ', '.join(str(count) for count in per_shard))
+    click.echo(f"✅ Split into {len(config['DB_SHARDS'])} shards.")
+
+
+@lms_cli.command('upgrade-shards')
+def upgrade_shards_command():
+    """Add tables and triggers from new migrations of DATABASE to the DB_SHARDS files."""
+    config = current_app.config
+    if not config['DB_SHARDS']:
+        raise click.ClickException('Set DB_SHARDS to the shard file paths first')
+    for path in config['DB_SHARDS']:
+        created = upgrade_shard(config['DATABASE'], path)
+        click.echo(f"  {path}: " + (', '.join(created) or 'up to date'))
+    click.echo(f"✅ Upgraded {len(config['DB_SHARDS'])} shards.")
+
+
+@lms_cli.command('sync-replicas')
+def sync_replicas_command():
+    """Copy DATABASE into every DB_REPLICAS file (for local replicas)."""
+    config = current_app.config
+    for path in config['DB_REPLICAS']:
+        sync_replica(config['DATABASE'], path)
+    click.echo(f"✅ Synced {len(config['DB_REPLICAS'])} replicas.")
+
+
+def register_commands(app):
+    """Add the ``flask lms`` command group to an app."""
+    app.cli.add_command(lms_cli)
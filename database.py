@@ -0,0 +1,488 @@
+"""Pooled SQLite connections shared by the helpers and route modules.
+
+Connections come from a storage backend:
+
+- ``SQLiteBackend`` (the default): one database file for everything.
+- ``ReplicatedBackend`` (``DB_BACKEND = 'replicated'``): writes go to the
+  primary ``DATABASE``, reads to the ``DB_REPLICAS`` files, and the
+  per-user tables (``storage.SHARDED_TABLES``) optionally to ``DB_SHARDS`` files
+  by ``user_id % len(DB_SHARDS)``. See storage.py for creating shard files
+  and refreshing local replica copies.
+
+Routes do not pick files themselves: ``get_db`` gives the read connection,
+``run_write`` writes on the primary, and ``get_user_db`` /
+``run_user_write`` reach the rows of one user wherever they live.
+"""
+
+import itertools
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from flask import current_app, g, has_request_context, session
+from storage import fan_in_views, file_uri
+
+DEFAULT_DATABASE = 'lms.db'
+DEFAULT_POOL_SIZE = 8
+DEFAULT_PROFILE = 'default'
+DEFAULT_WRITE_RETRIES = 5
+DEFAULT_WRITE_BACKOFF = 0.01  # Seconds before the first retry, doubled each time
+DEFAULT_READ_YOUR_WRITES = 5  # Seconds a session reads from the primary after writing
+
+# Shard connections attach the primary under this name, so queries that
+# join the sharded tables with courses or users run unchanged
+CATALOG_ALIAS = 'catalog'
+
+# Named sets of PRAGMAs, chosen with the DB_PROFILE config key
+DATABASE_PROFILES = {
+    # Rollback journal, as the setup scripts create lms.db
+    'default': {
+        'temp_store': 'MEMORY',
+    },
+    # Readers never block on the writer; several workers share one file
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -16000,  # Negative means KiB, so about 16 MB
+        'busy_timeout': 5000,
+        'temp_store': 'MEMORY',
+    },
+}
+
+# Stored in the database file itself, so they only need setting once at startup
+STARTUP_PRAGMAS = ('journal_mode',)
+
+DEFAULT_PRAGMAS = tuple(
+    f'{name} = {value}' for name, value in DATABASE_PROFILES['default'].items()
+)
+
+
+class TimedConnection(sqlite3.Connection):
+    """A connection that reports each statement's run time to observers.
+
+    Observers are called as ``observer(conn, sql, params, seconds, many)``.
+    The time covers running the statement up to its first result row,
+    which is where SQLite does the searching, sorting and grouping.
+    """
+
+    observers = ()
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        cursor = super().execute(sql, parameters)
+        if self.observers:
+            elapsed = time.perf_counter() - started
+            for observer in self.observers:
+                observer(self, sql, parameters, elapsed, False)
+        return cursor
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        cursor = super().executemany(sql, seq_of_parameters)
+        if self.observers:
+            elapsed = time.perf_counter() - started
+            for observer in self.observers:
+                observer(self, sql, None, elapsed, True)
+        return cursor
+
+
+class ConnectionPool:
+    """A bounded pool of idle SQLite connections for one database file.
+
+    Connections are handed out to one request at a time, so they are opened
+    with ``check_same_thread=False`` and may move between worker threads.
+    At most ``max_size`` idle connections are kept; extra ones are closed
+    when they are released. ``read_only`` opens the file read-only (for
+    replicas); ``attach`` is a list of ``(alias, path)`` databases to
+    attach, read-only, to every connection, and ``setup(conn)`` runs on
+    each new connection after that.
+    """
+
+    def __init__(self, database, max_size=DEFAULT_POOL_SIZE, pragmas=DEFAULT_PRAGMAS,
+                 read_only=False, attach=(), setup=None):
+        self.database = database
+        self.max_size = max_size
+        self.pragmas = tuple(pragmas)
+        self.read_only = read_only
+        self.attach = tuple(attach)
+        self.setup = setup
+        self.hits = 0
+        self.misses = 0
+        # Query observers shared by every connection (see TimedConnection)
+        self.observers = []
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _connect(self):
+        """Open a new connection and apply the connection PRAGMAs."""
+        if self.read_only or self.attach or self.setup:
+            conn = sqlite3.connect(file_uri(self.database, self.read_only), uri=True,
+                                   check_same_thread=False, factory=TimedConnection)
+        else:
+            conn = sqlite3.connect(self.database, check_same_thread=False,
+                                   factory=TimedConnection)
+        conn.row_factory = sqlite3.Row
+        for alias, path in self.attach:
+            # Read-only, so a write transaction here never locks the attached file
+            conn.execute(f'ATTACH DATABASE ? AS {alias}', (file_uri(path, read_only=True),))
+        for pragma in self.pragmas:
+            conn.execute(f'PRAGMA {pragma}')
+        if self.setup is not None:
+            self.setup(conn)
+        conn.observers = self.observers  # After the PRAGMAs, so only real queries count
+        return conn
+
+    def _reset_after_fork(self):
+        """Forget connections inherited from a parent process."""
+        # SQLite handles must not be used (or closed) across fork()
+        if self._pid != os.getpid():
+            self._idle = deque()
+            self._pid = os.getpid()
+
+    def acquire(self):
+        """Take an idle connection from the pool, or open a new one."""
+        with self._lock:
+            self._reset_after_fork()
+            if self._idle:
+                self.hits += 1
+                return self._idle.pop()
+            self.misses += 1
+        return self._connect()
+
+    def release(self, conn):
+        """Return a connection to the pool, closing it if the pool is full."""
+        if conn.in_transaction:
+            conn.rollback()  # Never hand out a half-finished transaction
+        with self._lock:
+            if self._pid == os.getpid() and len(self._idle) < self.max_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        """Close every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for conn in idle:
+            conn.close()
+
+    def add_observer(self, observer):
+        """Have every connection of this pool report its queries to ``observer``."""
+        self.observers.append(observer)
+
+    def stats(self):
+        """Return the pool counters as a dict."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'idle': len(self._idle),
+                'max_size': self.max_size,
+            }
+
+
+class SQLiteBackend:
+    """The default storage: reads, writes and user rows all use one pool."""
+
+    def __init__(self, primary):
+        self.primary = primary
+        self.replicas = []
+        self.shards = []
+
+    @property
+    def sharded(self):
+        return bool(self.shards)
+
+    def read_pool(self):
+        """The pool to read from when the request has not written."""
+        return self.primary
+
+    def shard_index(self, user_id):
+        """Which shard holds a user's rows (always 0 when not sharded)."""
+        return user_id % len(self.shards) if self.shards else 0
+
+    def shard_pool(self, index):
+        """The pool of one shard (the primary when not sharded)."""
+        return self.shards[index] if self.shards else self.primary
+
+    def pools(self):
+        """Every pool of the backend."""
+        return [self.primary, *self.replicas, *self.shards]
+
+    def stats(self):
+        """Return the pool counters, summed over every pool."""
+        totals = {}
+        for pool in self.pools():
+            for key, value in pool.stats().items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+
+class ReplicatedBackend(SQLiteBackend):
+    """Writes go to the primary, reads to replicas, user rows optionally to shards.
+
+    ``replicas`` are read-only pools over copies of the primary, kept in
+    step by the replication tool (or ``storage.sync_replica`` locally);
+    they are picked round-robin. ``shards`` are pools over files holding
+    the SHARDED_TABLES rows of users with ``user_id % len(shards) == index``.
+    Shards are the only copy of those rows, so they serve both reads and
+    writes and never lag. Shard connections see the primary's tables
+    through the attached ``catalog``; primary and replica connections see
+    every shard's enrollments and progress through read-only fan-in views
+    (see storage.fan_in_views).
+    """
+
+    def __init__(self, primary, replicas=(), shards=()):
+        super().__init__(primary)
+        self.replicas = list(replicas)
+        self.shards = list(shards)
+        self._turn = itertools.count()
+
+    def read_pool(self):
+        if not self.replicas:
+            return self.primary
+        return self.replicas[next(self._turn) % len(self.replicas)]
+
+
+def resolve_profile(name, overrides=None):
+    """Return the PRAGMA settings of a named profile, with overrides applied."""
+    if name not in DATABASE_PROFILES:
+        raise ValueError(f'Unknown database profile: {name!r}')
+    settings = dict(DATABASE_PROFILES[name])
+    settings.update(overrides or {})
+    return settings
+
+
+def apply_startup_pragmas(database, settings):
+    """Set the persistent PRAGMAs of a profile (such as the journal mode)."""
+    conn = sqlite3.connect(database)
+    try:
+        for name in STARTUP_PRAGMAS:
+            if name in settings:
+                conn.execute(f'PRAGMA {name} = {settings[name]}')
+    finally:
+        conn.close()
+
+
+def connection_pragmas(settings):
+    """Return the per-connection PRAGMA statements of a profile."""
+    return tuple(
+        f'{name} = {value}'
+        for name, value in settings.items()
+        if name not in STARTUP_PRAGMAS
+    )
+
+
+def init_app(app):
+    """Create the storage backend for an app and register the teardown hook."""
+    app.config.setdefault('DATABASE', DEFAULT_DATABASE)
+    app.config.setdefault('DB_POOL_SIZE', DEFAULT_POOL_SIZE)
+    app.config.setdefault('DB_PROFILE', DEFAULT_PROFILE)
+    app.config.setdefault('DB_PRAGMAS', {})
+    app.config.setdefault('DB_WRITE_RETRIES', DEFAULT_WRITE_RETRIES)
+    app.config.setdefault('DB_WRITE_BACKOFF', DEFAULT_WRITE_BACKOFF)
+    app.config.setdefault('DB_BACKEND', 'sqlite')
+    app.config.setdefault('DB_REPLICAS', [])
+    app.config.setdefault('DB_SHARDS', [])
+    app.config.setdefault('DB_READ_YOUR_WRITES', DEFAULT_READ_YOUR_WRITES)
+
+    settings = resolve_profile(app.config['DB_PROFILE'], app.config['DB_PRAGMAS'])
+    pragmas = connection_pragmas(settings)
+    size = app.config['DB_POOL_SIZE']
+    primary_path = app.config['DATABASE']
+    apply_startup_pragmas(primary_path, settings)
+    primary = ConnectionPool(primary_path, max_size=size, pragmas=pragmas)
+
+    if app.config['DB_BACKEND'] == 'sqlite':
+        backend = SQLiteBackend(primary)
+    elif app.config['DB_BACKEND'] == 'replicated':
+        shard_paths = app.config['DB_SHARDS']
+        for path in shard_paths:
+            apply_startup_pragmas(path, settings)
+        # Cross-user reads on the primary and replicas see every shard
+        setup = fan_in_views(shard_paths) if shard_paths else None
+        if setup is not None:
+            primary = ConnectionPool(primary_path, max_size=size, pragmas=pragmas, setup=setup)
+        backend = ReplicatedBackend(
+            primary,
+            replicas=[ConnectionPool(path, max_size=size, pragmas=pragmas, read_only=True,
+                                     setup=setup)
+                      for path in app.config['DB_REPLICAS']],
+            shards=[ConnectionPool(path, max_size=size, pragmas=pragmas,
+                                   attach=[(CATALOG_ALIAS, primary_path)])
+                    for path in shard_paths],
+        )
+    else:
+        raise ValueError(f"Unknown DB_BACKEND: {app.config['DB_BACKEND']!r}")
+
+    app.extensions['lms_db_backend'] = backend
+    app.extensions['lms_db_pool'] = primary
+    app.teardown_appcontext(close_db)
+
+
+def get_backend(app=None):
+    """Return the storage backend of the given (or current) app."""
+    app = app or current_app
+    return app.extensions['lms_db_backend']
+
+
+def get_pool(app=None):
+    """Return the primary connection pool of the given (or current) app."""
+    app = app or current_app
+    return app.extensions['lms_db_pool']
+
+
+def _connection(pool):
+    """Check a connection out of ``pool`` for the app context, once per pool."""
+    connections = g.get('db_connections')
+    if connections is None:
+        connections = g.db_connections = {}
+    conn = connections.get(pool)
+    if conn is None:
+        conn = connections[pool] = pool.acquire()
+    return conn
+
+
+def _reads_from_primary():
+    """Check if this request or session wrote recently, so replicas may lag it."""
+    if g.get('db_wrote'):
+        return True
+    if not has_request_context():
+        return False
+    until = session.get('db_primary_until')
+    return until is not None and time.time() < until
+
+
+def get_db():
+    """Return the read connection for the current app context.
+
+    The first call in a request checks a connection out of the pool; later
+    calls in the same request reuse it. It is returned by ``close_db``.
+    With replicas, reads go to a replica unless the request (or, for
+    DB_READ_YOUR_WRITES seconds, the session) wrote to the primary.
+    """
+    backend = get_backend()
+    if not backend.replicas or _reads_from_primary():
+        return _connection(backend.primary)
+    if 'db_read_pool' not in g:
+        g.db_read_pool = backend.read_pool()
+    return _connection(g.db_read_pool)
+
+
+def get_write_db():
+    """Return the primary connection for the current app context."""
+    backend = get_backend()
+    g.db_wrote = True
+    if backend.replicas and has_request_context():
+        session['db_primary_until'] = time.time() + current_app.config['DB_READ_YOUR_WRITES']
+    return _connection(backend.primary)
+
+
+def get_user_db(user_id):
+    """Return the connection holding a user's enrollments and progress.
+
+    That is their shard when sharded, else the read connection.
+    """
+    backend = get_backend()
+    if not backend.sharded:
+        return get_db()
+    return _connection(backend.shard_pool(backend.shard_index(user_id)))
+
+
+def close_db(error=None):
+    """Give the app context's connections back to their pools."""
+    connections = g.pop('db_connections', None) or {}
+    for pool, conn in connections.items():
+        pool.release(conn)
+
+
+def pool_stats(app=None):
+    """Return the pool hit/miss counters for the given (or current) app."""
+    return get_backend(app).stats()
+
+
+def split_by_shard(user_ids):
+    """Group user ids by shard: ``[(shard index, [user ids]), ...]``."""
+    backend = get_backend()
+    groups = {}
+    for user_id in user_ids:
+        groups.setdefault(backend.shard_index(user_id), []).append(user_id)
+    return sorted(groups.items())
+
+
+def is_lock_error(error):
+    """Check if an OperationalError means another connection holds the lock."""
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def write_with_retry(conn, work, retries=DEFAULT_WRITE_RETRIES, backoff=DEFAULT_WRITE_BACKOFF):
+    """Run ``work(conn)`` in one write transaction and commit it.
+
+    The transaction starts with ``BEGIN IMMEDIATE`` so read-then-write code
+    takes the write lock up front instead of failing halfway through. If the
+    database is still locked after SQLite's busy timeout, the whole
+    transaction is retried with jittered exponential backoff, up to
+    ``retries`` times. Returns whatever ``work`` returns.
+    """
+    for attempt in range(retries + 1):
+        try:
+            if conn.in_transaction:
+                conn.commit()  # Close any implicit transaction first
+            conn.execute('BEGIN IMMEDIATE')
+            result = work(conn)
+            conn.commit()
+            return result
+        except sqlite3.OperationalError as error:
+            if conn.in_transaction:
+                conn.rollback()
+            if not is_lock_error(error) or attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+
+
+def _write(conn, work):
+    return write_with_retry(
+        conn,
+        work,
+        retries=current_app.config['DB_WRITE_RETRIES'],
+        backoff=current_app.config['DB_WRITE_BACKOFF'],
+    )
+
+
+def run_write(work):
+    """Run ``work(conn)`` as a retried write on the request's primary connection."""
+    return _write(get_write_db(), work)
+
+
+def run_user_write(user_id, work):
+    """Run ``work(conn)`` as a retried write where a user's rows live.
+
+    ``work`` may write the SHARDED_TABLES rows of that user (or of users in
+    the same shard, see ``split_by_shard``) and read any table.
+    """
+    backend = get_backend()
+    if not backend.sharded:
+        return run_write(work)
+    return _write(_connection(backend.shard_pool(backend.shard_index(user_id))), work)
+
+
+def run_shard_writes(work):
+    """Run ``work(conn)`` on every shard, one transaction each; returns the results.
+
+    Shards commit independently, so this is for changes that are correct
+    shard by shard, such as dropping a deleted course from everyone's
+    counters.
+    """
+    backend = get_backend()
+    if not backend.sharded:
+        return [run_write(work)]
+    return [_write(_connection(pool), work) for pool in backend.shards]
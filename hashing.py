@@ -0,0 +1,167 @@
+"""Password hashing off the request threads.
+
+Werkzeug's password hashes are deliberately slow. Running them inline lets a
+burst of logins occupy every request thread, so catalogue pages queue up
+behind them. ``PasswordHasher`` runs them in a small process pool instead,
+with a cap on how many may wait at once; requests over the cap fail fast
+with ``HashingBusy``.
+"""
+
+import multiprocessing
+import os
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_HASH_WORKERS = 2
+DEFAULT_HASH_MAX_PENDING = 32  # Hash jobs waiting or running, per worker process
+DEFAULT_HASH_QUEUE_TIMEOUT = 2.0  # Seconds to wait for a free slot before giving up
+DEFAULT_HASH_METHOD = 'scrypt'
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue stays full for longer than the timeout."""
+
+
+def _hash_prefix(password_hash):
+    """Return the method and parameters part of a werkzeug hash."""
+    return password_hash.split('$', 1)[0]
+
+
+class PasswordHasher:
+    """Bounded process-pool password hashing with queue-depth counters.
+
+    With ``workers=0`` the hashes run inline on the calling thread, which
+    is handy for scripts and debugging; the queue limit still applies.
+    """
+
+    def __init__(self, workers=DEFAULT_HASH_WORKERS, max_pending=DEFAULT_HASH_MAX_PENDING,
+                 queue_timeout=DEFAULT_HASH_QUEUE_TIMEOUT, method=DEFAULT_HASH_METHOD):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.method = method
+        self._dummy_hash = None
+        self._dummy_future = None
+        self.completed = 0
+        self.rejected = 0
+        self._pending = 0
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    @property
+    def current_prefix(self):
+        """What a hash made with the current settings starts with, e.g. 'scrypt:32768:8:1'."""
+        return _hash_prefix(self._get_dummy_hash())
+
+    def _get_dummy_hash(self):
+        """Return the hash of a random password, made once when the pool starts.
+
+        Unknown usernames are checked against it, and its prefix tells
+        which stored hashes need an upgrade. With ``workers=0`` it is made
+        inline on first use.
+        """
+        if self._dummy_hash is None:
+            if self.workers == 0:
+                self._dummy_hash = generate_password_hash(secrets.token_hex(16), self.method)
+            else:
+                self._get_executor()
+                self._dummy_hash = self._dummy_future.result()
+        return self._dummy_hash
+
+    def _get_executor(self):
+        """Start the process pool on first use (and again after a fork)."""
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # 'spawn' is safe to start from a multi-threaded server process
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+                self._pid = os.getpid()
+                if self._dummy_hash is None:
+                    # Made by the pool alongside the first job, not on a request thread
+                    self._dummy_future = self._executor.submit(
+                        generate_password_hash, secrets.token_hex(16), self.method)
+            return self._executor
+
+    def _run(self, func, *args):
+        """Run one hash job, waiting for a queue slot first."""
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise HashingBusy('Password hashing queue is full')
+        with self._lock:
+            self._pending += 1
+        try:
+            if self.workers == 0:
+                return func(*args)
+            return self._get_executor().submit(func, *args).result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self.completed += 1
+            self._slots.release()
+
+    def hash_password(self, password):
+        """Hash a new password with the current method and parameters."""
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify_password(self, password_hash, password):
+        """Check a password against a stored hash."""
+        return self._run(check_password_hash, password_hash, password)
+
+    def reject_unknown_user(self, password):
+        """Fail a login for a username that does not exist.
+
+        The password is still checked, against the dummy hash and through
+        the same queue and pool, so the reply takes as long as for a real
+        user and response timing does not reveal which usernames exist.
+        """
+        self._run(check_password_hash, self._get_dummy_hash(), password)
+        return False
+
+    def needs_rehash(self, password_hash):
+        """Check if a stored hash was made with older method or parameters."""
+        return _hash_prefix(password_hash) != self.current_prefix
+
+    def stats(self):
+        """Return the queue counters as a dict."""
+        with self._lock:
+            return {
+                'queue_depth': self._pending,
+                'max_pending': self.max_pending,
+                'workers': self.workers,
+                'completed': self.completed,
+                'rejected': self.rejected,
+            }
+
+    def shutdown(self):
+        """Stop the worker processes."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def init_hasher(app):
+    """Create the password hashing service for an app."""
+    app.config.setdefault('HASH_WORKERS', DEFAULT_HASH_WORKERS)
+    app.config.setdefault('HASH_MAX_PENDING', DEFAULT_HASH_MAX_PENDING)
+    app.config.setdefault('HASH_QUEUE_TIMEOUT', DEFAULT_HASH_QUEUE_TIMEOUT)
+    app.config.setdefault('HASH_METHOD', DEFAULT_HASH_METHOD)
+    app.extensions['lms_hasher'] = PasswordHasher(
+        workers=app.config['HASH_WORKERS'],
+        max_pending=app.config['HASH_MAX_PENDING'],
+        queue_timeout=app.config['HASH_QUEUE_TIMEOUT'],
+        method=app.config['HASH_METHOD'],
+    )
+
+
+def get_hasher():
+    """Return the current app's password hashing service."""
+    return current_app.extensions['lms_hasher']
@@ -1,52 +1,178 @@
 """Helper functions used across the application."""
-import sqlite3
-from flask import session
+from collections import namedtuple
+from flask import current_app, g, has_request_context, render_template, session, stream_template
+from cache import make_cache
+from database import get_db, get_user_db, run_write
+from sessions import get_revocations, session_claims, start_session, end_session
+
+# The logged-in user, resolved once per request by get_current_user()
+CurrentUser = namedtuple('CurrentUser', ['id', 'username', 'is_admin', 'session_version'])
+
+DEFAULT_USER_CACHE_SIZE = 1024
+DEFAULT_USER_CACHE_TTL = 30  # Seconds
+
+def init_user_cache(app):
+    """Create the cross-request user cache for an app."""
+    app.config.setdefault('USER_CACHE_SIZE', DEFAULT_USER_CACHE_SIZE)
+    app.config.setdefault('USER_CACHE_TTL', DEFAULT_USER_CACHE_TTL)
+    app.extensions['lms_user_cache'] = make_cache(app, 'USER_CACHE')
+
+def _coalesce(chunks, size):
+    """Join small template chunks into pieces of at least ``size`` characters."""
+    buffer, buffered = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield ''.join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+def render_page(template_name, **context):
+    """Render a page template, streamed to the client if STREAM_TEMPLATES is on.
+
+    Streamed pages send the header and navigation while the rest renders,
+    and lazy rows in the context (see catalogue.LazyRows) are fetched as
+    the template loops over them. Pages going into the page cache are
+    always rendered whole.
+    """
+    config = current_app.config
+    if not config['STREAM_TEMPLATES'] or g.get('filling_page_cache'):
+        return render_template(template_name, **context)
+    return current_app.response_class(
+        _coalesce(stream_template(template_name, **context), config['STREAM_CHUNK_SIZE']),
+        mimetype='text/html',
+    )
 
 def get_db_connection():
-    """Create a database connection."""
-    conn = sqlite3.connect('lms.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get the pooled database connection for the current request.
 
-def is_admin():
-    """Check if current user is admin."""
-    if 'username' not in session:
-        return False
+    The connection is shared by every helper and route in the request and is
+    returned to the pool on teardown, so callers must not close it. It may
+    be a read replica (see database.get_db); writes go through run_write.
+    """
+    return get_db()
+
+def user_from_row(row):
+    """Build a CurrentUser from a users row."""
+    return CurrentUser(row['id'], row['username'], row['is_admin'] == 1, row['session_version'])
+
+def load_user(username):
+    """Look up a user by username, through the short-TTL cross-request cache.
+
+    Returns a CurrentUser, or None if there is no such user.
+    """
+    user_cache = current_app.extensions['lms_user_cache']
+    user = user_cache.get(username)
+    if user is not None:
+        return user
 
     conn = get_db_connection()
-    user = conn.execute(
-        'SELECT is_admin FROM users WHERE username = ?',
-        (session['username'],)
+    row = conn.execute(
+        'SELECT id, username, is_admin, session_version FROM users WHERE username = ?',
+        (username,)
     ).fetchone()
-    conn.close()
+    if row is None:
+        return None
+
+    user = user_from_row(row)
+    user_cache.set(username, user)
+    return user
 
-    return user and user['is_admin'] == 1
+def invalidate_user(username=None):
+    """Forget a cached user (or every user) after registration or a role change.
+
+    This only reaches the current worker process; other workers (and changes
+    made directly in the database) catch up within USER_CACHE_TTL.
+    """
+    user_cache = current_app.extensions['lms_user_cache']
+    if username is None:
+        user_cache.clear()
+    else:
+        user_cache.pop(username)
+    if not has_request_context():
+        return  # Called from a command; no request user to forget
+    if username is None or username == session.get('username'):
+        g.pop('current_user', None)
+
+def login_user(user):
+    """Sign a CurrentUser in, with their claims in the session cookie."""
+    start_session(user.id, user.username, user.is_admin, user.session_version)
+    g.current_user = user
+
+def logout_user():
+    """Sign the current user out."""
+    end_session()
+    g.current_user = None
+
+def get_current_user():
+    """Get the logged-in user from the session claims (None if anonymous).
+
+    No database lookup, except once for a session signed in before claims
+    were added, which is upgraded in place (see sessions.py).
+    """
+    if 'current_user' not in g:
+        claims = session_claims()
+        if claims is not None:
+            g.current_user = CurrentUser(*claims)
+        elif 'username' in session:
+            user = load_user(session['username'])
+            if user is None:
+                logout_user()
+            else:
+                login_user(user)
+        else:
+            g.current_user = None
+    return g.current_user
+
+def is_admin():
+    """Check if current user is admin."""
+    user = get_current_user()
+    return user is not None and user.is_admin
 
 def get_user_id(username):
     """Get user ID from username."""
+    if username == session.get('username'):
+        user = get_current_user()
+        return user.id if user else None
+
     conn = get_db_connection()
     user = conn.execute(
         'SELECT id FROM users WHERE username = ?',
         (username,)
     ).fetchone()
-    conn.close()
     return user['id'] if user else None
 
 def is_course_completed(user_id, course_id):
     """Check if a user has completed a course."""
-    conn = get_db_connection()
+    conn = get_user_db(user_id)
     progress = conn.execute(
         'SELECT completed FROM course_progress WHERE user_id = ? AND course_id = ?',
         (user_id, course_id)
     ).fetchone()
-    conn.close()
     return progress and progress['completed'] == 1
 
 def get_user_completed_courses(user_id):
     """Get list of course IDs that user has completed."""
-    conn = get_db_connection()
+    conn = get_user_db(user_id)
     completed = conn.execute(
         'SELECT course_id FROM course_progress WHERE user_id = ? AND completed = 1',
+        (user_id,)
     ).fetchall()
-    conn.close()
     return [row['course_id'] for row in completed]
+
+def set_admin(username, admin=True):
+    """Grant or revoke admin privileges, signing the user out everywhere.
+
+    The users_role_change trigger bumps their session_version; this worker
+    rejects the old sessions at once, the others within
+    SESSION_REVOCATION_INTERVAL. Returns False if there is no such user.
+    """
+    found = run_write(lambda conn: conn.execute(
+        'UPDATE users SET is_admin = ? WHERE username = ?',
+        (1 if admin else 0, username)
+    ).rowcount)
+    get_revocations().refresh(get_db())
+    invalidate_user(username)
+    return found > 0
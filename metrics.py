@@ -0,0 +1,263 @@
+"""Request, SQL and template timing, exported for Prometheus.
+
+``init_metrics`` hooks into the app and its connection pool:
+
+- every query on a pooled connection is timed and counted per request
+  (see ``database.TimedConnection``); queries slower than
+  ``SLOW_QUERY_MS`` are logged with their ``EXPLAIN QUERY PLAN``
+- each request's latency and query count go into per-route histograms
+- template render time is measured between Flask's
+  ``before_render_template`` and ``template_rendered`` signals
+- ``/metrics`` serves everything, plus the pool, cache, hashing and
+  write-behind counters, in the Prometheus text format
+- with ``METRICS_SERVER_TIMING`` on, responses carry a ``Server-Timing``
+  header with the request's database and template time
+
+Recording is a few ``perf_counter`` calls and dict updates under a lock,
+cheap enough to leave on. Each worker process keeps its own numbers, so
+scrape every worker (or sum them per instance).
+"""
+
+import bisect
+import logging
+import sqlite3
+import threading
+import time
+from flask import (
+    before_render_template, current_app, g, has_request_context, request,
+    template_rendered,
+)
+from helpers import get_current_user
+from database import get_backend
+
+DEFAULT_SLOW_QUERY_MS = 100
+DEFAULT_METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+logger = logging.getLogger(__name__)
+
+# Components whose stats() go into /metrics: metric prefix -> (app.extensions
+# key, HELP description, stats keys that only ever grow). Those keys are
+# exported as counters named <prefix>_<key>_total; the others (sizes, queue
+# depths, limits) as gauges.
+COMPONENTS = {
+    'lms_user_cache': ('lms_user_cache', 'User cache', {'hits', 'misses'}),
+    'lms_page_cache': ('lms_page_cache', 'Page cache', {'hits', 'misses'}),
+    'lms_hashing': ('lms_hasher', 'Password hashing pool', {'completed', 'rejected'}),
+    'lms_write_behind': ('lms_write_behind', 'Write-behind queue',
+                         {'enqueued', 'committed', 'batches', 'errors'}),
+    'lms_sessions': ('lms_sessions', 'Session revocation list', {'refreshes'}),
+    'lms_changes': ('lms_changes', 'Change counters', {'refreshes'}),
+    'lms_rate_limit': ('lms_rate_limiter', 'Login rate limiter', {'allowed', 'rejected'}),
+}
+DB_POOL_COUNTERS = {'hits', 'misses'}
+
+
+class Histogram:
+    """Cumulative-bucket histograms keyed by a tuple of label values."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        """Yield ``(labels, cumulative bucket counts, count, sum)`` per series."""
+        for labels, series in sorted(self._series.items()):
+            cumulative, total = [], 0
+            for count in series[:-1]:
+                total += count
+                cumulative.append(total)
+            yield labels, cumulative, total, series[-1]
+
+
+class Metrics:
+    """The per-process metric store behind ``/metrics``."""
+
+    def __init__(self, slow_query_seconds):
+        self.slow_query_seconds = slow_query_seconds
+        self.request_seconds = Histogram(LATENCY_BUCKETS)
+        self.request_queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.request_query_seconds = Histogram(LATENCY_BUCKETS)
+        self.template_seconds = Histogram(LATENCY_BUCKETS)
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.slow_queries = 0
+        self._lock = threading.Lock()
+
+    # --- recording ----------------------------------------------------------
+
+    def on_query(self, conn, sql, params, seconds, many):
+        """Connection observer: count the query, log it if slow."""
+        if has_request_context():
+            g.metrics_queries = g.get('metrics_queries', 0) + 1
+            g.metrics_query_seconds = g.get('metrics_query_seconds', 0.0) + seconds
+        slow = seconds >= self.slow_query_seconds
+        with self._lock:
+            self.queries += 1
+            self.query_seconds += seconds
+            if slow:
+                self.slow_queries += 1
+        if slow:
+            self._log_slow_query(conn, sql, params, seconds, many)
+
+    def _log_slow_query(self, conn, sql, params, seconds, many):
+        plan = []
+        if not many:
+            try:
+                # Call the base class so the EXPLAIN is not timed itself
+                rows = sqlite3.Connection.execute(conn, f'EXPLAIN QUERY PLAN {sql}', params)
+                plan = [row[3] for row in rows]
+            except sqlite3.Error:
+                pass
+        logger.warning('Slow query (%.1f ms): %s\n  plan: %s', seconds * 1000,
+                       ' '.join(sql.split()), '; '.join(plan) or 'n/a')
+
+    def before_template(self, sender, template, context, **extra):
+        g.setdefault('metrics_template_starts', []).append(time.perf_counter())
+
+    def after_template(self, sender, template, context, **extra):
+        starts = g.get('metrics_template_starts')
+        if not starts:
+            return
+        seconds = time.perf_counter() - starts.pop()
+        g.metrics_template_seconds = g.get('metrics_template_seconds', 0.0) + seconds
+        with self._lock:
+            self.template_seconds.observe((template.name or '(string)',), seconds)
+
+    def before_request(self):
+        g.metrics_started = time.perf_counter()
+
+    def after_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        seconds = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else '(unmatched)'
+        labels = (request.method, route, f'{response.status_code // 100}xx')
+        queries = g.get('metrics_queries', 0)
+        query_seconds = g.get('metrics_query_seconds', 0.0)
+        with self._lock:
+            self.request_seconds.observe(labels, seconds)
+            self.request_queries.observe(labels[:2], queries)
+            self.request_query_seconds.observe(labels[:2], query_seconds)
+
+        if current_app.config['METRICS_SERVER_TIMING']:
+            response.headers['Server-Timing'] = ', '.join([
+                f'db;dur={query_seconds * 1000:.2f};desc="{queries} queries"',
+                f'tpl;dur={g.get("metrics_template_seconds", 0.0) * 1000:.2f}',
+                f'app;dur={seconds * 1000:.2f}',
+            ])
+        return response
+
+    # --- export -------------------------------------------------------------
+
+    def render(self, components):
+        """Return every metric in the Prometheus text exposition format.
+
+        ``components`` maps a metric name prefix to ``(description, stats,
+        counter keys)``, as built by ``collect_stats``.
+        """
+        lines = []
+        with self._lock:
+            _counter(lines, 'lms_sql_queries_total', 'SQL statements run.', self.queries)
+            _counter(lines, 'lms_sql_query_seconds_total', 'Time spent in SQL statements.',
+                     self.query_seconds)
+            _counter(lines, 'lms_sql_slow_queries_total', 'SQL statements over SLOW_QUERY_MS.',
+                     self.slow_queries)
+            _histogram(lines, 'lms_request_duration_seconds', 'Request latency by route.',
+                       ('method', 'route', 'status'), self.request_seconds)
+            _histogram(lines, 'lms_request_sql_queries', 'SQL statements per request.',
+                       ('method', 'route'), self.request_queries)
+            _histogram(lines, 'lms_request_sql_seconds', 'SQL time per request.',
+                       ('method', 'route'), self.request_query_seconds)
+            _histogram(lines, 'lms_template_render_seconds', 'Template render time.',
+                       ('template',), self.template_seconds)
+        for prefix, (description, stats, counter_keys) in components.items():
+            for key, value in (stats or {}).items():
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    continue
+                help_text = f"{description}: {key.replace('_', ' ')}."
+                if key in counter_keys:
+                    _counter(lines, f'{prefix}_{key}_total', help_text, value)
+                else:
+                    _gauge(lines, f'{prefix}_{key}', help_text, value)
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _counter(lines, name, help_text, value):
+    lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter', f'{name} {value}']
+
+
+def _gauge(lines, name, help_text, value):
+    lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {value}']
+
+
+def _histogram(lines, name, help_text, label_names, histogram):
+    lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for labels, cumulative, count, total in histogram.samples():
+        for bound, value in zip(histogram.buckets + ('+Inf',), cumulative):
+            bucket_labels = _labels(label_names, labels, f'le="{bound}"')
+            lines.append(f'{name}_bucket{bucket_labels} {value}')
+        lines.append(f'{name}_count{_labels(label_names, labels)} {count}')
+        lines.append(f'{name}_sum{_labels(label_names, labels)} {total}')
+
+
+def collect_stats(app):
+    """Gather the stats() of the app's pools, caches and queues, for ``render``."""
+    components = {'lms_db_pool': ('Database connection pools', get_backend(app).stats(),
+                                  DB_POOL_COUNTERS)}
+    for prefix, (key, description, counter_keys) in COMPONENTS.items():
+        component = app.extensions.get(key)
+        if component is not None:
+            components[prefix] = (description, component.stats(), counter_keys)
+    return components
+
+
+def init_metrics(app):
+    """Install the timing hooks and the /metrics endpoint on an app."""
+    app.config.setdefault('METRICS', True)
+    app.config.setdefault('SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS)
+    app.config.setdefault('METRICS_SERVER_TIMING', False)
+    app.config.setdefault('METRICS_ALLOWED_IPS', DEFAULT_METRICS_ALLOWED_IPS)
+    if not app.config['METRICS']:
+        return
+
+    metrics = Metrics(app.config['SLOW_QUERY_MS'] / 1000)
+    app.extensions['lms_metrics'] = metrics
+    for pool in get_backend(app).pools():
+        pool.add_observer(metrics.on_query)
+    app.before_request(metrics.before_request)
+    app.after_request(metrics.after_request)
+    before_render_template.connect(metrics.before_template, app)
+    template_rendered.connect(metrics.after_template, app)
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """Prometheus scrape endpoint (local addresses and admins only)."""
+        user = get_current_user()
+        if request.remote_addr not in app.config['METRICS_ALLOWED_IPS'] \
+                and not (user and user.is_admin):
+            return 'Forbidden\n', 403, {'Content-Type': 'text/plain'}
+        return (metrics.render(collect_stats(app)), 200,
+                {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
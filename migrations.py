@@ -0,0 +1,629 @@
+"""Versioned schema migrations for the LMS database.
+
+Every schema change is a numbered migration below. The ``schema_version``
+table records which ones have been applied, and each pending migration runs
+in its own transaction together with its version row, so a failure leaves
+the database at the previous version. Migrations check what already exists
+before changing it, so databases set up with the old one-off scripts (which
+have no ``schema_version`` table yet) upgrade cleanly.
+
+Usage:
+    python migrations.py [--db lms.db]            # apply pending migrations
+    python migrations.py [--db lms.db] --dry-run  # show query plans, change nothing
+"""
+
+import argparse
+import sqlite3
+from collections import namedtuple
+from werkzeug.security import generate_password_hash
+from bulk import restore_pending_schema
+from progress import rebuild_progress_summary
+from related import rebuild_related_courses
+from catalogue import rebuild_category_counts
+from changes import CHANGE_COUNTERS
+from reports import completion_bucket_sql, rebuild_course_stats
+from video import get_embed_url
+
+DB_NAME = 'lms.db'
+
+Migration = namedtuple('Migration', ['version', 'name', 'apply'])
+
+
+def table_exists(conn, name):
+    """Check if a table (or virtual table) exists."""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (name,)
+    ).fetchone()
+    return row is not None
+
+
+def column_exists(conn, table, column):
+    """Check if a table has a column."""
+    return any(row[1] == column for row in conn.execute(f'PRAGMA table_info({table})'))
+
+
+def create_courses_table(conn):
+    """Create the courses table and seed it with the starter courses."""
+    if table_exists(conn, 'courses'):
+        return  # Never re-seed a catalogue that already exists
+    conn.execute('''
+        CREATE TABLE courses (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            description TEXT NOT NULL
+        )
+    ''')
+    conn.executemany('INSERT INTO courses (id, title, description) VALUES (?, ?, ?)', [
+        (1, "Introduction to Photography",
+         "Learn the basics of photography, including composition, lighting, and camera settings."),
+        (2, "Video Production Basics",
+         "An introductory course on video production, covering filming techniques, editing, and more."),
+        (3, "Advanced Canva Design",
+         "Master advanced design techniques using Canva to create stunning graphics & presentations."),
+        (4, "Robotics for beginners",
+         "Get started with robotics, learning about basic concepts."),
+        (5, "Introduction to Machine Learning",
+         "Understand the fundamentals of machine learning, including algorithms and applications."),
+    ])
+
+
+def create_users_table(conn):
+    """Create the users table with the default admin account."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL
+        )
+    ''')
+    conn.execute(
+        'INSERT OR IGNORE INTO users (username, password_hash) VALUES (?, ?)',
+        ('admin', generate_password_hash('password'))
+    )
+
+
+def add_is_admin_column(conn):
+    """Add users.is_admin and make the default admin account an admin."""
+    if not column_exists(conn, 'users', 'is_admin'):
+        conn.execute('ALTER TABLE users ADD COLUMN is_admin INTEGER DEFAULT 0')
+    conn.execute("UPDATE users SET is_admin = 1 WHERE username = 'admin'")
+
+
+def add_video_url_column(conn):
+    """Add courses.video_url."""
+    if not column_exists(conn, 'courses', 'video_url'):
+        conn.execute('ALTER TABLE courses ADD COLUMN video_url TEXT')
+
+
+def create_course_progress_table(conn):
+    """Create the course_progress table for completion tracking."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS course_progress (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            course_id INTEGER NOT NULL,
+            completed INTEGER DEFAULT 0,
+            completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            FOREIGN KEY (course_id) REFERENCES courses(id),
+            UNIQUE(user_id, course_id)
+        )
+    ''')
+
+
+def add_category_column(conn):
+    """Add courses.category."""
+    if not column_exists(conn, 'courses', 'category'):
+        conn.execute("ALTER TABLE courses ADD COLUMN category TEXT DEFAULT 'General'")
+
+
+def create_enrollments_table(conn):
+    """Create the enrollments table."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS enrollments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            course_id INTEGER NOT NULL,
+            enrolled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (course_id) REFERENCES courses (id),
+            UNIQUE(user_id, course_id)
+        )
+    ''')
+
+
+def create_course_search_index(conn):
+    """Create the courses_fts full-text index and the triggers that sync it."""
+    already_built = table_exists(conn, 'courses_fts')
+    # External-content table: the text lives in 'courses', FTS5 only keeps the index
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS courses_fts USING fts5(
+            title, description, category,
+            content='courses', content_rowid='id',
+            prefix='2 3'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS courses_fts_insert AFTER INSERT ON courses BEGIN
+            INSERT INTO courses_fts (rowid, title, description, category)
+            VALUES (new.id, new.title, new.description, new.category);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS courses_fts_delete AFTER DELETE ON courses BEGIN
+            INSERT INTO courses_fts (courses_fts, rowid, title, description, category)
+            VALUES ('delete', old.id, old.title, old.description, old.category);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS courses_fts_update AFTER UPDATE ON courses BEGIN
+            INSERT INTO courses_fts (courses_fts, rowid, title, description, category)
+            VALUES ('delete', old.id, old.title, old.description, old.category);
+            INSERT INTO courses_fts (rowid, title, description, category)
+            VALUES (new.id, new.title, new.description, new.category);
+        END
+    ''')
+    if not already_built:
+        # Index the courses that already exist
+        conn.execute("INSERT INTO courses_fts (courses_fts) VALUES ('rebuild')")
+
+
+def create_progress_summary(conn):
+    """Create the materialized dashboard counters (see progress.py)."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_progress_summary (
+            user_id INTEGER PRIMARY KEY,
+            enrolled_count INTEGER NOT NULL DEFAULT 0,
+            completed_count INTEGER NOT NULL DEFAULT 0,
+            in_progress_count INTEGER NOT NULL DEFAULT 0,
+            last_activity TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS catalogue_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            course_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS catalogue_stats_insert AFTER INSERT ON courses BEGIN
+            UPDATE catalogue_stats SET course_count = course_count + 1 WHERE id = 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS catalogue_stats_delete AFTER DELETE ON courses BEGIN
+            UPDATE catalogue_stats SET course_count = course_count - 1 WHERE id = 1;
+        END
+    ''')
+    # Fill the counters from the existing enrollments and progress rows
+    rebuild_progress_summary(conn)
+
+
+def add_hot_query_indexes(conn):
+    """Add the indexes behind the catalogue, dashboard and enrollment queries."""
+    # Category listing, seeking by id within the category
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_courses_category_id ON courses (category, id)')
+    # Dashboard counts and completed/in-progress lists
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_course_progress_user_completed '
+                 'ON course_progress (user_id, completed)')
+    # Per-course enrollment lookups; per-user ones already use the
+    # UNIQUE(user_id, course_id) index, so no separate enrollments(user_id)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_enrollments_course_id ON enrollments (course_id)')
+
+
+def create_related_courses_table(conn):
+    """Create the precomputed related courses table (see related.py)."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS related_courses (
+            course_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            related_id INTEGER NOT NULL,
+            score INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (course_id, position)
+        ) WITHOUT ROWID
+    ''')
+    # Finds the lists to refresh when a course changes
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_related_courses_related_id '
+                 'ON related_courses (related_id)')
+    rebuild_related_courses(conn)
+
+
+def add_embed_url_column(conn):
+    """Add courses.embed_url and fill it from each course's video_url."""
+    if not column_exists(conn, 'courses', 'embed_url'):
+        conn.execute('ALTER TABLE courses ADD COLUMN embed_url TEXT')
+    rows = conn.execute(
+        "SELECT id, video_url FROM courses WHERE video_url IS NOT NULL AND video_url != ''"
+    ).fetchall()
+    conn.executemany(
+        'UPDATE courses SET embed_url = ? WHERE id = ?',
+        [(get_embed_url(video_url), course_id) for course_id, video_url in rows]
+    )
+
+
+def add_session_version(conn):
+    """Add users.session_version and the session revocation log (see sessions.py)."""
+    if not column_exists(conn, 'users', 'session_version'):
+        conn.execute('ALTER TABLE users ADD COLUMN session_version INTEGER NOT NULL DEFAULT 0')
+    # Sessions of user_id signed with an older version than this are revoked
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS session_revocations (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            session_version INTEGER NOT NULL,
+            revoked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Granting or revoking admin invalidates the sessions holding the old role
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_role_change AFTER UPDATE OF is_admin ON users
+        WHEN new.is_admin IS NOT old.is_admin BEGIN
+            UPDATE users SET session_version = session_version + 1 WHERE id = new.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_session_version AFTER UPDATE OF session_version ON users
+        WHEN new.session_version > old.session_version BEGIN
+            INSERT INTO session_revocations (user_id, session_version)
+            VALUES (new.id, new.session_version);
+        END
+    ''')
+    # User ids are AUTOINCREMENT, so a deleted user's id is never handed out again
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_delete_sessions AFTER DELETE ON users BEGIN
+            INSERT INTO session_revocations (user_id, session_version)
+            VALUES (old.id, old.session_version + 1);
+        END
+    ''')
+
+
+def create_category_counts(conn):
+    """Create the per-category course counts behind the /courses facets."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS category_counts (
+            category TEXT PRIMARY KEY,
+            course_count INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    # Each trigger touches one or two rows, so keeping the counts costs
+    # O(1) per course change and reading them O(categories)
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS category_counts_insert AFTER INSERT ON courses
+        WHEN new.category IS NOT NULL BEGIN
+            INSERT INTO category_counts (category, course_count) VALUES (new.category, 1)
+            ON CONFLICT(category) DO UPDATE SET course_count = course_count + 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS category_counts_delete AFTER DELETE ON courses
+        WHEN old.category IS NOT NULL BEGIN
+            UPDATE category_counts SET course_count = course_count - 1
+            WHERE category = old.category;
+            DELETE FROM category_counts WHERE category = old.category AND course_count <= 0;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS category_counts_update AFTER UPDATE OF category ON courses
+        WHEN new.category IS NOT old.category BEGIN
+            UPDATE category_counts SET course_count = course_count - 1
+            WHERE category = old.category;
+            DELETE FROM category_counts WHERE category = old.category AND course_count <= 0;
+            INSERT INTO category_counts (category, course_count)
+            SELECT new.category, 1 WHERE new.category IS NOT NULL
+            ON CONFLICT(category) DO UPDATE SET course_count = course_count + 1;
+        END
+    ''')
+    rebuild_category_counts(conn)
+
+
+def create_change_counters(conn):
+    """Create the per-table change counters behind the API ETags (see changes.py)."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS change_counters (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    conn.executemany('INSERT OR IGNORE INTO change_counters (name) VALUES (?)',
+                     [(name,) for name in CHANGE_COUNTERS])
+
+
+def _count_completion(sign, row, where):
+    """Trigger statements adding (sign 1) or removing (-1) one completion of ``row``.
+
+    ``where`` finds the student's enrollment ``e``; without one nothing
+    is counted.
+    """
+    bucket = completion_bucket_sql('e.enrolled_at', f'{row}.completed_at')
+    if sign > 0:
+        return f'''
+            INSERT INTO course_stats (course_id, completed_count)
+            SELECT e.course_id, 1 FROM enrollments e WHERE {where}
+            ON CONFLICT(course_id) DO UPDATE SET completed_count = completed_count + 1;
+            INSERT INTO course_completion_times (course_id, bucket, completion_count)
+            SELECT e.course_id, {bucket}, 1 FROM enrollments e WHERE {where}
+            ON CONFLICT(course_id, bucket) DO UPDATE SET completion_count = completion_count + 1;
+        '''
+    return f'''
+            UPDATE course_stats SET completed_count = completed_count - 1
+            WHERE course_id = {row}.course_id AND EXISTS (SELECT 1 FROM enrollments e WHERE {where});
+            UPDATE course_completion_times SET completion_count = completion_count - 1
+            WHERE course_id = {row}.course_id
+                AND bucket = (SELECT {bucket} FROM enrollments e WHERE {where});
+            DELETE FROM course_completion_times
+            WHERE course_id = {row}.course_id AND completion_count <= 0;
+        '''
+
+
+def create_course_stats(conn):
+    """Create the per-course statistics behind the admin reports (see reports.py)."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS course_stats (
+            course_id INTEGER PRIMARY KEY,
+            enrolled_count INTEGER NOT NULL DEFAULT 0,
+            completed_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS course_completion_times (
+            course_id INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            completion_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (course_id, bucket)
+        ) WITHOUT ROWID
+    ''')
+    # Like category_counts, each trigger touches a row or two per change.
+    # The triggers reference only their own database's tables, so they
+    # work unchanged in shard files (see storage.shard_schema)
+    old_enrollment = 'e.user_id = old.user_id AND e.course_id = old.course_id'
+    new_enrollment = 'e.user_id = new.user_id AND e.course_id = new.course_id'
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS course_stats_enroll AFTER INSERT ON enrollments BEGIN
+            INSERT INTO course_stats (course_id, enrolled_count, completed_count)
+            SELECT new.course_id, 1, COUNT(*) FROM course_progress p
+            WHERE p.user_id = new.user_id AND p.course_id = new.course_id AND p.completed = 1
+            ON CONFLICT(course_id) DO UPDATE SET
+                enrolled_count = enrolled_count + 1,
+                completed_count = completed_count + excluded.completed_count;
+            INSERT INTO course_completion_times (course_id, bucket, completion_count)
+            SELECT new.course_id, {completion_bucket_sql('new.enrolled_at', 'p.completed_at')}, 1
+            FROM course_progress p
+            WHERE p.user_id = new.user_id AND p.course_id = new.course_id AND p.completed = 1
+            ON CONFLICT(course_id, bucket) DO UPDATE SET completion_count = completion_count + 1;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS course_stats_unenroll AFTER DELETE ON enrollments BEGIN
+            UPDATE course_stats SET
+                enrolled_count = enrolled_count - 1,
+                completed_count = completed_count - (
+                    SELECT COUNT(*) FROM course_progress p
+                    WHERE p.user_id = old.user_id AND p.course_id = old.course_id
+                        AND p.completed = 1)
+            WHERE course_id = old.course_id;
+            UPDATE course_completion_times SET completion_count = completion_count - 1
+            WHERE course_id = old.course_id AND bucket = (
+                SELECT {completion_bucket_sql('old.enrolled_at', 'p.completed_at')}
+                FROM course_progress p
+                WHERE p.user_id = old.user_id AND p.course_id = old.course_id
+                    AND p.completed = 1);
+            DELETE FROM course_completion_times
+            WHERE course_id = old.course_id AND completion_count <= 0;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS course_stats_complete AFTER INSERT ON course_progress
+        WHEN new.completed = 1 BEGIN
+            {_count_completion(1, 'new', new_enrollment)}
+        END
+    ''')
+    # A completion whose time changes is taken out and counted again
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS course_stats_uncomplete
+        AFTER UPDATE OF completed, completed_at ON course_progress
+        WHEN old.completed = 1 BEGIN
+            {_count_completion(-1, 'old', old_enrollment)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS course_stats_recomplete
+        AFTER UPDATE OF completed, completed_at ON course_progress
+        WHEN new.completed = 1 BEGIN
+            {_count_completion(1, 'new', new_enrollment)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS course_stats_progress_delete AFTER DELETE ON course_progress
+        WHEN old.completed = 1 BEGIN
+            {_count_completion(-1, 'old', old_enrollment)}
+        END
+    ''')
+    rebuild_course_stats(conn)
+
+
+def create_pending_schema_restores(conn):
+    """Create the table where bulk loads park the indexes and triggers they drop (see bulk.py)."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pending_schema_restores (
+            name TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            sql TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+
+# Append new migrations at the end; never renumber or edit applied ones
+MIGRATIONS = [
+    Migration(1, 'create courses table', create_courses_table),
+    Migration(2, 'create users table', create_users_table),
+    Migration(3, 'add users.is_admin', add_is_admin_column),
+    Migration(4, 'add courses.video_url', add_video_url_column),
+    Migration(5, 'create course_progress table', create_course_progress_table),
+    Migration(6, 'add courses.category', add_category_column),
+    Migration(7, 'create enrollments table', create_enrollments_table),
+    Migration(8, 'create courses_fts search index', create_course_search_index),
+    Migration(9, 'create progress summary tables', create_progress_summary),
+    Migration(10, 'add hot query indexes', add_hot_query_indexes),
+    Migration(11, 'create related_courses table', create_related_courses_table),
+    Migration(12, 'add courses.embed_url', add_embed_url_column),
+    Migration(13, 'add users.session_version', add_session_version),
+    Migration(14, 'create category_counts table', create_category_counts),
+    Migration(15, 'create change_counters table', create_change_counters),
+    Migration(16, 'create course statistics tables', create_course_stats),
+    Migration(17, 'create pending_schema_restores table', create_pending_schema_restores),
+]
+
+# The queries the busiest routes run, with sample parameters for EXPLAIN
+HOT_QUERIES = [
+    ('/courses?category=', 'SELECT id, title FROM courses WHERE category = ? ORDER BY id LIMIT 21',
+     ('Design',)),
+    ('/course/<id>', 'SELECT * FROM courses WHERE id = ?', (1,)),
+    ('/course/<id> related', '''SELECT c.id, c.title FROM related_courses r
+        JOIN courses c ON c.id = r.related_id WHERE r.course_id = ? ORDER BY r.position''',
+     (1,)),
+    ('/course/<id> enrolled', 'SELECT id FROM enrollments WHERE user_id = ? AND course_id = ?',
+     (1, 1)),
+    ('/dashboard courses', '''SELECT c.id, c.title, cp.completed, cp.completed_at
+        FROM course_progress cp JOIN courses c ON c.id = cp.course_id
+        WHERE cp.user_id = ? ORDER BY cp.completed_at DESC, c.id''', (1,)),
+    ('/dashboard counts', '''SELECT COUNT(CASE WHEN completed = 1 THEN 1 END)
+        FROM course_progress WHERE user_id = ? AND completed IN (0, 1)''', (1,)),
+    ('/courses facets', 'SELECT category, course_count FROM category_counts ORDER BY category', ()),
+    ('/delete-course enrollments', 'SELECT user_id FROM enrollments WHERE course_id = ?', (1,)),
+    ('/admin/reports', '''SELECT course_id, SUM(enrolled_count), SUM(completed_count)
+        FROM course_stats GROUP BY course_id''', ()),
+]
+
+
+def ensure_version_table(conn):
+    """Create the schema_version bookkeeping table."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def current_version(conn):
+    """Return the highest applied migration version (0 for a new database)."""
+    if not table_exists(conn, 'schema_version'):
+        return 0
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def pending_migrations(conn):
+    """Return the migrations that have not been applied yet, in order."""
+    version = current_version(conn)
+    return [migration for migration in MIGRATIONS if migration.version > version]
+
+
+def migrate(conn, verbose=True):
+    """Apply every pending migration, each in its own transaction.
+
+    Returns the list of applied migrations. On failure the failing
+    migration is rolled back and the error is raised. Afterwards any
+    indexes and triggers an interrupted bulk load left dropped are
+    recreated (see bulk.py).
+    """
+    conn.isolation_level = None  # We issue BEGIN/COMMIT ourselves
+    ensure_version_table(conn)
+    applied = []
+    for migration in pending_migrations(conn):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            migration.apply(conn)
+            conn.execute(
+                'INSERT INTO schema_version (version, name) VALUES (?, ?)',
+                (migration.version, migration.name)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            if verbose:
+                print(f"❌ Migration {migration.version} ({migration.name}) failed, rolled back.")
+            raise
+        applied.append(migration)
+        if verbose:
+            print(f"✅ Applied migration {migration.version}: {migration.name}")
+
+    # A bulk load that died mid-way left indexes and triggers dropped
+    if table_exists(conn, 'pending_schema_restores'):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            restored = restore_pending_schema(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if restored and verbose:
+            print(f"✅ Restored {restored} indexes and triggers left dropped by a bulk load")
+    return applied
+
+
+def explain_hot_queries(conn):
+    """Return ``(label, plan lines)`` for each hot query on this connection."""
+    plans = []
+    for label, sql, params in HOT_QUERIES:
+        try:
+            rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+            plans.append((label, [row[3] for row in rows]))
+        except sqlite3.OperationalError as e:
+            plans.append((label, [f'(not available: {e})']))
+    return plans
+
+
+def dry_run(conn):
+    """Print pending migrations and hot query plans before and after them.
+
+    The migrations run on an in-memory copy of the database, so the real
+    file is not modified.
+    """
+    copy = sqlite3.connect(':memory:')
+    conn.backup(copy)
+
+    pending = pending_migrations(copy)
+    print(f"Schema version: {current_version(copy)}")
+    if not pending:
+        print("ℹ️  No pending migrations.")
+    for migration in pending:
+        print(f"  pending {migration.version}: {migration.name}")
+
+    before = explain_hot_queries(copy)
+    migrate(copy, verbose=False)
+    after = explain_hot_queries(copy)
+    copy.close()
+
+    for (label, old_plan), (_, new_plan) in zip(before, after):
+        print(f"\n{label}")
+        for line in old_plan:
+            print(f"  before: {line}")
+        for line in new_plan:
+            print(f"  after:  {line}")
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description='Apply LMS database migrations.')
+    parser.add_argument('--db', default=DB_NAME, help='database file (default: lms.db)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='show pending migrations and query plans without changing anything')
+    args = parser.parse_args()
+
+    print(f"Connecting to database: {args.db}")
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.dry_run:
+            dry_run(conn)
+        elif not migrate(conn):
+            print("ℹ️  Database is already up to date.")
+    finally:
+        conn.close()
+    print("Database connection closed.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Per-user progress counters behind the dashboard.
+
+The counters live in the materialized ``user_progress_summary`` table
+(migration 9 in migrations.py). The enroll, toggle-complete and delete-course
+routes update them inside their own write transactions, so the dashboard
+reads a single row instead of counting progress rows.
+"""
+from catalogue import COURSE_CARD_COLUMNS, LazyRows
+
+# Backfill (or repair) every user's counters from the source tables.
+# Rows that point at deleted courses are not counted.
+REBUILD_SUMMARY_STATEMENTS = (
+    'DELETE FROM user_progress_summary',
+    '''INSERT INTO user_progress_summary
+        (user_id, enrolled_count, completed_count, in_progress_count, last_activity)
+    SELECT u.id,
+        (SELECT COUNT(*) FROM enrollments e JOIN courses c ON c.id = e.course_id
+         WHERE e.user_id = u.id),
+        (SELECT COUNT(*) FROM course_progress p JOIN courses c ON c.id = p.course_id
+         WHERE p.user_id = u.id AND p.completed = 1),
+        (SELECT COUNT(*) FROM course_progress p JOIN courses c ON c.id = p.course_id
+         WHERE p.user_id = u.id AND p.completed = 0),
+        (SELECT MAX(at) FROM (
+            SELECT enrolled_at AS at FROM enrollments WHERE user_id = u.id
+            UNION ALL
+            SELECT completed_at FROM course_progress WHERE user_id = u.id))
+    FROM users u''',
+    'DELETE FROM catalogue_stats',
+    'INSERT INTO catalogue_stats (id, course_count) SELECT 1, COUNT(*) FROM courses',
+)
+
+# ``at`` is the enrolled_at/completed_at of the rows written (now if None);
+# last_activity keeps the latest of them, as the rebuild does
+_BUMP_SQL = '''
+    INSERT INTO user_progress_summary
+        (user_id, enrolled_count, completed_count, in_progress_count, last_activity)
+    VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+    ON CONFLICT(user_id) DO UPDATE SET
+        enrolled_count = enrolled_count + excluded.enrolled_count,
+        completed_count = completed_count + excluded.completed_count,
+        in_progress_count = in_progress_count + excluded.in_progress_count,
+        last_activity = MAX(COALESCE(last_activity, excluded.last_activity),
+                            excluded.last_activity)
+'''
+
+
+def rebuild_progress_summary(conn):
+    """Recompute every counter from scratch (the caller commits)."""
+    for statement in REBUILD_SUMMARY_STATEMENTS:
+        conn.execute(statement)
+
+
+def record_enrollment(conn, user_id, count=1, at=None):
+    """Count new enrollments. Call only for rows that were actually inserted."""
+    conn.execute(_BUMP_SQL, (user_id, count, 0, 0, at))
+
+
+def record_cohort_enrollment(conn, user_ids):
+    """Count one new enrollment for each of several users."""
+    conn.executemany(_BUMP_SQL, [(user_id, 1, 0, 0, None) for user_id in user_ids])
+
+
+def record_progress_change(conn, user_id, old_status, new_status):
+    """Move a course between the completed and in-progress counters.
+
+    ``old_status`` is None when the progress row is new.
+    """
+    completed = (new_status == 1) - (old_status == 1)
+    in_progress = (new_status == 0) - (old_status == 0)
+    conn.execute(_BUMP_SQL, (user_id, 0, completed, in_progress, None))
+
+
+def record_progress_changes(conn, user_id, changes, at=None):
+    """Apply many ``(old_status, new_status)`` moves for one user in one update."""
+    completed = sum((new == 1) - (old == 1) for old, new in changes)
+    in_progress = sum((new == 0) - (old == 0) for old, new in changes)
+    if changes:
+        conn.execute(_BUMP_SQL, (user_id, 0, completed, in_progress, at))
+
+
+def forget_course(conn, course_id):
+    """Take a course that is about to be deleted out of everyone's counters."""
+    conn.execute('''
+        UPDATE user_progress_summary SET
+            enrolled_count = enrolled_count - (
+                SELECT COUNT(*) FROM enrollments
+                WHERE user_id = user_progress_summary.user_id AND course_id = ?),
+            completed_count = completed_count - (
+                SELECT COUNT(*) FROM course_progress
+                WHERE user_id = user_progress_summary.user_id AND course_id = ? AND completed = 1),
+            in_progress_count = in_progress_count - (
+                SELECT COUNT(*) FROM course_progress
+                WHERE user_id = user_progress_summary.user_id AND course_id = ? AND completed = 0)
+        WHERE user_id IN (
+            SELECT user_id FROM enrollments WHERE course_id = ?
+            UNION
+            SELECT user_id FROM course_progress WHERE course_id = ?)
+    ''', (course_id,) * 5)
+
+
+def get_progress_counts(conn, user_id, use_summary=True):
+    """Return total, enrolled, completed and in-progress counts plus last activity.
+
+    Last activity is the latest enrollment or progress change of the user.
+
+    With ``use_summary`` this is one primary-key lookup on the summary tables.
+    Without it, the same numbers are aggregated from the source tables in a
+    single query.
+    """
+    if use_summary:
+        row = conn.execute('''
+            SELECT (SELECT course_count FROM catalogue_stats WHERE id = 1) AS total_courses,
+                   COALESCE(s.enrolled_count, 0) AS enrolled_count,
+                   COALESCE(s.completed_count, 0) AS completed_count,
+                   COALESCE(s.in_progress_count, 0) AS in_progress_count,
+                   s.last_activity
+            FROM (SELECT ? AS user_id) AS me
+            LEFT JOIN user_progress_summary s ON s.user_id = me.user_id
+        ''', (user_id,)).fetchone()
+    else:
+        row = conn.execute('''
+            SELECT (SELECT COUNT(*) FROM courses) AS total_courses,
+                   (SELECT COUNT(*) FROM enrollments e JOIN courses c ON c.id = e.course_id
+                    WHERE e.user_id = ?1) AS enrolled_count,
+                   COUNT(CASE WHEN p.completed = 1 THEN 1 END) AS completed_count,
+                   COUNT(CASE WHEN p.completed = 0 THEN 1 END) AS in_progress_count,
+                   (SELECT MAX(at) FROM (
+                       SELECT enrolled_at AS at FROM enrollments WHERE user_id = ?1
+                       UNION ALL
+                       SELECT completed_at FROM course_progress WHERE user_id = ?1)
+                   ) AS last_activity
+            FROM course_progress p JOIN courses c ON c.id = p.course_id
+            WHERE p.user_id = ?1
+        ''', (user_id,)).fetchone()
+    return dict(row)
+
+
+def get_progress_courses(conn, user_id):
+    """Return the user's (completed, in_progress) course cards from one query."""
+    rows = conn.execute(f'''
+        SELECT {COURSE_CARD_COLUMNS}, cp.completed, cp.completed_at
+        FROM course_progress cp
+        JOIN courses c ON c.id = cp.course_id
+        WHERE cp.user_id = ?
+        ORDER BY cp.completed_at DESC, c.id
+    ''', (user_id,)).fetchall()
+    completed = [row for row in rows if row['completed'] == 1]
+    in_progress = [row for row in rows if row['completed'] == 0]
+    return completed, in_progress
+
+
+def iter_progress_courses(conn, user_id, completed):
+    """Return the user's completed (1) or in-progress (0) course cards as LazyRows.
+
+    For streamed pages: rows come off the cursor as the template renders
+    them, instead of a list of every card.
+    """
+    return LazyRows(conn.execute(f'''
+        SELECT {COURSE_CARD_COLUMNS}, cp.completed, cp.completed_at
+        FROM course_progress cp
+        JOIN courses c ON c.id = cp.course_id
+        WHERE cp.user_id = ? AND cp.completed = ?
+        ORDER BY cp.completed_at DESC, c.id
+    ''', (user_id, completed)))
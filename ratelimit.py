@@ -0,0 +1,220 @@
+"""Token-bucket rate limits for the login and registration forms.
+
+Every sign-in or registration attempt takes one token from two buckets: one
+for the client's IP address and one for the username it names from that
+address. A bucket holds up to ``capacity`` tokens and refills at
+``capacity`` per ``per`` seconds, so bursts are allowed but a steady stream
+of guesses is held to the refill rate.
+
+The username bucket is keyed on the username *and* the address. Keyed on
+the username alone, anyone could lock a user out by sending a few bad
+passwords for their name. The trade-off: guessers who spread one
+account's attempts over many addresses are held only by the per-address
+limit, times the number of addresses they control.
+
+The check runs before the form touches the database or the hashing pool,
+so a rejected attempt costs a dict lookup (or one small SQLite
+transaction) and a 429.
+
+Buckets live in this process by default (``MemoryBuckets``, bounded by
+``RATE_LIMIT_SIZE``). Each worker then allows its own share, so with N
+workers the effective limit is up to N times higher. Set
+``RATE_LIMIT_DATABASE`` to a file path to keep the buckets in a SQLite file
+shared by every worker on the host instead (``SQLiteBuckets``).
+
+Behind a reverse proxy, wrap the app in werkzeug's ``ProxyFix`` so
+``request.remote_addr`` is the client's address and not the proxy's.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, request
+
+DEFAULT_RATE_LIMIT_PER_IP = (20, 60)  # Attempts per address: burst, refill seconds
+DEFAULT_RATE_LIMIT_PER_USERNAME = (5, 60)  # Attempts per username: burst, refill seconds
+DEFAULT_RATE_LIMIT_SIZE = 10000  # Buckets kept in memory per worker process
+
+
+def _refill(state, capacity, per, now):
+    """Return the tokens in a bucket at ``now``; a missing bucket is full."""
+    if state is None:
+        return float(capacity)
+    tokens, updated_at = state
+    return min(float(capacity), tokens + max(0.0, now - updated_at) * capacity / per)
+
+
+def _take(states, limits, now):
+    """Work out one attempt against every bucket.
+
+    ``states`` are the current ``(tokens, updated_at)`` of the buckets in
+    ``limits`` (None if unknown). Returns ``(retry_after, new_states)``:
+    a retry_after of 0 means allowed, with one token taken from each
+    bucket; otherwise nothing is taken and it is the seconds until every
+    bucket has a token again.
+    """
+    tokens = [_refill(state, capacity, per, now)
+              for state, (_, capacity, per) in zip(states, limits)]
+    retry_after = max((1 - left) * per / capacity
+                      for left, (_, capacity, per) in zip(tokens, limits))
+    if retry_after > 0:
+        return retry_after, None
+    return 0, [(left - 1, now) for left in tokens]
+
+
+class MemoryBuckets:
+    """Token buckets in an LRU dict, for one worker process.
+
+    Past ``max_size`` buckets the least recently used is dropped, which
+    forgets its debt; a full bucket and a missing one are the same.
+    """
+
+    def __init__(self, max_size=DEFAULT_RATE_LIMIT_SIZE):
+        self.max_size = max_size
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, limits, now):
+        """Take a token from every ``(key, capacity, per)`` bucket, or none of them."""
+        with self._lock:
+            states = [self._buckets.get(key) for key, _, _ in limits]
+            retry_after, new_states = _take(states, limits, now)
+            if new_states:
+                for (key, _, _), state in zip(limits, new_states):
+                    self._buckets[key] = state
+                    self._buckets.move_to_end(key)
+                while len(self._buckets) > self.max_size:
+                    self._buckets.popitem(last=False)
+            return retry_after
+
+    def __len__(self):
+        with self._lock:
+            return len(self._buckets)
+
+
+class SQLiteBuckets:
+    """Token buckets in a SQLite file, shared by every worker that opens it.
+
+    Each attempt is one short ``BEGIN IMMEDIATE`` transaction. Buckets
+    that have refilled completely are deleted every ``prune_every`` takes.
+    """
+
+    def __init__(self, path, prune_every=1000):
+        self.path = path
+        self.prune_every = prune_every
+        self._takes = 0
+        self._local = threading.local()
+        self._longest_refill = 0.0
+
+    def _connection(self):
+        # Opened on first use in each thread, and again after a fork
+        conn, pid = getattr(self._local, 'conn', (None, None))
+        if conn is None or pid != os.getpid():
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')  # Losing the last few buckets is fine
+            conn.execute('PRAGMA busy_timeout = 1000')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            self._local.conn = (conn, os.getpid())
+        return conn
+
+    def take(self, limits, now):
+        """Take a token from every ``(key, capacity, per)`` bucket, or none of them."""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            states = [conn.execute('SELECT tokens, updated_at FROM rate_limit_buckets '
+                                   'WHERE key = ?', (key,)).fetchone()
+                      for key, _, _ in limits]
+            retry_after, new_states = _take(states, limits, now)
+            if new_states:
+                conn.executemany('INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated_at) '
+                                 'VALUES (?, ?, ?)',
+                                 [(key, tokens, updated_at) for (key, _, _), (tokens, updated_at)
+                                  in zip(limits, new_states)])
+            self._longest_refill = max(self._longest_refill, *(per for _, _, per in limits))
+            self._takes += 1
+            if self._takes % self.prune_every == 0:
+                conn.execute('DELETE FROM rate_limit_buckets WHERE updated_at < ?',
+                             (now - self._longest_refill,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return retry_after
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM rate_limit_buckets').fetchone()[0]
+
+
+class RateLimiter:
+    """Per-IP and per-(username, IP) limits over a bucket store, with counters."""
+
+    def __init__(self, buckets, per_ip=DEFAULT_RATE_LIMIT_PER_IP,
+                 per_username=DEFAULT_RATE_LIMIT_PER_USERNAME):
+        self.buckets = buckets
+        self.per_ip = tuple(per_ip)
+        self.per_username = tuple(per_username)
+        self.allowed = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def check(self, ip, username):
+        """Count one attempt; return 0 if allowed, else seconds to wait."""
+        limits = [(f'ip:{ip}', *self.per_ip)]
+        if username:
+            # Per address too, so others' failures cannot lock the user out
+            limits.append((f'user:{username.lower()}:{ip}', *self.per_username))
+        retry_after = self.buckets.take(limits, time.time())
+        with self._lock:
+            if retry_after:
+                self.rejected += 1
+            else:
+                self.allowed += 1
+        return retry_after
+
+    def stats(self):
+        """Return the limiter counters as a dict."""
+        with self._lock:
+            return {'allowed': self.allowed, 'rejected': self.rejected,
+                    'buckets': len(self.buckets)}
+
+
+def init_rate_limiter(app):
+    """Create the login/registration rate limiter for an app (``RATE_LIMIT``)."""
+    app.config.setdefault('RATE_LIMIT', True)
+    app.config.setdefault('RATE_LIMIT_PER_IP', DEFAULT_RATE_LIMIT_PER_IP)
+    app.config.setdefault('RATE_LIMIT_PER_USERNAME', DEFAULT_RATE_LIMIT_PER_USERNAME)
+    app.config.setdefault('RATE_LIMIT_SIZE', DEFAULT_RATE_LIMIT_SIZE)
+    app.config.setdefault('RATE_LIMIT_DATABASE', '')
+    if not app.config['RATE_LIMIT']:
+        return
+
+    if app.config['RATE_LIMIT_DATABASE']:
+        buckets = SQLiteBuckets(app.config['RATE_LIMIT_DATABASE'])
+    else:
+        buckets = MemoryBuckets(app.config['RATE_LIMIT_SIZE'])
+    app.extensions['lms_rate_limiter'] = RateLimiter(buckets, app.config['RATE_LIMIT_PER_IP'],
+                                                     app.config['RATE_LIMIT_PER_USERNAME'])
+
+
+def check_rate_limit(username):
+    """Count a form submission for this client and username.
+
+    Returns 0 if it may go ahead, else the whole seconds to wait (for a
+    Retry-After header). Always 0 with ``RATE_LIMIT`` off.
+    """
+    limiter = current_app.extensions.get('lms_rate_limiter')
+    if limiter is None:
+        return 0
+    retry_after = limiter.check(request.remote_addr, username)
+    return math.ceil(retry_after) if retry_after else 0
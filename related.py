@@ -0,0 +1,147 @@
+"""Precomputed related courses for the course detail page.
+
+The ``related_courses`` table holds each course's related list, already
+ranked: courses that share the most enrolled students come first, and
+courses from the same category fill the remaining slots. The detail page
+reads it with one primary-key range lookup. The admin course routes keep it
+current, and ``rebuild_related_courses`` recomputes everything (for example
+from a nightly job, as co-enrollments change).
+
+Usage:
+    python related.py [--db lms.db] [--shard shard0.db ...]   # rebuild every related list
+"""
+
+import argparse
+from catalogue import COURSE_CARD_COLUMNS
+from changes import record_change
+from storage import connect_with_shards
+
+DB_NAME = 'lms.db'
+RELATED_LIMIT = 4
+
+
+def compute_related(conn, course_id, limit=RELATED_LIMIT):
+    """Return ``[(related_id, score), ...]`` for one course, best first.
+
+    The score is the number of students enrolled in both courses; category
+    fallbacks score 0.
+    """
+    related = conn.execute('''
+        SELECT other.course_id, COUNT(*) AS shared_students
+        FROM enrollments mine
+        JOIN enrollments other
+            ON other.user_id = mine.user_id AND other.course_id != mine.course_id
+        JOIN courses c ON c.id = other.course_id
+        WHERE mine.course_id = ?
+        GROUP BY other.course_id
+        ORDER BY shared_students DESC, other.course_id
+        LIMIT ?
+    ''', (course_id, limit)).fetchall()
+    related = [(row[0], row[1]) for row in related]
+
+    if len(related) < limit:
+        taken = [course_id] + [related_id for related_id, _ in related]
+        placeholders = ', '.join('?' for _ in taken)
+        same_category = conn.execute(f'''
+            SELECT c.id FROM courses c
+            WHERE c.category = (SELECT category FROM courses WHERE id = ?)
+              AND c.id NOT IN ({placeholders})
+            ORDER BY c.id
+            LIMIT ?
+        ''', (course_id, *taken, limit - len(related))).fetchall()
+        related += [(row[0], 0) for row in same_category]
+    return related
+
+
+def refresh_related(conn, course_id, limit=RELATED_LIMIT):
+    """Recompute the stored related list of one course."""
+    conn.execute('DELETE FROM related_courses WHERE course_id = ?', (course_id,))
+    conn.executemany(
+        'INSERT INTO related_courses (course_id, position, related_id, score) VALUES (?, ?, ?, ?)',
+        [(course_id, position, related_id, score)
+         for position, (related_id, score) in enumerate(compute_related(conn, course_id, limit))]
+    )
+
+
+def _courses_to_refresh(conn, course_id, categories, limit):
+    """Find the lists a change to one course can affect."""
+    # Lists that currently show the course
+    affected = {row[0] for row in conn.execute(
+        'SELECT course_id FROM related_courses WHERE related_id = ?', (course_id,)
+    )}
+    # Lists in these categories the course could now join: ones with free
+    # slots, and ones whose category fallbacks rank below it (higher ids)
+    for category in categories:
+        affected.update(row[0] for row in conn.execute('''
+            SELECT c.id FROM courses c
+            WHERE c.category = ?
+              AND ((SELECT COUNT(*) FROM related_courses r WHERE r.course_id = c.id) < ?
+                   OR EXISTS (SELECT 1 FROM related_courses r
+                              WHERE r.course_id = c.id AND r.score = 0 AND r.related_id > ?))
+        ''', (category, limit, course_id)))
+    affected.discard(course_id)
+    return affected
+
+
+def course_saved(conn, course_id, old_category=None, limit=RELATED_LIMIT):
+    """Update related lists after a course is added or edited.
+
+    Pass ``old_category`` on edits so lists in the course's previous
+    category are refreshed too.
+    """
+    category = conn.execute('SELECT category FROM courses WHERE id = ?', (course_id,)).fetchone()
+    categories = {category[0]} if category else set()
+    if old_category is not None:
+        categories.add(old_category)
+    refresh_related(conn, course_id, limit)
+    for other_id in _courses_to_refresh(conn, course_id, categories, limit):
+        refresh_related(conn, other_id, limit)
+
+
+def course_deleted(conn, course_id, limit=RELATED_LIMIT):
+    """Update related lists after a course is deleted."""
+    conn.execute('DELETE FROM related_courses WHERE course_id = ?', (course_id,))
+    for other_id in _courses_to_refresh(conn, course_id, (), limit):
+        refresh_related(conn, other_id, limit)
+
+
+def rebuild_related_courses(conn, limit=RELATED_LIMIT):
+    """Recompute every course's related list (the caller commits)."""
+    conn.execute('DELETE FROM related_courses')
+    course_ids = [row[0] for row in conn.execute('SELECT id FROM courses')]
+    for course_id in course_ids:
+        refresh_related(conn, course_id, limit)
+
+
+def get_related_courses(conn, course_id):
+    """Return the stored related course cards for a course, best first."""
+    return conn.execute(f'''
+        SELECT {COURSE_CARD_COLUMNS}
+        FROM related_courses r
+        JOIN courses c ON c.id = r.related_id
+        WHERE r.course_id = ?
+        ORDER BY r.position
+    ''', (course_id,)).fetchall()
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description='Rebuild the related courses table.')
+    parser.add_argument('--db', default=DB_NAME, help='database file (default: lms.db)')
+    parser.add_argument('--shard', action='append', default=[],
+                        help='enrollment shard file, in DB_SHARDS order (repeatable)')
+    args = parser.parse_args()
+
+    # Co-enrollments are read across every shard (see storage.fan_in_views)
+    conn = connect_with_shards(args.db, args.shard)
+    try:
+        rebuild_related_courses(conn)
+        record_change(conn, 'courses')  # Course details list their related courses
+        conn.commit()
+    finally:
+        conn.close()
+    print("✅ Related courses rebuilt.")
+
+
+if __name__ == '__main__':
+    main()
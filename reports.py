@@ -0,0 +1,173 @@
+"""Per-course enrollment and completion statistics for the admin reports.
+
+Two tables (migration 16) hold the aggregates, so the reports never scan
+the progress tables:
+
+- ``course_stats``: enrolled and completed students per course
+- ``course_completion_times``: a histogram per course of the time from
+  ``enrolled_at`` to ``completed_at``, in ``COMPLETION_BUCKET_HOURS``
+  buckets, from which the median is estimated
+
+Triggers on ``enrollments`` and ``course_progress`` keep both current, so
+the enroll and toggle-complete routes, the batch API, write-behind and
+bulk imports all update them in their own transactions, one or two rows
+per change. A completion counts once the student is enrolled in the
+course too. With ``DB_SHARDS`` each shard counts its own users and the
+reports add the shards up through the fan-in views (see storage.py).
+
+``rebuild_course_stats`` recomputes everything from the source tables,
+for repairs (for example from a nightly job).
+
+Usage:
+    python reports.py [--db lms.db] [--shard shard0.db ...]   # rebuild the aggregates
+"""
+
+import argparse
+import csv
+import io
+import sqlite3
+
+DB_NAME = 'lms.db'
+
+# Upper bounds of the completion time buckets, in hours (1 hour to 1
+# year); bucket i holds times below bound i, the last one everything longer
+COMPLETION_BUCKET_HOURS = (1, 6, 24, 72, 168, 336, 720, 2160, 4320, 8760)
+
+# Columns of the CSV export, in order
+REPORT_FIELDS = ['course_id', 'title', 'category', 'enrolled_count', 'completed_count',
+                 'completion_rate', 'median_completion_hours']
+
+
+def completion_bucket_sql(enrolled_at, completed_at):
+    """Return a SQL expression for the bucket of a completion time.
+
+    Missing timestamps and completions before the enrollment fall in the
+    first bucket.
+    """
+    hours = f'(julianday({completed_at}) - julianday({enrolled_at})) * 24'
+    steps = ' '.join(f'WHEN {hours} < {bound} THEN {index}'
+                     for index, bound in enumerate(COMPLETION_BUCKET_HOURS))
+    return (f'CASE WHEN {hours} IS NULL THEN 0 {steps} '
+            f'ELSE {len(COMPLETION_BUCKET_HOURS)} END')
+
+
+def rebuild_course_stats(conn):
+    """Recompute both aggregate tables from scratch (the caller commits)."""
+    conn.execute('DELETE FROM course_stats')
+    conn.execute('DELETE FROM course_completion_times')
+    conn.execute('''
+        INSERT INTO course_stats (course_id, enrolled_count, completed_count)
+        SELECT e.course_id, COUNT(*), COUNT(p.id)
+        FROM enrollments e
+        LEFT JOIN course_progress p
+            ON p.user_id = e.user_id AND p.course_id = e.course_id AND p.completed = 1
+        GROUP BY e.course_id
+    ''')
+    conn.execute(f'''
+        INSERT INTO course_completion_times (course_id, bucket, completion_count)
+        SELECT e.course_id, {completion_bucket_sql('e.enrolled_at', 'p.completed_at')}, COUNT(*)
+        FROM enrollments e
+        JOIN course_progress p
+            ON p.user_id = e.user_id AND p.course_id = e.course_id AND p.completed = 1
+        GROUP BY 1, 2
+    ''')
+
+
+def estimate_median(histogram):
+    """Estimate the median hours from ``{bucket: count}``, or None if it is empty.
+
+    The median is interpolated linearly within its bucket; in the last,
+    open bucket it is that bucket's lower bound.
+    """
+    total = sum(histogram.values())
+    if not total:
+        return None
+    half = total / 2
+    below = 0
+    for bucket in sorted(histogram):
+        count = histogram[bucket]
+        if below + count >= half:
+            lower = COMPLETION_BUCKET_HOURS[bucket - 1] if bucket else 0
+            if bucket >= len(COMPLETION_BUCKET_HOURS):
+                return float(lower)
+            upper = COMPLETION_BUCKET_HOURS[bucket]
+            return lower + (half - below) / count * (upper - lower)
+        below += count
+    return None
+
+
+def get_course_stats(conn):
+    """Return every course's statistics as dicts, most enrolled first.
+
+    Reads the aggregate tables only: two grouped scans, whatever the
+    number of enrollments.
+    """
+    histograms = {}
+    for course_id, bucket, count in conn.execute('''
+        SELECT course_id, bucket, SUM(completion_count)
+        FROM course_completion_times GROUP BY course_id, bucket
+    '''):
+        histograms.setdefault(course_id, {})[bucket] = count
+
+    rows = conn.execute('''
+        SELECT c.id AS course_id, c.title, c.category,
+               COALESCE(s.enrolled_count, 0) AS enrolled_count,
+               COALESCE(s.completed_count, 0) AS completed_count
+        FROM courses c
+        LEFT JOIN (
+            SELECT course_id, SUM(enrolled_count) AS enrolled_count,
+                   SUM(completed_count) AS completed_count
+            FROM course_stats GROUP BY course_id
+        ) s ON s.course_id = c.id
+        ORDER BY enrolled_count DESC, c.id
+    ''')
+    stats = []
+    for row in rows:
+        course = dict(zip(('course_id', 'title', 'category', 'enrolled_count', 'completed_count'),
+                          row))
+        enrolled = course['enrolled_count']
+        course['completion_rate'] = course['completed_count'] / enrolled if enrolled else 0.0
+        course['median_completion_hours'] = estimate_median(histograms.get(course['course_id'], {}))
+        stats.append(course)
+    return stats
+
+
+def iter_stats_csv(stats):
+    """Yield the statistics as CSV text, a header and then one line per course."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=REPORT_FIELDS)
+    writer.writeheader()
+    for course in stats:
+        writer.writerow({
+            **course,
+            'completion_rate': f"{course['completion_rate']:.4f}",
+            'median_completion_hours': ('' if course['median_completion_hours'] is None
+                                        else f"{course['median_completion_hours']:.1f}"),
+        })
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description='Rebuild the per-course statistics.')
+    parser.add_argument('--db', default=DB_NAME, help='database file (default: lms.db)')
+    parser.add_argument('--shard', action='append', default=[],
+                        help='enrollment shard file, in DB_SHARDS order (repeatable)')
+    args = parser.parse_args()
+
+    # Each file counts the enrollments it holds; after split-shards the
+    # primary's aggregates are empty
+    for path in [args.db] + args.shard:
+        conn = sqlite3.connect(path)
+        try:
+            rebuild_course_stats(conn)
+            conn.commit()
+        finally:
+            conn.close()
+    print(f"✅ Course statistics rebuilt in {1 + len(args.shard)} database file(s).")
+
+
+if __name__ == '__main__':
+    main()
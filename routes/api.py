@@ -0,0 +1,245 @@
+"""JSON batch endpoints for LMS integrations.
+
+Each endpoint takes a whole batch in one request and writes it in a single
+transaction with upserts, instead of one form POST (and one commit) per
+course. Id lists are passed to SQLite as one JSON array and expanded with
+``json_each``, so batch size does not hit the bound-parameter limit.
+
+Enrollments and progress are written where the user's rows live (see
+``database.run_user_write``); a cohort spread over several shards is
+written one shard transaction at a time. With ``WRITE_BEHIND`` on, the
+queued clicks are committed first, so an older click cannot land after
+the batch and overwrite it.
+"""
+
+import json
+from functools import wraps
+from flask import jsonify, request
+from changes import record_change
+from database import run_user_write, split_by_shard
+from helpers import get_current_user
+from progress import record_cohort_enrollment, record_enrollment, record_progress_changes
+from writebehind import DEFAULT_WRITE_BEHIND_WAIT, get_write_behind
+
+DEFAULT_API_MAX_BATCH = 5000  # Items accepted per request
+
+
+class BadRequest(Exception):
+    """A batch payload that cannot be processed; becomes a JSON error reply."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _error(message, status):
+    return jsonify({'error': message}), status
+
+
+def _is_id(value):
+    """Check for an integer id; JSON true and false are not ids."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _id_list(payload, key, max_batch):
+    """Read a list of integer ids from the payload, without duplicates."""
+    ids = payload.get(key)
+    if not isinstance(ids, list) or not ids:
+        raise BadRequest(f"'{key}' must be a non-empty list of ids")
+    if len(ids) > max_batch:
+        raise BadRequest(f"At most {max_batch} items per request", 413)
+    if not all(_is_id(item) for item in ids):
+        raise BadRequest(f"'{key}' must contain integer ids only")
+    return list(dict.fromkeys(ids))
+
+
+def _target_user_id(payload, user):
+    """Admins may act for another user with 'user_id'; others only for themselves."""
+    user_id = payload.get('user_id', user.id)
+    if user_id != user.id and not user.is_admin:
+        raise BadRequest('Only admins can update other users', 403)
+    if not _is_id(user_id):
+        raise BadRequest("'user_id' must be an integer")
+    return user_id
+
+
+def _check_user(conn, user_id, user):
+    """Make sure a user acted for by an admin exists."""
+    if user_id != user.id and not _existing_ids(conn, 'users', [user_id]):
+        raise BadRequest('User not found', 404)
+
+
+def _commit_queued(user_id=None):
+    """Commit a user's (or, without ``user_id``, everyone's) write-behind events."""
+    write_behind = get_write_behind()
+    if write_behind is None:
+        return
+    if user_id is None:
+        done = write_behind.flush(DEFAULT_WRITE_BEHIND_WAIT)
+    else:
+        done = write_behind.wait_for_user(user_id)
+    if not done:
+        raise BadRequest('Earlier changes are still being saved; try again shortly', 503)
+
+
+def _existing_ids(conn, table, ids):
+    """Return the subset of ``ids`` that exist in ``table``."""
+    return {row[0] for row in conn.execute(
+        f'SELECT id FROM {table} WHERE id IN (SELECT value FROM json_each(?))',
+        (json.dumps(ids),)
+    )}
+
+
+def register_api_routes(app):
+    """Register the JSON batch endpoints."""
+    app.config.setdefault('API_MAX_BATCH', DEFAULT_API_MAX_BATCH)
+
+    def batch_endpoint(view):
+        """Common checks: JSON body, signed-in user, BadRequest handling."""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            user = get_current_user()
+            if user is None:
+                return _error('Login required', 401)
+            payload = request.get_json(silent=True)
+            if not isinstance(payload, dict):
+                return _error('Expected a JSON object body', 415 if not request.is_json else 400)
+            try:
+                return jsonify(view(user, payload, *args, **kwargs))
+            except BadRequest as error:
+                return _error(str(error), error.status)
+        return wrapper
+
+    @app.route('/api/enrollments', methods=['POST'])
+    @batch_endpoint
+    def api_enroll(user, payload):
+        """Enroll a user in many courses: {"course_ids": [...], "user_id": optional}.
+
+        Already-enrolled courses are left alone; unknown course ids are
+        reported back.
+        """
+        user_id = _target_user_id(payload, user)
+        course_ids = _id_list(payload, 'course_ids', app.config['API_MAX_BATCH'])
+
+        def enroll(conn):
+            _check_user(conn, user_id, user)
+            inserted = [row[0] for row in conn.execute('''
+                INSERT INTO enrollments (user_id, course_id)
+                SELECT ?, c.id FROM courses c
+                WHERE c.id IN (SELECT value FROM json_each(?))
+                ON CONFLICT(user_id, course_id) DO NOTHING
+                RETURNING course_id
+            ''', (user_id, json.dumps(course_ids)))]
+            if inserted:
+                record_change(conn, 'progress')
+            if inserted and app.config['PROGRESS_SUMMARY']:
+                record_enrollment(conn, user_id, len(inserted))
+            return inserted, _existing_ids(conn, 'courses', course_ids)
+
+        _commit_queued(user_id)
+        inserted, existing = run_user_write(user_id, enroll)
+        inserted = set(inserted)
+        return {
+            'user_id': user_id,
+            'enrolled': [course_id for course_id in course_ids if course_id in inserted],
+            'already_enrolled': [course_id for course_id in course_ids
+                                 if course_id in existing and course_id not in inserted],
+            'unknown_courses': [course_id for course_id in course_ids if course_id not in existing],
+        }
+
+    @app.route('/api/progress', methods=['POST'])
+    @batch_endpoint
+    def api_progress(user, payload):
+        """Set completion for many courses: {"progress": [{"course_id": 1, "completed": true}, ...]}.
+
+        Unlike the toggle button this sets an explicit state, so replaying a
+        sync is harmless. Unchanged rows keep their completed_at.
+        """
+        user_id = _target_user_id(payload, user)
+        items = payload.get('progress')
+        if not isinstance(items, list) or not items:
+            raise BadRequest("'progress' must be a non-empty list")
+        if len(items) > app.config['API_MAX_BATCH']:
+            raise BadRequest(f"At most {app.config['API_MAX_BATCH']} items per request", 413)
+        statuses = {}
+        for item in items:
+            if not isinstance(item, dict) or not _is_id(item.get('course_id')) \
+                    or not isinstance(item.get('completed'), bool):
+                raise BadRequest("Each progress item needs an integer 'course_id' "
+                                 "and a boolean 'completed'")
+            statuses[item['course_id']] = int(item['completed'])  # Last one wins
+        course_ids = list(statuses)
+
+        def save_progress(conn):
+            _check_user(conn, user_id, user)
+            existing = _existing_ids(conn, 'courses', course_ids)
+            old = {row[0]: row[1] for row in conn.execute('''
+                SELECT course_id, completed FROM course_progress
+                WHERE user_id = ? AND course_id IN (SELECT value FROM json_each(?))
+            ''', (user_id, json.dumps(course_ids)))}
+            changed = [course_id for course_id in course_ids
+                       if course_id in existing and old.get(course_id) != statuses[course_id]]
+            conn.executemany('''
+                INSERT INTO course_progress (user_id, course_id, completed) VALUES (?, ?, ?)
+                ON CONFLICT(user_id, course_id) DO UPDATE SET
+                    completed = excluded.completed,
+                    completed_at = CURRENT_TIMESTAMP
+            ''', [(user_id, course_id, statuses[course_id]) for course_id in changed])
+            if changed:
+                record_change(conn, 'progress')
+            if app.config['PROGRESS_SUMMARY']:
+                record_progress_changes(conn, user_id, [
+                    (old.get(course_id), statuses[course_id]) for course_id in changed
+                ])
+            return changed, existing
+
+        _commit_queued(user_id)
+        changed, existing = run_user_write(user_id, save_progress)
+        return {
+            'user_id': user_id,
+            'updated': changed,
+            'unchanged': [course_id for course_id in course_ids
+                          if course_id in existing and course_id not in changed],
+            'unknown_courses': [course_id for course_id in course_ids if course_id not in existing],
+        }
+
+    @app.route('/api/courses/<int:course_id>/cohort', methods=['POST'])
+    @batch_endpoint
+    def api_enroll_cohort(user, payload, course_id):
+        """Admin only: enroll many users in one course: {"user_ids": [...]}."""
+        if not user.is_admin:
+            raise BadRequest('Admin only', 403)
+        user_ids = _id_list(payload, 'user_ids', app.config['API_MAX_BATCH'])
+
+        def enroll_cohort(shard_user_ids):
+            def enroll(conn):
+                if not _existing_ids(conn, 'courses', [course_id]):
+                    raise BadRequest('Course not found', 404)
+                inserted = [row[0] for row in conn.execute('''
+                    INSERT INTO enrollments (user_id, course_id)
+                    SELECT u.id, ? FROM users u
+                    WHERE u.id IN (SELECT value FROM json_each(?))
+                    ON CONFLICT(user_id, course_id) DO NOTHING
+                    RETURNING user_id
+                ''', (course_id, json.dumps(shard_user_ids)))]
+                if inserted:
+                    record_change(conn, 'progress')
+                if inserted and app.config['PROGRESS_SUMMARY']:
+                    record_cohort_enrollment(conn, inserted)
+                return inserted, _existing_ids(conn, 'users', shard_user_ids)
+            return enroll
+
+        _commit_queued()
+        inserted, existing = set(), set()
+        for _, shard_user_ids in split_by_shard(user_ids):
+            shard_inserted, shard_existing = run_user_write(shard_user_ids[0],
+                                                            enroll_cohort(shard_user_ids))
+            inserted.update(shard_inserted)
+            existing.update(shard_existing)
+        return {
+            'course_id': course_id,
+            'enrolled': [user_id for user_id in user_ids if user_id in inserted],
+            'already_enrolled': [user_id for user_id in user_ids
+                                 if user_id in existing and user_id not in inserted],
+            'unknown_users': [user_id for user_id in user_ids if user_id not in existing],
+        }
@@ -1,15 +1,25 @@
 """Authentication routes for the TKA Learning platform."""
 
-import sqlite3
-from flask import request, session, redirect, render_template
-from werkzeug.security import check_password_hash, generate_password_hash
+from flask import request, redirect, render_template
+from database import run_write
+from hashing import HashingBusy, get_hasher
+from helpers import get_db_connection, invalidate_user, login_user, logout_user, user_from_row
+from ratelimit import check_rate_limit
 
 
-def _get_db_connection():
-    """Create a private database connection."""
-    db_connection = sqlite3.connect('lms.db')
-    db_connection.row_factory = sqlite3.Row  # This lets us access columns by name
-    return db_connection
+BUSY_MESSAGE = 'Too many sign-ins right now, please try again in a moment.'
+LIMITED_MESSAGE = 'Too many attempts, please try again in {} seconds.'
+
+
+def _busy(template):
+    """Re-render a form with a 503 when the hashing queue is full."""
+    return render_template(template, error=BUSY_MESSAGE), 503, {'Retry-After': '2'}
+
+
+def _limited(template, retry_after):
+    """Re-render a form with a 429 when the client is over its rate limit."""
+    return (render_template(template, error=LIMITED_MESSAGE.format(retry_after)), 429,
+            {'Retry-After': str(retry_after)})
 
 
 def register_auth_routes(flask_app):
@@ -32,17 +42,39 @@ def register_auth_routes(flask_app):
         username = request.form['username']
         password = request.form['password']
 
+        # Turn away rate-limited clients before any database or hash work
+        retry_after = check_rate_limit(username)
+        if retry_after:
+            return _limited('login.html', retry_after)
+
         # Check against database
-        db_connection = _get_db_connection()
+        db_connection = get_db_connection()
         user_row = db_connection.execute(
             'SELECT * FROM users WHERE username = ?',
             (username,)
         ).fetchone()
-        db_connection.close()
 
-        # Verify user exists and password matches
-        if user_row and check_password_hash(user_row['password_hash'], password):
-            session['username'] = username  # Store username in session
+        # Verify user exists and password matches; the hash runs in the
+        # hashing pool, unknown usernames against a dummy hash
+        hasher = get_hasher()
+        try:
+            if user_row:
+                password_ok = hasher.verify_password(user_row['password_hash'], password)
+            else:
+                password_ok = hasher.reject_unknown_user(password)
+
+            # Upgrade hashes made with older parameters while we have the password
+            if password_ok and hasher.needs_rehash(user_row['password_hash']):
+                new_hash = hasher.hash_password(password)
+                run_write(lambda conn: conn.execute(
+                    'UPDATE users SET password_hash = ? WHERE id = ?',
+                    (new_hash, user_row['id'])
+                ))
+        except HashingBusy:
+            return _busy('login.html')
+
+        if password_ok:
+            login_user(user_from_row(user_row))  # Signed id/role claims in the session
             return redirect('/')  # Redirect to home page
 
         # If login fails, re-render form with an error
@@ -61,37 +93,45 @@ def register_auth_routes(flask_app):
         password = request.form['password']
         confirm_password = request.form['confirm_password']
 
+        retry_after = check_rate_limit(username)
+        if retry_after:
+            return _limited('register.html', retry_after)
+
         # Check if passwords match
         if password != confirm_password:
             return render_template('register.html', error='Passwords do not match')
 
         # Check if username already exists
-        db_connection = _get_db_connection()
+        db_connection = get_db_connection()
         existing_user_row = db_connection.execute(
             'SELECT * FROM users WHERE username = ?',
             (username,)
         ).fetchone()
 
         if existing_user_row:
-            db_connection.close()
             return render_template('register.html', error='Username already taken')
 
         # Create new user
-        password_hash = generate_password_hash(password)
-        db_connection.execute(
-            'INSERT INTO users (username, password_hash) VALUES (?, ?)',
+        try:
+            password_hash = get_hasher().hash_password(password)
+        except HashingBusy:
+            return _busy('register.html')
+        user_row = run_write(lambda conn: conn.execute(
+            'INSERT INTO users (username, password_hash) VALUES (?, ?) '
+            'RETURNING id, username, is_admin, session_version',
             (username, password_hash)
-        )
-        db_connection.commit()
-        db_connection.close()
+        ).fetchone())
+        # load_user never caches a missing user; this drops an entry left by a
+        # deleted user of the same name, still within USER_CACHE_TTL
+        invalidate_user(username)
 
         # Log them in automatically
-        session['username'] = username
+        login_user(user_from_row(user_row))
         return redirect('/')
 
     # Logout route
     @flask_app.route('/logout')
     def logout():
         """Logout route"""
-        session.pop('username', None)  # Remove username from session
+        logout_user()  # Clear the session claims
         return redirect('/')
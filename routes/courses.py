@@ -1,85 +1,67 @@
 """Course-related routes."""
 
-import sqlite3
-from urllib.parse import urlparse, parse_qs
-from flask import render_template, session, redirect, request, url_for
-from helpers import is_admin, get_db_connection, get_user_id, is_course_completed
+from flask import abort, render_template, session, redirect, request, url_for
+from cache import cached_page, clear_page_cache
+from changes import record_change
+from database import get_backend, get_user_db, run_shard_writes, run_user_write, run_write
+from helpers import is_admin, get_current_user, get_db_connection, is_course_completed, render_page
+from catalogue import DEFAULT_PAGE_SIZE, category_facets, course_exists, list_courses
+from progress import (
+    forget_course, get_progress_counts, get_progress_courses, iter_progress_courses,
+    record_enrollment, record_progress_change,
+)
+from related import course_deleted, course_saved, get_related_courses
+from search import search_courses
+from video import get_embed_url
+from writebehind import get_write_behind
 
 
 
 
 def register_course_routes(app):
     """Register course routes"""
-
-    def get_youtube_embed_url(video_url):
-        """Converts a standard YouTube URL into an embeddable URL."""
-        if not video_url:
-            return None
-
-        # Parse the URL to get its components
-        parsed_url = urlparse(video_url)
-
-        # Check if it's a standard YouTube 'watch' link
-        if parsed_url.hostname in ('www.youtube.com', 'youtube.com') and \
-        parsed_url.path == '/watch':
-
-            # Parse the query string to get the 'v' parameter (video ID)
-            video_id = parse_qs(parsed_url.query).get('v')
-
-            if video_id:
-                # Return the embeddable URL format
-                return f"https://www.youtube.com/embed/{video_id[0]}"
-
-        # Check if it's a shortened 'youtu.be' link
-        if parsed_url.hostname == 'youtu.be' and parsed_url.path:
-            # The video ID is the path itself (remove leading '/')
-            video_id = parsed_url.path[1:]
-            return f"https://www.youtube.com/embed/{video_id}"
-
-        # If it's already an embed link, or not YouTube, return it (or None)
-        # For now, we'll just handle the main cases.
-        # You could add Vimeo, etc., here later.
-
-        # A simple fallback (less robust)
-        if 'embed' in video_url:
-            return video_url
-
-        return None # Or return video_url if you want to try embedding other things
+    app.config.setdefault('COURSES_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    # Keep the user_progress_summary counters (see migrations.py) current
+    app.config.setdefault('PROGRESS_SUMMARY', False)
+    # Stream the course list and dashboard HTML (see helpers.render_page)
+    app.config.setdefault('STREAM_TEMPLATES', False)
+    app.config.setdefault('STREAM_CHUNK_SIZE', 4096)
 
     @app.route('/courses')
+    @cached_page
     def courses():
         """Courses page route"""
 
         search_query = request.args.get('search', '').strip()
         category_filter = request.args.get('category', '').strip()  # NEW!
 
-        # Connect to database and fetch all courses
+        # Keyset pagination cursors (see catalogue.fetch_page)
+        after = request.args.get('after') or None
+        before = request.args.get('before') or None
+        page_size = app.config['COURSES_PAGE_SIZE']
+
+        # Connect to database and fetch one page of courses
         conn = get_db_connection()
 
         # Build query based on filters
-        if search_query and category_filter:
-            # Both search and category
-            courses_list = conn.execute(
-                'SELECT * FROM courses WHERE (title LIKE ? OR description LIKE ?) AND category = ?',
-                (f'%{search_query}%', f'%{search_query}%', category_filter)
-            ).fetchall()
-        elif search_query:
-            # Just search
-            courses_list = conn.execute(
-                'SELECT * FROM courses WHERE title LIKE ? OR description LIKE ?',
-                (f'%{search_query}%', f'%{search_query}%')
-            ).fetchall()
-        elif category_filter:
-            # Just category filter
-            courses_list = conn.execute(
-                'SELECT * FROM courses WHERE category = ?',
-                (category_filter,)
-            ).fetchall()
+        if search_query:
+            # Ranked full-text search, optionally within one category
+            page = search_courses(conn, search_query, category_filter,
+                                  page_size=page_size, after=after, before=before)
         else:
-            # Show all courses
-            courses_list = conn.execute('SELECT * FROM courses').fetchall()
+            # All courses, or just one category
+            page = list_courses(conn, category_filter,
+                                page_size=page_size, after=after, before=before)
+
+        # Keep the current filters on the next/prev links
+        page_args = {}
+        if search_query:
+            page_args['search'] = search_query
+        if category_filter:
+            page_args['category'] = category_filter
 
-        conn.close()
+        # Filter buttons with course counts (see catalogue.category_facets)
+        categories = category_facets(conn)
 
         user = session.get('username')
         admin = is_admin()
@@ -90,13 +72,18 @@ def register_course_routes(app):
             { "name": "Courses", "url": None } # None for the active page
         ]
 
-        return render_template('courses.html', courses=courses_list,
+        return render_page('courses.html', courses=page.items,
                             username=user, is_admin=admin, 
                             search_query=search_query,
                             category_filter=category_filter,
+                            categories=categories,
+                            next_cursor=page.next_cursor,
+                            prev_cursor=page.prev_cursor,
+                            page_args=page_args,
                             breadcrumbs=breadcrumbs)
 
     @app.route('/course/<int:course_id>')
+    @cached_page
     def course_details(course_id):
         """Course details page route"""
         conn = get_db_connection() 
@@ -105,31 +92,32 @@ def register_course_routes(app):
             (course_id,)
         ).fetchone()
         
-        # Get related courses (same category, exclude current course, limit 4)
+        # Get related courses, precomputed by related.py (co-enrollment first,
+        # then same category)
         related_courses = []
-        if course and course['category']:
-            related_courses = conn.execute(
-                'SELECT * FROM courses WHERE category = ? AND id != ? LIMIT 4',
-                (course['category'], course_id)
-            ).fetchall()
+        if course:
+            related_courses = get_related_courses(conn, course_id)
         
         # --- THIS IS THE NEW LOGIC ---
         is_enrolled = False
         user_id = None
         user = session.get('username')
-        if user:
-            user_id = get_user_id(user)
-            if user_id and course: # Check if user_id and course exist
-                enrollment = conn.execute(
+        current_user = get_current_user()
+        if current_user:
+            user_id = current_user.id
+            if course: # Check if the course exists
+                # Enrollments may live in the user's shard (see database.py)
+                enrollment = get_user_db(user_id).execute(
                     'SELECT id FROM enrollments WHERE user_id = ? AND course_id = ?',
                     (user_id, course_id)
                 ).fetchone()
                 if enrollment:
                     is_enrolled = True
+                elif get_write_behind():
+                    # Enrolled a moment ago, still in the write-behind queue
+                    is_enrolled = get_write_behind().pending_enrollment(user_id, course_id)
         # --- END OF NEW LOGIC ---
 
-        conn.close() # Close after ALL queries
-
         admin = is_admin()
         is_completed = False
         embed_url = None
@@ -138,8 +126,15 @@ def register_course_routes(app):
         if course:
             if user_id: # We already have user_id
                 is_completed = is_course_completed(user_id, course_id)
+                if get_write_behind():
+                    # A toggle still in the write-behind queue wins
+                    pending = get_write_behind().pending_completion(user_id, course_id)
+                    if pending is not None:
+                        is_completed = pending == 1
             
-            embed_url = get_youtube_embed_url(course['video_url'])
+            # Stored when the course is saved; the memoized parser covers
+            # rows written without it
+            embed_url = course['embed_url'] or get_embed_url(course['video_url'])
             breadcrumbs = [
                 { "name": "Home", "url": "/" },
                 { "name": "Courses", "url": "/courses" },
@@ -192,14 +187,16 @@ def register_course_routes(app):
         category = request.form.get('category', 'General')  # Example of additional field
 
         # Insert into database
-        conn = get_db_connection()
-        conn.execute(
-            'INSERT INTO courses (title, description, video_url, category) VALUES (?, ?, ?, ?)',
-            (title, description, video_url, category)
-        )
+        def insert_course(conn):
+            cursor = conn.execute(
+                'INSERT INTO courses (title, description, video_url, embed_url, category) VALUES (?, ?, ?, ?, ?)',
+                (title, description, video_url, get_embed_url(video_url), category)
+            )
+            course_saved(conn, cursor.lastrowid)
+            record_change(conn, 'courses')
 
-        conn.commit()
-        conn.close()
+        run_write(insert_course)
+        clear_page_cache()
 
         return redirect('/courses')
         # Delete course (POST only!)
@@ -210,11 +207,27 @@ def register_course_routes(app):
         if not is_admin():
             return redirect('/login')
 
+        # With shards the counters live next to the enrollments, so they
+        # are adjusted shard by shard once the course is gone
+        sharded = get_backend().sharded
+
         # Delete from database
-        conn = get_db_connection()
-        conn.execute('DELETE FROM courses WHERE id = ?', (course_id,))
-        conn.commit()
-        conn.close()
+        def remove_course(conn):
+            if app.config['PROGRESS_SUMMARY'] and not sharded:
+                forget_course(conn, course_id)
+            conn.execute('DELETE FROM courses WHERE id = ?', (course_id,))
+            course_deleted(conn, course_id)
+            record_change(conn, 'courses')
+
+        def forget_in_shard(conn):
+            if app.config['PROGRESS_SUMMARY']:
+                forget_course(conn, course_id)
+            record_change(conn, 'progress')
+
+        run_write(remove_course)
+        if sharded:
+            run_shard_writes(forget_in_shard)
+        clear_page_cache()
 
         return redirect('/courses')
 
@@ -231,7 +244,6 @@ def register_course_routes(app):
             'SELECT * FROM courses WHERE id = ?',
             (course_id,)
         ).fetchone()
-        conn.close()
 
         # define breadcrumbs
         breadcrumbs = [
@@ -255,13 +267,18 @@ def register_course_routes(app):
         category = request.form.get('category', 'General')  # Adding category field
 
         # Update in database
-        conn = get_db_connection()
-        conn.execute(
-            'UPDATE courses SET title = ?, description = ?, video_url = ?, category = ? WHERE id = ?',
-            (title, description, video_url, category, course_id)
-        )
-        conn.commit()
-        conn.close()
+        def update_course(conn):
+            old = conn.execute('SELECT category FROM courses WHERE id = ?', (course_id,)).fetchone()
+            conn.execute(
+                'UPDATE courses SET title = ?, description = ?, video_url = ?, embed_url = ?, category = ? WHERE id = ?',
+                (title, description, video_url, get_embed_url(video_url), category, course_id)
+            )
+            if old and old['category'] != category:
+                course_saved(conn, course_id, old_category=old['category'])
+            record_change(conn, 'courses')
+
+        run_write(update_course)
+        clear_page_cache()
 
         # Redirect to course detail page (PRG pattern!)
         return redirect(f'/course/{course_id}')
@@ -273,26 +290,38 @@ def register_course_routes(app):
         if 'username' not in session:
             return redirect(url_for('login')) # use url_for for routes
         
-        user_id = get_user_id(session['username'])
-        if not user_id:
+        current_user = get_current_user()
+        if not current_user:
             return redirect(url_for('login'))
+        user_id = current_user.id
+
+        write_behind = get_write_behind()
+        if write_behind:
+            if not course_exists(get_db_connection(), course_id):
+                abort(404)
+            # Committed later by the writer thread; duplicates are skipped there
+            write_behind.enqueue('enroll', user_id, course_id)
+            return redirect(url_for('course_details', course_id=course_id))
         
-        conn = get_db_connection()
-        try:
-            # Try to insert the new enrollment
-            conn.execute(
-                'INSERT INTO enrollments (user_id, course_id) VALUES (?, ?)',
+        def enroll(conn):
+            if not course_exists(conn, course_id):
+                return False
+            # OR IGNORE skips the row if the UNIQUE constraint fails
+            # (meaning the user is already enrolled).
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO enrollments (user_id, course_id) '
+                'SELECT ?, id FROM courses WHERE id = ?',
                 (user_id, course_id)
             )
-            conn.commit()
-        except sqlite3.IntegrityError:
-            # This error fires if the UNIQUE constraint fails
-            # (meaning)the user is already enrolled).
-            # We can just ignore it.
-            pass
-        finally:
-            conn.close()
-            
+            if cursor.rowcount:
+                record_change(conn, 'progress')
+                if app.config['PROGRESS_SUMMARY']:
+                    record_enrollment(conn, user_id)
+            return True
+
+        if not run_user_write(user_id, enroll):
+            abort(404)
+
         # Redirect back to the course page
         return redirect(url_for('course_details', course_id=course_id))
     # Mark course as complete/incomplete
@@ -302,34 +331,58 @@ def register_course_routes(app):
         if 'username' not in session:
             return redirect('/login')
 
-        user_id = get_user_id(session['username'])
-        if not user_id:
+        current_user = get_current_user()
+        if not current_user:
             return redirect('/login')
-
-        conn = get_db_connection()
-
-        # Check if progress record exists
-        existing = conn.execute(
-            'SELECT * FROM course_progress WHERE user_id = ? AND course_id = ?',
-            (user_id, course_id)
-        ).fetchone()
-
-        if existing:
-            # Toggle the completed status
-            new_status = 0 if existing['completed'] == 1 else 1
-            conn.execute(
-                'UPDATE course_progress SET completed = ?,completed_at = CURRENT_TIMESTAMP WHERE user_id = ? AND course_id = ?',
-                (new_status, user_id, course_id)
-            )
-        else:
-            # Create new progress record (marked as complete)
-            conn.execute(
-                'INSERT INTO course_progress (user_id, course_id, completed) VALUES (?, ?, 1)',
+        user_id = current_user.id
+
+        write_behind = get_write_behind()
+        if write_behind:
+            if not course_exists(get_db_connection(), course_id):
+                abort(404)
+            # Queue the resulting state rather than a toggle, so replays are safe
+            current = write_behind.pending_completion(user_id, course_id)
+            if current is None:
+                current = 1 if is_course_completed(user_id, course_id) else 0
+            write_behind.enqueue('progress', user_id, course_id, completed=1 - current)
+            return redirect(f'/course/{course_id}')
+
+        def toggle_progress(conn):
+            # Counters only cover existing courses (see progress.py)
+            if not course_exists(conn, course_id):
+                return False
+
+            # Check if progress record exists
+            existing = conn.execute(
+                'SELECT * FROM course_progress WHERE user_id = ? AND course_id = ?',
                 (user_id, course_id)
-            )
+            ).fetchone()
+
+            if existing:
+                # Toggle the completed status
+                old_status = existing['completed']
+                new_status = 0 if old_status == 1 else 1
+                conn.execute(
+                    'UPDATE course_progress SET completed = ?,completed_at = CURRENT_TIMESTAMP WHERE user_id = ? AND course_id = ?',
+                    (new_status, user_id, course_id)
+                )
+            else:
+                # Create new progress record (marked as complete)
+                old_status, new_status = None, 1
+                conn.execute(
+                    'INSERT INTO course_progress (user_id, course_id, completed) '
+                    'SELECT ?, id, 1 FROM courses WHERE id = ?',
+                    (user_id, course_id)
+                )
+
+            record_change(conn, 'progress')
+            if app.config['PROGRESS_SUMMARY']:
+                record_progress_change(conn, user_id, old_status, new_status)
+            return True
 
-        conn.commit()
-        conn.close()
+        # The read and the write share one locked transaction
+        if not run_user_write(user_id, toggle_progress):
+            abort(404)
 
         return redirect(f'/course/{course_id}')
 
@@ -340,46 +393,38 @@ def register_course_routes(app):
         if 'username' not in session:
             return redirect('/login')
 
-        user_id = get_user_id(session['username'])
-        if not user_id:
+        current_user = get_current_user()
+        if not current_user:
             return redirect('/login')
+        user_id = current_user.id
 
-        conn = get_db_connection()
+        # Show the user's own queued clicks
+        if get_write_behind():
+            get_write_behind().wait_for_user(user_id)
 
-        # Get all courses
-        all_courses = conn.execute('SELECT * FROM courses').fetchall()
-
-        # Get completed courses
-        # FIX 1: Set completed = 1
-        # FIX 2: Select cp.completed_at so the template can use it
-        completed = conn.execute(
-            '''SELECT c.*, cp.completed_at
-            FROM courses c
-            JOIN course_progress cp ON c.id = cp.course_id
-            WHERE cp.user_id = ? AND cp.completed = 1''',
-            (user_id,)
-        ).fetchall()
-
-        # Get in-progress courses (not completed)
-        # FIX 1: Set completed = 0
-        in_progress = conn.execute(
-            '''SELECT c.*
-            FROM courses c
-            JOIN course_progress cp ON c.id = cp.course_id
-            WHERE cp.user_id = ? AND cp.completed = 0''',
-            (user_id,)
-        ).fetchall()
-
-        conn.close()
+        # The user's shard, if enrollments are sharded (see database.py)
+        conn = get_user_db(user_id)
+
+        # Counters come from one summary row (or one aggregate query),
+        # so they cost the same however big the catalogue is
+        counts = get_progress_counts(conn, user_id, use_summary=app.config['PROGRESS_SUMMARY'])
+
+        if app.config['STREAM_TEMPLATES']:
+            # Cards come off two cursors as the streamed page renders them
+            completed = iter_progress_courses(conn, user_id, 1)
+            in_progress = iter_progress_courses(conn, user_id, 0)
+        else:
+            # Completed and in-progress course cards in one indexed query
+            completed, in_progress = get_progress_courses(conn, user_id)
 
         # Calculate stats
-        total_courses = len(all_courses)
-        completed_count = len(completed)
-        in_progress_count = len(in_progress)
+        total_courses = counts['total_courses']
+        completed_count = counts['completed_count']
+        in_progress_count = counts['in_progress_count']
         completion_percentage = (completed_count / total_courses * 100) if total_courses > 0 else 0
 
-        user = session.get('username')
-        admin = is_admin()
+        user = current_user.username
+        admin = current_user.is_admin
         
         # Define the breadcrumbs
         breadcrumbs = [
@@ -387,14 +432,15 @@ def register_course_routes(app):
             { "name": "Dashboard", "url": None } # None for the active page
         ]
 
-        return render_template('dashboard.html',
+        return render_page('dashboard.html',
                                username=user,
                                is_admin=admin,
-                               all_courses=all_courses,
                                completed=completed,
                                in_progress=in_progress,
                                total_courses=total_courses,
                                completed_count=completed_count,
                                in_progress_count=in_progress_count,
+                               enrolled_count=counts['enrolled_count'],
+                               last_activity=counts['last_activity'],
                                completion_percentage=completion_percentage,
                                breadcrumbs=breadcrumbs)
\ No newline at end of file
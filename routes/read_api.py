@@ -0,0 +1,215 @@
+"""Versioned JSON read API over the catalogue and the user's progress.
+
+The same data as /courses, /course/<id> and /dashboard, as compact JSON:
+
+- ``GET /api/v1/courses?category=&search=&after=&before=&limit=``
+- ``GET /api/v1/courses/<id>``
+- ``GET /api/v1/me/progress`` (signed in)
+
+``?fields=id,title`` limits the fields of each course to the ones listed.
+As on the course page, ``video_url`` and ``embed_url`` are only shown to
+admins and students enrolled in the course; others get the course
+without them.
+
+Every response carries a strong ETag built from the change counters of
+the data it shows (see changes.py) and the request's arguments. A client
+that sends it back in ``If-None-Match`` gets a 304, and while the counters
+are unchanged that answer is decided from memory without touching SQLite.
+"""
+
+from flask import current_app, jsonify, request
+from catalogue import DEFAULT_PAGE_SIZE, list_courses
+from changes import get_changes, make_etag
+from database import get_backend, get_db, get_user_db
+from helpers import get_current_user
+from progress import get_progress_counts, get_progress_courses
+from related import get_related_courses
+from routes.api import BadRequest
+from search import search_courses
+from writebehind import get_write_behind
+
+API_VERSION = 'v1'
+DEFAULT_API_MAX_PAGE_SIZE = 100
+
+# Fields a client may ask for, per kind of course object
+CARD_FIELDS = ('id', 'title', 'category', 'description')
+DETAIL_FIELDS = ('id', 'title', 'category', 'description', 'video_url', 'embed_url', 'related')
+PROGRESS_FIELDS = CARD_FIELDS + ('completed_at',)
+# Detail fields only admins and enrolled students see
+VIDEO_FIELDS = ('video_url', 'embed_url')
+
+
+def requested_fields(allowed):
+    """Read ``?fields=`` as a tuple of allowed field names (all of them by default)."""
+    raw = request.args.get('fields', '')
+    fields = tuple(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+    if not fields:
+        return allowed
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise BadRequest(f"Unknown fields: {', '.join(unknown)}; "
+                         f"choose from {', '.join(allowed)}")
+    return fields
+
+
+def select_fields(row, fields):
+    """Keep only ``fields`` of a row (or dict)."""
+    return {name: row[name] for name in fields}
+
+
+def _not_modified(etag, private):
+    return _cache_headers(current_app.response_class(status=304), etag, private)
+
+
+def _cache_headers(response, etag, private):
+    response.set_etag(etag)
+    response.cache_control.no_cache = True  # Always revalidate; a 304 is cheap
+    if private:
+        response.cache_control.private = True
+        response.vary.add('Cookie')
+    else:
+        response.cache_control.public = True
+    return response
+
+
+def conditional(versions, build, private=False):
+    """Answer with ``build()`` as JSON, or a 304 if the client's ETag is current.
+
+    ``versions(fresh)`` returns the counter versions the response depends
+    on. It is first called with ``fresh=False``, which uses the in-memory
+    versions, so an unchanged poll is answered without SQLite. Otherwise
+    the versions are read again, before the data and on the same
+    connections, so a response is never tagged newer than its data.
+    """
+    args = tuple(sorted(request.args.items(multi=True)))
+    etag = make_etag(API_VERSION, request.path, args, versions(False))
+    if etag in request.if_none_match:
+        return _not_modified(etag, private)
+    etag = make_etag(API_VERSION, request.path, args, versions(True))
+    response = _cache_headers(jsonify(build()), etag, private)
+    return response.make_conditional(request)
+
+
+def _courses_version(fresh):
+    changes = get_changes()
+    if fresh:
+        return changes.refresh('courses', get_db())
+    return changes.version('courses', get_db)
+
+
+def _progress_version(user_id, fresh):
+    changes = get_changes()
+    shard = get_backend().shard_index(user_id)
+    if fresh:
+        return changes.refresh('progress', get_user_db(user_id), shard)
+    return changes.version('progress', lambda: get_user_db(user_id), shard)
+
+
+def _can_watch(user, course_id):
+    """Check if a user may see a course's video: admins and enrolled students."""
+    if user is None:
+        return False
+    if user.is_admin:
+        return True
+    return get_user_db(user.id).execute(
+        'SELECT 1 FROM enrollments WHERE user_id = ? AND course_id = ?', (user.id, course_id)
+    ).fetchone() is not None
+
+
+def register_read_api_routes(app):
+    """Register the /api/v1 read endpoints."""
+    app.config.setdefault('API_MAX_PAGE_SIZE', DEFAULT_API_MAX_PAGE_SIZE)
+
+    @app.errorhandler(BadRequest)
+    def bad_request(error):
+        return jsonify({'error': str(error)}), error.status
+
+    @app.route(f'/api/{API_VERSION}/courses')
+    def api_courses():
+        """One page of course cards, like /courses."""
+        fields = requested_fields(CARD_FIELDS)
+        search_query = request.args.get('search', '').strip()
+        category = request.args.get('category', '').strip()
+        after = request.args.get('after') or None
+        before = request.args.get('before') or None
+        limit = request.args.get('limit', app.config.get('COURSES_PAGE_SIZE', DEFAULT_PAGE_SIZE),
+                                 type=int)
+        if limit is None or not 0 < limit <= app.config['API_MAX_PAGE_SIZE']:
+            raise BadRequest(f"'limit' must be between 1 and {app.config['API_MAX_PAGE_SIZE']}")
+
+        def build():
+            conn = get_db()
+            if search_query:
+                page = search_courses(conn, search_query, category,
+                                      page_size=limit, after=after, before=before)
+            else:
+                page = list_courses(conn, category, page_size=limit, after=after, before=before)
+            return {
+                'courses': [select_fields(row, fields) for row in page.items],
+                'next_cursor': page.next_cursor,
+                'prev_cursor': page.prev_cursor,
+            }
+
+        return conditional(lambda fresh: (_courses_version(fresh),), build)
+
+    @app.route(f'/api/{API_VERSION}/courses/<int:course_id>')
+    def api_course(course_id):
+        """One course with its related course cards, like /course/<id>."""
+        fields = requested_fields(DETAIL_FIELDS)
+        user = get_current_user()
+        if user is not None and get_write_behind():
+            get_write_behind().wait_for_user(user.id)  # Include a queued enrollment
+
+        def versions(fresh):
+            if user is None:
+                return (_courses_version(fresh),)
+            # Enrolling shows the video, so the user's progress counts too
+            return (_courses_version(fresh), _progress_version(user.id, fresh),
+                    user.id, user.is_admin)
+
+        def build():
+            conn = get_db()
+            course = conn.execute('SELECT * FROM courses WHERE id = ?', (course_id,)).fetchone()
+            if course is None:
+                raise BadRequest('Course not found', 404)
+            course = dict(course)
+            if 'related' in fields:
+                course['related'] = [select_fields(row, CARD_FIELDS)
+                                     for row in get_related_courses(conn, course_id)]
+            shown = fields
+            if any(name in VIDEO_FIELDS for name in fields) and not _can_watch(user, course_id):
+                shown = tuple(name for name in fields if name not in VIDEO_FIELDS)
+            return select_fields(course, shown)
+
+        # Shared caches must not hand one user's answer to another
+        response = conditional(versions, build, private=user is not None)
+        response.vary.add('Cookie')
+        return response
+
+    @app.route(f'/api/{API_VERSION}/me/progress')
+    def api_my_progress():
+        """The signed-in user's counters and course cards, like /dashboard."""
+        user = get_current_user()
+        if user is None:
+            return jsonify({'error': 'Login required'}), 401
+        fields = requested_fields(PROGRESS_FIELDS)
+        if get_write_behind():
+            get_write_behind().wait_for_user(user.id)  # Include their queued clicks
+
+        def versions(fresh):
+            # Cards show course titles, so catalogue edits change this too
+            return _courses_version(fresh), _progress_version(user.id, fresh), user.id
+
+        def build():
+            conn = get_user_db(user.id)
+            counts = get_progress_counts(conn, user.id,
+                                         use_summary=app.config.get('PROGRESS_SUMMARY', False))
+            completed, in_progress = get_progress_courses(conn, user.id)
+            return {
+                'user_id': user.id,
+                **counts,
+                'completed': [select_fields(row, fields) for row in completed],
+                'in_progress': [select_fields(row, fields) for row in in_progress],
+            }
+
+        return conditional(versions, build, private=True)
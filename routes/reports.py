@@ -0,0 +1,39 @@
+"""Admin reports: enrollment and completion statistics per course."""
+
+from flask import redirect, session
+from helpers import get_db_connection, is_admin, render_page
+from reports import get_course_stats, iter_stats_csv
+
+
+def register_report_routes(app):
+    """Register the admin report routes."""
+
+    @app.route('/admin/reports')
+    def reports():
+        """Per-course statistics page - admin only"""
+        if not is_admin():
+            return redirect('/login')
+
+        # Read from the aggregate tables (see reports.py), never the progress rows
+        stats = get_course_stats(get_db_connection())
+
+        breadcrumbs = [
+            { "name": "Home", "url": "/" },
+            { "name": "Reports", "url": None }
+        ]
+
+        return render_page('reports.html', stats=stats,
+                           username=session.get('username'), is_admin=True,
+                           breadcrumbs=breadcrumbs)
+
+    @app.route('/admin/reports.csv')
+    def reports_csv():
+        """The same statistics as a CSV download - admin only"""
+        if not is_admin():
+            return redirect('/login')
+
+        stats = get_course_stats(get_db_connection())
+        return app.response_class(
+            iter_stats_csv(stats), mimetype='text/csv',
+            headers={'Content-Disposition': 'attachment; filename="course-stats.csv"'},
+        )
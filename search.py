@@ -0,0 +1,79 @@
+"""Full-text course search backed by the courses_fts index."""
+
+import re
+import sqlite3
+from catalogue import COURSE_CARD_COLUMNS, DEFAULT_PAGE_SIZE, Page, fetch_page
+
+# bm25() column weights for title, description and category
+BM25_WEIGHTS = (10.0, 1.0, 2.0)
+
+_WORD = re.compile(r'\w+')
+
+
+def build_match_query(search_query):
+    """Turn what the user typed into an FTS5 prefix query.
+
+    Every word is quoted (so FTS5 operators in the input are treated as
+    text) and given a trailing ``*``, so "photo intro" matches
+    "Introduction to Photography". Returns '' if there are no words.
+    """
+    return ' '.join(f'"{word}"*' for word in _WORD.findall(search_query))
+
+
+def _fts_search(conn, match_query, category_filter, page_size, after, before):
+    """Run a BM25-ranked search against courses_fts."""
+    weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+    rank = f'bm25(courses_fts, {weights})'
+    if category_filter and _WORD.search(category_filter):
+        # Let the index intersect the words with the category column too,
+        # instead of checking the category of every matching course
+        phrase = category_filter.replace('"', '""')
+        match_query = f'({match_query}) AND category : "{phrase}"'
+    conditions, params = ['courses_fts MATCH ?'], [match_query]
+    if category_filter:
+        conditions.append('c.category = ?')  # The phrase also matches longer names
+        params.append(category_filter)
+    return fetch_page(
+        conn,
+        f'''SELECT {COURSE_CARD_COLUMNS}, {rank} AS search_rank
+        FROM courses_fts
+        JOIN courses c ON c.id = courses_fts.rowid''',
+        conditions, params,
+        sort_exprs=(rank, 'c.id'), sort_keys=('search_rank', 'id'),
+        page_size=page_size, after=after, before=before,
+    )
+
+
+def _like_search(conn, search_query, category_filter, page_size, after, before):
+    """Unranked substring search, used when the FTS index is missing."""
+    conditions = ['(c.title LIKE ? OR c.description LIKE ?)']
+    params = [f'%{search_query}%', f'%{search_query}%']
+    if category_filter:
+        conditions.append('c.category = ?')
+        params.append(category_filter)
+    return fetch_page(
+        conn,
+        f'SELECT {COURSE_CARD_COLUMNS} FROM courses c',
+        conditions, params,
+        sort_exprs=('c.id',), sort_keys=('id',),
+        page_size=page_size, after=after, before=before,
+    )
+
+
+def search_courses(conn, search_query, category_filter='', page_size=DEFAULT_PAGE_SIZE,
+                   after=None, before=None):
+    """Search courses by title, description and category, best match first.
+
+    Returns one catalogue.Page, paginated by (rank, id). Falls back to LIKE
+    matching if the courses_fts migration has not been applied to this
+    database yet.
+    """
+    match_query = build_match_query(search_query)
+    if not match_query:
+        return Page([], None, None)
+    try:
+        return _fts_search(conn, match_query, category_filter, page_size, after, before)
+    except sqlite3.OperationalError as e:
+        if 'courses_fts' not in str(e):
+            raise
+        return _like_search(conn, search_query, category_filter, page_size, after, before)
@@ -0,0 +1,110 @@
+"""Signed session claims, so authorization needs no database lookup.
+
+At login the session cookie gets the user's id, username, admin flag and
+``session_version``. Flask signs the cookie with ``SECRET_KEY``, so the
+claims cannot be edited by the client, and ``is_admin()`` and friends read
+them straight from the cookie.
+
+To revoke sessions, bump ``users.session_version``: the triggers from
+migration 13 do it when ``is_admin`` changes and log it (and user
+deletions) in ``session_revocations``. Each worker process keeps the
+minimum valid version per revoked user in memory and reads only the new
+log rows, at most once every ``SESSION_REVOCATION_INTERVAL`` seconds. A
+revoked session is therefore rejected by every worker within that
+interval, and immediately by the worker that made the change.
+"""
+
+import threading
+import time
+from flask import current_app, session
+from database import get_db
+
+DEFAULT_SESSION_REVOCATION_INTERVAL = 5.0  # Seconds between revocation log reads
+
+# Session keys holding the claims, cleared together on logout
+CLAIM_KEYS = ('username', 'user_id', 'is_admin', 'session_version')
+
+
+class SessionRevocations:
+    """The minimum valid session version of every revoked user, per process."""
+
+    def __init__(self, interval=DEFAULT_SESSION_REVOCATION_INTERVAL):
+        self.interval = interval
+        self.refreshes = 0
+        self._min_versions = {}
+        self._last_id = 0
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self, conn):
+        """Read the revocation log rows added since the last refresh."""
+        with self._lock:
+            rows = conn.execute(
+                'SELECT id, user_id, session_version FROM session_revocations '
+                'WHERE id > ? ORDER BY id',
+                (self._last_id,)
+            ).fetchall()
+            for row_id, user_id, version in rows:
+                if version > self._min_versions.get(user_id, 0):
+                    self._min_versions[user_id] = version
+                self._last_id = row_id
+            self._checked_at = time.monotonic()
+            self.refreshes += 1
+
+    def is_revoked(self, user_id, version, connect):
+        """Check a claim, reading the log through ``connect()`` if it is due."""
+        checked_at = self._checked_at
+        if checked_at is None or time.monotonic() - checked_at >= self.interval:
+            self.refresh(connect())
+        return version < self._min_versions.get(user_id, 0)
+
+    def stats(self):
+        """Return the revocation counters as a dict."""
+        with self._lock:
+            return {'revoked_users': len(self._min_versions), 'refreshes': self.refreshes}
+
+
+def init_sessions(app):
+    """Create the per-process revocation list for an app."""
+    app.config.setdefault('SESSION_REVOCATION_INTERVAL', DEFAULT_SESSION_REVOCATION_INTERVAL)
+    app.extensions['lms_sessions'] = SessionRevocations(app.config['SESSION_REVOCATION_INTERVAL'])
+
+
+def get_revocations():
+    """Return the current app's SessionRevocations."""
+    return current_app.extensions['lms_sessions']
+
+
+def start_session(user_id, username, is_admin, session_version):
+    """Sign a user in: store their claims in the session cookie."""
+    # Keep reading from the primary after a write (see database.get_db)
+    primary_until = session.get('db_primary_until')
+    session.clear()
+    if primary_until is not None:
+        session['db_primary_until'] = primary_until
+    session['username'] = username
+    session['user_id'] = user_id
+    session['is_admin'] = bool(is_admin)
+    session['session_version'] = session_version
+
+
+def end_session():
+    """Sign the current user out."""
+    for key in CLAIM_KEYS:
+        session.pop(key, None)
+
+
+def session_claims():
+    """Return ``(user_id, username, is_admin, session_version)`` from the session.
+
+    Returns None for anonymous visitors and for sessions signed before
+    claims were added (only a username). A revoked session is cleared and
+    also gives None.
+    """
+    if 'user_id' not in session:
+        return None
+    user_id, version = session['user_id'], session['session_version']
+    if get_revocations().is_revoked(user_id, version, get_db):
+        end_session()
+        return None
+    return user_id, session['username'], session['is_admin'], version
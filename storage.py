@@ -0,0 +1,179 @@
+"""Shard and replica files for the replicated storage backend.
+
+``DB_BACKEND = 'replicated'`` (see database.py) reads from ``DB_REPLICAS``
+and keeps the per-user tables in ``DB_SHARDS``. This module prepares those
+files:
+
+- ``split_into_shards`` moves the enrollments, progress rows and counters
+  out of the primary into one file per shard, by ``user_id % shards``.
+- ``upgrade_shard`` adds the shard tables and triggers of new migrations
+  to an existing shard file.
+- ``sync_replica`` copies the primary into a replica file. Production
+  replication is the job of an external tool (Litestream, LiteFS or a
+  file-level copy); this is for running replicas locally.
+- ``fan_in_views`` lets one connection query every shard at once, for the
+  few cross-user queries (co-enrollment for related courses, the course
+  statistics, exports).
+
+Usage:
+    flask --app app lms split-shards      # with DB_SHARDS set
+    flask --app app lms upgrade-shards    # after migrating the primary
+    flask --app app lms sync-replicas     # with DB_REPLICAS set
+"""
+
+import os
+import sqlite3
+from urllib.parse import quote
+
+# Tables holding per-user rows, which DB_SHARDS splits by user_id
+SHARDED_TABLES = ('enrollments', 'course_progress', 'user_progress_summary')
+
+# Tables copied into every shard, rows and all (each shard keeps its own
+# 'progress' change counter, see changes.py)
+SHARD_LOCAL_TABLES = ('change_counters',)
+
+# Per-course aggregates kept by triggers on the sharded tables; each shard
+# counts its own users (see reports.py)
+SHARD_AGGREGATE_TABLES = ('course_stats', 'course_completion_times')
+
+# Alias of the n-th shard attached by fan_in_views
+SHARD_ALIAS = 'shard{}'
+
+# Shard tables that cross-user queries read through the fan-in views
+FAN_IN_TABLES = ('enrollments', 'course_progress') + SHARD_AGGREGATE_TABLES
+
+
+def file_uri(path, read_only=False):
+    """Return a SQLite URI for a database file, optionally read-only."""
+    uri = 'file:' + quote(os.path.abspath(path))
+    return uri + '?mode=ro' if read_only else uri
+
+
+def shard_schema(conn):
+    """Return ``[(name, sql)]`` for the shard tables, their indexes and triggers."""
+    tables = SHARDED_TABLES + SHARD_LOCAL_TABLES + SHARD_AGGREGATE_TABLES
+    placeholders = ', '.join('?' for _ in tables)
+    return conn.execute(f'''
+        SELECT name, sql FROM sqlite_master
+        WHERE tbl_name IN ({placeholders}) AND sql IS NOT NULL
+            AND type IN ('table', 'index', 'trigger')
+        ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 ELSE 2 END, name
+    ''', tables).fetchall()
+
+
+def create_shard(path, schema):
+    """Create an empty shard file with the given schema, in WAL mode."""
+    for stale in (path, path + '-wal', path + '-shm'):
+        if os.path.exists(stale):
+            os.remove(stale)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('PRAGMA journal_mode = WAL')
+        for _, statement in schema:
+            conn.execute(statement)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def split_into_shards(primary_path, shard_paths):
+    """Move the SHARDED_TABLES rows of the primary into new shard files.
+
+    Existing shard files are replaced. Each row goes to shard
+    ``user_id % len(shard_paths)``; the primary keeps the (now empty)
+    tables so its schema stays as migrations.py leaves it. The
+    SHARD_LOCAL_TABLES are copied whole into every shard, and the
+    triggers fill each shard's SHARD_AGGREGATE_TABLES as the rows arrive.
+    Returns ``{table: [rows per shard]}``.
+    """
+    conn = sqlite3.connect(primary_path)
+    try:
+        schema = shard_schema(conn)
+        for path in shard_paths:
+            create_shard(path, schema)
+        counts = {}
+        for index, path in enumerate(shard_paths):
+            conn.execute(f'ATTACH DATABASE ? AS {SHARD_ALIAS.format(index)}', (path,))
+        conn.execute('BEGIN IMMEDIATE')
+        for table in SHARDED_TABLES:
+            counts[table] = [conn.execute(f'''
+                INSERT INTO {SHARD_ALIAS.format(index)}.{table}
+                SELECT * FROM main.{table} WHERE user_id % ? = ?
+            ''', (len(shard_paths), index)).rowcount for index in range(len(shard_paths))]
+            conn.execute(f'DELETE FROM main.{table}')
+        for table in SHARD_LOCAL_TABLES:
+            for index in range(len(shard_paths)):
+                conn.execute(f'INSERT INTO {SHARD_ALIAS.format(index)}.{table} '
+                             f'SELECT * FROM main.{table}')
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return counts
+
+
+def upgrade_shard(primary_path, shard_path):
+    """Create the shard tables, indexes and triggers the primary has and a shard lacks.
+
+    Run it on every shard after migrating the primary. New aggregate
+    tables start empty; rebuild them afterwards (``python reports.py``).
+    Returns the names of the objects created.
+    """
+    primary = sqlite3.connect(primary_path)
+    try:
+        schema = shard_schema(primary)
+    finally:
+        primary.close()
+    conn = sqlite3.connect(shard_path)
+    try:
+        existing = {row[0] for row in conn.execute('SELECT name FROM sqlite_master')}
+        created = [name for name, _ in schema if name not in existing]
+        for name, statement in schema:
+            if name in created:
+                conn.execute(statement)
+        conn.commit()
+    finally:
+        conn.close()
+    return created
+
+
+def sync_replica(primary_path, replica_path):
+    """Replace ``replica_path`` with a consistent copy of the primary."""
+    source = sqlite3.connect(primary_path)
+    target = sqlite3.connect(replica_path)
+    try:
+        source.backup(target)
+        # A read-only connection cannot create the -shm file WAL needs
+        target.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        target.close()
+        source.close()
+
+
+def fan_in_views(shard_paths):
+    """Return a setup function that gives a connection every shard's rows.
+
+    It attaches the shards read-only and creates TEMP VIEWs named after
+    FAN_IN_TABLES over the UNION ALL of them. Temporary objects shadow the
+    main schema, so unqualified reads of those tables see every user; the
+    connection must not write them.
+    """
+    def setup(conn):
+        aliases = [SHARD_ALIAS.format(index) for index in range(len(shard_paths))]
+        for alias, path in zip(aliases, shard_paths):
+            conn.execute(f'ATTACH DATABASE ? AS {alias}', (file_uri(path, read_only=True),))
+        for table in FAN_IN_TABLES:
+            union = ' UNION ALL '.join(f'SELECT * FROM {alias}.{table}' for alias in aliases)
+            conn.execute(f'CREATE TEMP VIEW IF NOT EXISTS {table} AS {union}')
+    return setup
+
+
+def connect_with_shards(primary_path, shard_paths):
+    """Open the primary with the fan-in views over ``shard_paths`` (for scripts)."""
+    conn = sqlite3.connect(file_uri(primary_path), uri=True)
+    if shard_paths:
+        fan_in_views(shard_paths)(conn)
+    return conn
+
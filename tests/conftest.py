@@ -0,0 +1,75 @@
+"""Shared fixtures: a freshly migrated database and an app built on it."""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+PASSWORD = 'password'
+STUDENTS = ('alice', 'bob', 'carol')
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A migrated database: the seeded admin and courses 1-5, plus STUDENTS."""
+    path = str(tmp_path / 'lms.db')
+    conn = sqlite3.connect(path)
+    migrate(conn, verbose=False)
+    password_hash = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')  # Fast
+    conn.executemany('INSERT INTO users (username, password_hash) VALUES (?, ?)',
+                     [(name, password_hash) for name in STUDENTS])
+    conn.execute("UPDATE courses SET video_url = 'https://youtu.be/abc', "
+                 "embed_url = 'https://www.youtube.com/embed/abc'")
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def make_app(db_path):
+    """Build apps on the test database; ``make_app(**config)`` overrides settings."""
+    from app import create_app
+    from database import get_backend
+
+    apps = []
+
+    def make(**config):
+        app = create_app({'DATABASE': db_path, 'TESTING': True, 'HASH_WORKERS': 0,
+                          'RATE_LIMIT': False, **config})
+        apps.append(app)
+        return app
+
+    yield make
+    for app in apps:
+        if app.extensions.get('lms_write_behind'):
+            app.extensions['lms_write_behind'].close()
+        for pool in get_backend(app).pools():
+            pool.close_all()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+def user_row(db_path, username):
+    """Return ``(id, is_admin, session_version)`` of a user."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT id, is_admin, session_version FROM users WHERE username = ?',
+                            (username,)).fetchone()
+    finally:
+        conn.close()
+
+
+def login(client, db_path, username):
+    """Sign a test client in as ``username`` with signed session claims."""
+    user_id, is_admin, session_version = user_row(db_path, username)
+    with client.session_transaction() as session:
+        session.update(username=username, user_id=user_id, is_admin=bool(is_admin),
+                       session_version=session_version)
+    return user_id
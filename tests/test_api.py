@@ -0,0 +1,92 @@
+"""The JSON batch endpoints: enrollments, progress and cohorts."""
+import pytest
+
+from conftest import STUDENTS, login, user_row
+from test_progress_summary import rebuilt_rows, summary_rows
+
+
+@pytest.fixture
+def client(app, db_path):
+    client = app.test_client()
+    login(client, db_path, 'alice')
+    return client
+
+
+def test_enroll_mixed_ids(client):
+    client.post('/enroll/2')
+    response = client.post('/api/enrollments', json={'course_ids': [1, 999, 1, 2]})
+    assert response.status_code == 200
+    assert response.json['enrolled'] == [1]
+    assert response.json['already_enrolled'] == [2]
+    assert response.json['unknown_courses'] == [999]
+
+
+def test_progress_mixed_ids(client):
+    client.post('/api/progress', json={'progress': [{'course_id': 2, 'completed': True}]})
+    response = client.post('/api/progress', json={'progress': [
+        {'course_id': 1, 'completed': False},
+        {'course_id': 999, 'completed': True},
+        {'course_id': 2, 'completed': True},
+        {'course_id': 1, 'completed': True},  # The last one for a course wins
+    ]})
+    assert response.status_code == 200
+    assert response.json['updated'] == [1]
+    assert response.json['unchanged'] == [2]
+    assert response.json['unknown_courses'] == [999]
+
+
+@pytest.mark.parametrize('item', [
+    {'course_id': True, 'completed': True},
+    {'course_id': 1, 'completed': 1},
+    {'course_id': '1', 'completed': True},
+])
+def test_progress_rejects_mistyped_items(client, item):
+    response = client.post('/api/progress', json={'progress': [item]})
+    assert response.status_code == 400
+
+
+def test_only_admins_act_for_others(client, db_path):
+    bob = user_row(db_path, 'bob')[0]
+    response = client.post('/api/enrollments', json={'course_ids': [1], 'user_id': bob})
+    assert response.status_code == 403
+    response = client.post('/api/courses/1/cohort', json={'user_ids': [bob]})
+    assert response.status_code == 403
+
+
+def test_admin_for_missing_user(app, db_path):
+    client = app.test_client()
+    login(client, db_path, 'admin')
+    response = client.post('/api/progress', json={
+        'user_id': 999, 'progress': [{'course_id': 1, 'completed': True}]})
+    assert response.status_code == 404
+    response = client.post('/api/enrollments', json={'course_ids': [1], 'user_id': 999})
+    assert response.status_code == 404
+
+
+def test_batch_limit(make_app, db_path):
+    app = make_app(API_MAX_BATCH=3)
+    client = app.test_client()
+    login(client, db_path, 'admin')
+    ids = [1, 2, 3, 4]
+    assert client.post('/api/enrollments', json={'course_ids': ids}).status_code == 413
+    assert client.post('/api/courses/1/cohort', json={'user_ids': ids}).status_code == 413
+    response = client.post('/api/progress', json={
+        'progress': [{'course_id': course_id, 'completed': True} for course_id in ids]})
+    assert response.status_code == 413
+
+
+def test_batches_match_rebuild(make_app, db_path):
+    app = make_app(PROGRESS_SUMMARY=True)
+    client = app.test_client()
+    login(client, db_path, 'admin')
+    student_ids = [user_row(db_path, name)[0] for name in STUDENTS]
+    response = client.post('/api/courses/3/cohort', json={'user_ids': student_ids + [999]})
+    assert response.json['unknown_users'] == [999]
+
+    for name in STUDENTS[:2]:
+        login(client, db_path, name)
+        client.post('/api/enrollments', json={'course_ids': [1, 2, 3]})
+        client.post('/api/progress', json={'progress': [
+            {'course_id': 1, 'completed': True}, {'course_id': 4, 'completed': True}]})
+        client.post('/api/progress', json={'progress': [{'course_id': 1, 'completed': False}]})
+    assert summary_rows(db_path) == rebuilt_rows(db_path)
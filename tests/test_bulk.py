@@ -0,0 +1,61 @@
+"""Bulk imports: indexes and triggers dropped for a load always come back."""
+import sqlite3
+
+from bulk import drop_secondary_schema, secondary_schema
+from migrations import migrate
+
+CATEGORY_SQL = 'SELECT category, course_count FROM category_counts ORDER BY category'
+RECOUNT_SQL = 'SELECT category, COUNT(*) FROM courses GROUP BY category ORDER BY category'
+
+
+def interrupted_load(db_path):
+    """Drop the courses schema and write a row, as an import killed mid-load would."""
+    conn = sqlite3.connect(db_path)
+    schema = drop_secondary_schema(conn, 'courses')
+    conn.execute("INSERT INTO courses (title, description, category) "
+                 "VALUES ('Loaded', '', 'Loaded')")
+    conn.commit()
+    return conn, schema
+
+
+def assert_restored(conn, schema):
+    assert secondary_schema(conn, 'courses') == schema
+    assert conn.execute('SELECT COUNT(*) FROM pending_schema_restores').fetchone()[0] == 0
+    assert conn.execute(CATEGORY_SQL).fetchall() == conn.execute(RECOUNT_SQL).fetchall()
+    assert conn.execute('SELECT course_count FROM catalogue_stats').fetchone()[0] == \
+        conn.execute('SELECT COUNT(*) FROM courses').fetchone()[0]
+
+
+def test_migrate_restores_after_a_killed_load(db_path):
+    conn, schema = interrupted_load(db_path)
+    assert schema
+    assert secondary_schema(conn, 'courses') == []
+
+    migrate(conn, verbose=False)
+    assert_restored(conn, schema)
+    conn.close()
+
+
+def test_next_import_restores_after_a_killed_load(app, db_path, tmp_path):
+    conn, schema = interrupted_load(db_path)
+    path = tmp_path / 'courses.csv'
+    path.write_text('title,category\nImported,Loaded\n')
+
+    result = app.test_cli_runner().invoke(args=['lms', 'import', 'courses', str(path),
+                                                '--keep-indexes'])
+    assert result.exit_code == 0, result.output
+    assert_restored(conn, schema)
+    conn.close()
+
+
+def test_rebuild_import_keeps_schema(app, db_path, tmp_path):
+    conn = sqlite3.connect(db_path)
+    schema = secondary_schema(conn, 'courses')
+    path = tmp_path / 'courses.csv'
+    path.write_text('title,category\n' + ''.join(f'Course {n},Cat {n % 3}\n' for n in range(50)))
+
+    result = app.test_cli_runner().invoke(args=['lms', 'import', 'courses', str(path),
+                                                '--rebuild-indexes', '--batch-size', '7'])
+    assert result.exit_code == 0, result.output
+    assert_restored(conn, schema)
+    conn.close()
@@ -0,0 +1,27 @@
+"""The flask lms maintenance commands."""
+from conftest import login, user_row
+
+
+def test_make_admin_grants_and_revokes(app, db_path):
+    client = app.test_client()
+    login(client, db_path, 'alice')
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['lms', 'make-admin', 'alice'])
+    assert result.exit_code == 0, result.output
+    assert user_row(db_path, 'alice')[1] == 1
+    # The session signed before the change is revoked
+    assert client.get('/add-course').status_code == 302
+
+    login(client, db_path, 'alice')
+    assert client.get('/add-course').status_code == 200
+
+    result = runner.invoke(args=['lms', 'make-admin', 'alice', '--revoke'])
+    assert result.exit_code == 0, result.output
+    assert user_row(db_path, 'alice')[1] == 0
+
+
+def test_make_admin_unknown_user(app):
+    result = app.test_cli_runner().invoke(args=['lms', 'make-admin', 'nobody'])
+    assert result.exit_code != 0
+    assert 'nobody' in result.output
@@ -0,0 +1,74 @@
+"""The trigger-maintained course statistics against a full rebuild."""
+import random
+import sqlite3
+
+from conftest import STUDENTS, login
+from reports import get_course_stats, rebuild_course_stats
+
+STATS_SQL = 'SELECT * FROM course_stats WHERE enrolled_count ORDER BY course_id'
+TIMES_SQL = 'SELECT * FROM course_completion_times ORDER BY course_id, bucket'
+
+
+def stats_rows(conn):
+    return conn.execute(STATS_SQL).fetchall(), conn.execute(TIMES_SQL).fetchall()
+
+
+def assert_matches_rebuild(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        incremental = stats_rows(conn)
+        conn.execute('BEGIN')
+        rebuild_course_stats(conn)
+        assert incremental == stats_rows(conn)
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def test_random_clicks_match_rebuild(app, db_path):
+    rng = random.Random(2)
+    clients = {}
+    for name in STUDENTS:
+        clients[name] = app.test_client()
+        login(clients[name], db_path, name)
+    for _ in range(200):
+        client = clients[rng.choice(STUDENTS)]
+        course_id = rng.choice([1, 2, 3, 4, 5])
+        if rng.random() < 0.4:
+            client.post(f'/enroll/{course_id}')
+        else:
+            client.post(f'/toggle-complete/{course_id}')
+    assert_matches_rebuild(db_path)
+
+    # Completion times spread over the buckets, then some unenrollments
+    conn = sqlite3.connect(db_path)
+    with conn:
+        for row_id, in conn.execute('SELECT id FROM course_progress').fetchall():
+            conn.execute("UPDATE course_progress SET completed_at = "
+                         "datetime(completed_at, ?) WHERE id = ?",
+                         (f'+{rng.randint(0, 20000)} hours', row_id))
+    with conn:
+        conn.execute('DELETE FROM enrollments WHERE id % 3 = 0')
+    conn.close()
+    assert_matches_rebuild(db_path)
+
+
+def test_deleting_a_course_matches_rebuild(app, db_path):
+    client = app.test_client()
+    for name in STUDENTS:
+        login(client, db_path, name)
+        for course_id in (1, 2, 3):
+            client.post(f'/enroll/{course_id}')
+        client.post('/toggle-complete/2')
+    login(client, db_path, 'admin')
+    client.post('/delete-course/2')
+    assert_matches_rebuild(db_path)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        stats = {course['course_id']: course for course in get_course_stats(conn)}
+    finally:
+        conn.close()
+    assert 2 not in stats
+    assert stats[1]['enrolled_count'] == len(STUDENTS)
+    assert stats[1]['completed_count'] == 0
@@ -0,0 +1,30 @@
+"""Password hashing pool: unknown usernames cost the same as real ones."""
+from hashing import PasswordHasher, get_hasher
+
+FAST_METHOD = 'pbkdf2:sha256:1000'
+
+
+def test_unknown_username_runs_a_real_check(make_app):
+    app = make_app(HASH_METHOD=FAST_METHOD)
+    client = app.test_client()
+    with app.app_context():
+        hasher = get_hasher()
+
+    response = client.post('/login', data={'username': 'nobody', 'password': 'guess'})
+    assert response.status_code == 200
+    assert hasher.completed == 1  # One check against the dummy hash
+
+    response = client.post('/login', data={'username': 'alice', 'password': 'guess'})
+    assert response.status_code == 200
+    assert hasher.completed == 2
+
+
+def test_pool_makes_the_dummy_hash():
+    hasher = PasswordHasher(workers=1, method=FAST_METHOD)
+    try:
+        assert hasher.reject_unknown_user('guess') is False
+        assert hasher.current_prefix == FAST_METHOD
+        assert not hasher.needs_rehash(hasher.hash_password('secret'))
+        assert hasher.completed == 2  # The dummy hash itself takes no queue slot
+    finally:
+        hasher.shutdown()
@@ -0,0 +1,33 @@
+"""The /metrics export: counters and gauges typed as Prometheus expects."""
+
+
+def metric_types(text):
+    """Return ``{name: type}`` and check every TYPE has a HELP line before it."""
+    lines = text.splitlines()
+    types = {}
+    for index, line in enumerate(lines):
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ')
+            assert lines[index - 1].startswith(f'# HELP {name} ')
+            types[name] = kind
+    return types
+
+
+def test_component_counters_and_gauges(make_app):
+    app = make_app(WRITE_BEHIND=True)
+    client = app.test_client()
+    client.get('/courses')
+    client.get('/courses')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    types = metric_types(response.get_data(as_text=True))
+
+    for name in ('lms_page_cache_hits_total', 'lms_page_cache_misses_total',
+                 'lms_db_pool_hits_total', 'lms_hashing_completed_total',
+                 'lms_write_behind_committed_total', 'lms_changes_refreshes_total'):
+        assert types[name] == 'counter', name
+    for name in ('lms_page_cache_size', 'lms_db_pool_idle', 'lms_hashing_queue_depth',
+                 'lms_write_behind_queue_depth'):
+        assert types[name] == 'gauge', name
+    assert 'lms_page_cache_hits' not in types
+    assert 'lms_page_cache_hits_total 1' in response.get_data(as_text=True)
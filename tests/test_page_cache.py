@@ -0,0 +1,27 @@
+"""The anonymous page cache sees catalogue changes made by other workers."""
+from conftest import login
+
+
+def test_edit_in_another_worker_reaches_cached_pages(make_app, db_path):
+    worker = make_app(API_CHANGE_INTERVAL=0)
+    other = make_app(API_CHANGE_INTERVAL=0)
+    visitor = worker.test_client()
+    assert b'Renamed course' not in visitor.get('/course/1').data  # Now cached here
+
+    admin = other.test_client()
+    login(admin, db_path, 'admin')
+    admin.post('/edit-course/1', data={'title': 'Renamed course', 'description': 'New',
+                                       'category': 'General'})
+    assert b'Renamed course' in visitor.get('/course/1').data
+
+
+def test_import_reaches_cached_pages(make_app, tmp_path):
+    app = make_app(API_CHANGE_INTERVAL=0)
+    visitor = app.test_client()
+    assert b'Imported course' not in visitor.get('/courses').data
+
+    path = tmp_path / 'courses.csv'
+    path.write_text('id,title\n1,Imported course\n')
+    result = app.test_cli_runner().invoke(args=['lms', 'import', 'courses', str(path)])
+    assert result.exit_code == 0, result.output
+    assert b'Imported course' in visitor.get('/courses').data
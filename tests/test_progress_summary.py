@@ -0,0 +1,107 @@
+"""The dashboard counters in user_progress_summary against a full rebuild."""
+import random
+import sqlite3
+
+from conftest import STUDENTS, login
+from progress import get_progress_counts, rebuild_progress_summary
+
+
+# A user without a row reads as zeros, so empty rows are left out
+SUMMARY_SQL = '''
+    SELECT * FROM user_progress_summary
+    WHERE enrolled_count OR completed_count OR in_progress_count OR last_activity IS NOT NULL
+    ORDER BY user_id
+'''
+
+
+def summary_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(SUMMARY_SQL).fetchall()
+    finally:
+        conn.close()
+
+
+def rebuilt_rows(db_path):
+    """The summary rebuild_progress_summary would produce (nothing is saved)."""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('BEGIN')
+        rebuild_progress_summary(conn)
+        return conn.execute(SUMMARY_SQL).fetchall()
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def both_counts(db_path, user_id):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        return (get_progress_counts(conn, user_id, use_summary=True),
+                get_progress_counts(conn, user_id, use_summary=False))
+    finally:
+        conn.close()
+
+
+def test_missing_course_is_404_and_not_counted(make_app, db_path):
+    app = make_app(PROGRESS_SUMMARY=True)
+    client = app.test_client()
+    user_id = login(client, db_path, 'alice')
+    client.post('/enroll/1')
+    before = summary_rows(db_path)
+
+    assert client.post('/enroll/99991').status_code == 404
+    assert client.post('/toggle-complete/99991').status_code == 404
+    assert summary_rows(db_path) == before == rebuilt_rows(db_path)
+    with_summary, without_summary = both_counts(db_path, user_id)
+    assert with_summary == without_summary
+
+
+def test_random_clicks_match_rebuild(make_app, db_path):
+    app = make_app(PROGRESS_SUMMARY=True)
+    rng = random.Random(1)
+    clients = {}
+    for name in STUDENTS:
+        clients[name] = app.test_client()
+        login(clients[name], db_path, name)
+    for _ in range(200):
+        client = clients[rng.choice(STUDENTS)]
+        course_id = rng.choice([1, 2, 3, 4, 5, 404])
+        if rng.random() < 0.4:
+            client.post(f'/enroll/{course_id}')
+        elif rng.random() < 0.8:
+            client.post(f'/toggle-complete/{course_id}')
+        else:
+            client.post('/api/progress', json={'progress': [
+                {'course_id': course_id, 'completed': rng.random() < 0.5}]})
+
+    assert summary_rows(db_path) == rebuilt_rows(db_path)
+    for name in STUDENTS:
+        user_id = login(clients[name], db_path, name)
+        with_summary, without_summary = both_counts(db_path, user_id)
+        assert with_summary == without_summary
+
+
+def test_deleting_a_course_matches_rebuild(make_app, db_path):
+    app = make_app(PROGRESS_SUMMARY=True)
+    client = app.test_client()
+    login(client, db_path, 'bob')
+    for course_id in (1, 2, 3):
+        client.post(f'/enroll/{course_id}')
+    client.post('/toggle-complete/2')
+    login(client, db_path, 'admin')
+    client.post('/delete-course/2')
+    assert summary_rows(db_path) == rebuilt_rows(db_path)
+
+
+def test_write_behind_matches_rebuild(make_app, db_path):
+    app = make_app(PROGRESS_SUMMARY=True, WRITE_BEHIND=True)
+    client = app.test_client()
+    login(client, db_path, 'carol')
+    for course_id in (1, 2, 3, 2):
+        client.post(f'/enroll/{course_id}')
+        client.post(f'/toggle-complete/{course_id}')
+    assert client.post('/toggle-complete/99991').status_code == 404
+    app.extensions['lms_write_behind'].flush()
+    assert summary_rows(db_path) == rebuilt_rows(db_path)
@@ -0,0 +1,21 @@
+"""Login rate limits: guessing from one address does not lock the user out."""
+from conftest import PASSWORD
+
+
+def attempt(client, ip, password):
+    return client.post('/login', data={'username': 'alice', 'password': password},
+                       environ_base={'REMOTE_ADDR': ip})
+
+
+def test_username_bucket_is_per_address(make_app):
+    app = make_app(RATE_LIMIT=True, RATE_LIMIT_PER_USERNAME=(3, 60),
+                   HASH_METHOD='pbkdf2:sha256:1000')
+    attacker = app.test_client()
+    for _ in range(3):
+        assert attempt(attacker, '10.0.0.66', 'guess').status_code == 200
+    response = attempt(attacker, '10.0.0.66', 'guess')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+
+    # Alice signs in from her own address all the same
+    assert attempt(app.test_client(), '10.0.0.7', PASSWORD).status_code == 302
@@ -0,0 +1,55 @@
+"""The /api/v1 read API: course videos only for admins and enrolled students."""
+from conftest import login
+
+VIDEO = {'video_url', 'embed_url'}
+
+
+def get_course(client, course_id=1, etag=None):
+    headers = {'If-None-Match': etag} if etag else {}
+    return client.get(f'/api/v1/courses/{course_id}', headers=headers)
+
+
+def test_anonymous_gets_no_video(app):
+    response = get_course(app.test_client())
+    assert response.status_code == 200
+    assert response.json['title']
+    assert not VIDEO & response.json.keys()
+    assert response.cache_control.public
+    assert 'Cookie' in response.vary
+
+    response = app.test_client().get('/api/v1/courses/1?fields=title,video_url')
+    assert response.json == {'title': response.json['title']}
+
+
+def test_student_sees_video_once_enrolled(app, db_path):
+    client = app.test_client()
+    login(client, db_path, 'alice')
+    response = get_course(client)
+    assert not VIDEO & response.json.keys()
+    assert response.cache_control.private
+    assert 'Cookie' in response.vary
+    before = response.headers['ETag']
+
+    assert client.post('/enroll/1').status_code == 302
+    response = get_course(client, etag=before)
+    assert response.status_code == 200  # Enrolling changed the ETag
+    assert VIDEO <= response.json.keys()
+
+    assert not VIDEO & get_course(client, 2).json.keys()  # Not enrolled there
+
+
+def test_admin_sees_video(app, db_path):
+    client = app.test_client()
+    login(client, db_path, 'admin')
+    assert VIDEO <= get_course(client).json.keys()
+
+
+def test_write_behind_enrollment_shows_video(make_app, db_path):
+    app = make_app(WRITE_BEHIND=True)
+    client = app.test_client()
+    login(client, db_path, 'bob')
+    before = get_course(client).headers['ETag']
+    assert client.post('/enroll/1').status_code == 302
+    response = get_course(client, etag=before)
+    assert response.status_code == 200
+    assert VIDEO <= response.json.keys()
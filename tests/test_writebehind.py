@@ -0,0 +1,90 @@
+"""Write-behind: crash replay applies only the events that were not committed."""
+import sqlite3
+
+from changes import ChangeCounters
+from conftest import login, user_row
+from writebehind import WriteBehindQueue
+
+
+def make_queue(db_path, shard_of=lambda user_id: 0, **kwargs):
+    return WriteBehindQueue(connect=lambda shard: sqlite3.connect(db_path, check_same_thread=False),
+                            spill_base=db_path + '-writes', interval=0.01, max_batch=1,
+                            shard_of=shard_of, **kwargs)
+
+
+def query(db_path, sql, params=()):
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def test_replay_skips_committed_events(db_path):
+    alice, bob = user_row(db_path, 'alice')[0], user_row(db_path, 'bob')[0]
+    broken = [True]
+
+    def shard_of(user_id):
+        if broken[0] and user_id == bob:
+            raise RuntimeError('shard down')
+        return 0
+
+    queue = make_queue(db_path, shard_of)
+    with queue._cond:  # Queue both before the writer takes the first
+        queue.enqueue('progress', alice, 1, completed=1)
+        queue.enqueue('enroll', bob, 2)
+    assert not queue.flush(timeout=0.5)  # Alice's click committed, Bob's keeps failing
+    assert query(db_path, 'SELECT completed FROM course_progress WHERE user_id = ?',
+                 (alice,)) == [(1,)]
+
+    # Another worker un-completes the course; then this process dies
+    query(db_path, 'UPDATE course_progress SET completed = 0 WHERE user_id = ?', (alice,))
+    queue.close()
+
+    broken[0] = False
+    assert make_queue(db_path).replay_spill_files() == 1
+    assert query(db_path, 'SELECT completed FROM course_progress WHERE user_id = ?',
+                 (alice,)) == [(0,)]
+    assert query(db_path, 'SELECT course_id FROM enrollments WHERE user_id = ?',
+                 (bob,)) == [(2,)]
+    assert make_queue(db_path).replay_spill_files() == 0  # The file is gone
+
+
+def test_commits_invalidate_change_counters(db_path):
+    alice = user_row(db_path, 'alice')[0]
+    changes = ChangeCounters(interval=3600)
+    connect = lambda: sqlite3.connect(db_path)  # noqa: E731
+    before = changes.version('progress', connect)
+
+    queue = make_queue(db_path, changes=changes)
+    queue.enqueue('enroll', alice, 1)
+    assert queue.flush(timeout=5)
+    queue.close()
+    assert changes.version('progress', connect) == before + 1
+
+
+def test_batch_api_commits_queued_clicks_first(make_app, db_path):
+    app = make_app(WRITE_BEHIND=True, WRITE_BEHIND_INTERVAL=1.0)
+    client = app.test_client()
+    alice = login(client, db_path, 'alice')
+    client.post('/toggle-complete/1')  # Queued, committed up to a second later
+
+    response = client.post('/api/progress', json={'progress': [
+        {'course_id': 1, 'completed': False}]})
+    assert response.json['updated'] == [1]
+    app.extensions['lms_write_behind'].flush()
+    assert query(db_path, 'SELECT completed FROM course_progress WHERE user_id = ?',
+                 (alice,)) == [(0,)]
+
+
+def test_batch_api_busy_while_queue_stalls(make_app, db_path, monkeypatch):
+    app = make_app(WRITE_BEHIND=True)
+    queue = app.extensions['lms_write_behind']
+    monkeypatch.setattr(queue, 'wait_for_user', lambda user_id: False)
+    monkeypatch.setattr(queue, 'flush', lambda timeout=None: False)
+    client = app.test_client()
+    login(client, db_path, 'admin')
+
+    assert client.post('/api/enrollments', json={'course_ids': [1]}).status_code == 503
+    assert client.post('/api/courses/1/cohort', json={'user_ids': [1]}).status_code == 503
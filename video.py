@@ -0,0 +1,47 @@
+"""Video URL helpers."""
+
+from functools import lru_cache
+from urllib.parse import urlparse, parse_qs
+
+YOUTUBE_HOSTS = ('www.youtube.com', 'youtube.com', 'm.youtube.com')
+VIMEO_HOSTS = ('vimeo.com', 'www.vimeo.com')
+
+
+@lru_cache(maxsize=4096)
+def get_embed_url(video_url):
+    """Convert a YouTube or Vimeo link into an embeddable player URL.
+
+    Handles youtube.com/watch?v=..., youtu.be/..., youtube.com/shorts/...
+    and vimeo.com/<id> links, and passes links that are already embed URLs
+    through unchanged. Returns None for anything else.
+    """
+    if not video_url:
+        return None
+
+    # Parse the URL to get its components
+    parsed_url = urlparse(video_url.strip())
+    path_parts = [part for part in parsed_url.path.split('/') if part]
+
+    if parsed_url.hostname in YOUTUBE_HOSTS:
+        # Standard 'watch' link: the video ID is the 'v' query parameter
+        if parsed_url.path == '/watch':
+            video_id = parse_qs(parsed_url.query).get('v')
+            if video_id:
+                return f"https://www.youtube.com/embed/{video_id[0]}"
+        # Shorts link: youtube.com/shorts/<id>
+        if len(path_parts) == 2 and path_parts[0] == 'shorts':
+            return f"https://www.youtube.com/embed/{path_parts[1]}"
+
+    # Shortened 'youtu.be' link: the video ID is the path itself
+    if parsed_url.hostname == 'youtu.be' and path_parts:
+        return f"https://www.youtube.com/embed/{path_parts[0]}"
+
+    # Vimeo link: vimeo.com/<numeric id>
+    if parsed_url.hostname in VIMEO_HOSTS and path_parts and path_parts[-1].isdigit():
+        return f"https://player.vimeo.com/video/{path_parts[-1]}"
+
+    # Already an embed link (YouTube /embed/, player.vimeo.com, ...)
+    if 'embed' in video_url or parsed_url.hostname == 'player.vimeo.com':
+        return video_url
+
+    return None
@@ -0,0 +1,413 @@
+"""Optional write-behind queue for enrollment and progress clicks.
+
+With ``WRITE_BEHIND`` on, the enroll and toggle-complete routes record an
+event here and return at once. One background thread per worker process
+commits the queued events in group transactions, every
+``WRITE_BEHIND_INTERVAL`` seconds or ``WRITE_BEHIND_BATCH`` events,
+whichever comes first. Repeated clicks on the same course are coalesced, so
+only the final state is written.
+
+Crash recovery: every event is appended to a spill file before it is
+queued, and after each group commit a ``{"committed": seq}`` line records
+that every event up to ``seq`` is in the database (batches are committed
+in queue order). Files left behind by a dead process are replayed on the
+next start, skipping the committed events: replaying one could overwrite
+a newer click made through another worker since. Only a crash between a
+commit and its marker line replays that one batch. The spill file is
+truncated whenever the queue drains. Pending events are flushed when the
+process exits.
+
+Read-your-writes: the course page checks ``pending_enrollment`` and
+``pending_completion`` before the database, and pages that aggregate
+(the dashboard) call ``wait_for_user`` to flush that user's events first.
+This holds per worker process, so multi-worker deployments need sticky
+sessions for it.
+
+With ``DB_SHARDS`` each batch is split by shard and committed as one
+transaction per shard. If one of them fails the whole batch is retried;
+the events are explicit states ("enrolled", "completed = 1"), not
+toggles, so the shards that did commit are left as they are.
+"""
+
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict, deque, namedtuple
+from flask import current_app
+from database import get_backend, write_with_retry
+from changes import record_change
+from progress import record_enrollment, record_progress_changes
+
+DEFAULT_WRITE_BEHIND_INTERVAL = 0.05  # Seconds between group commits
+DEFAULT_WRITE_BEHIND_BATCH = 500  # Events per group commit, at most
+DEFAULT_WRITE_BEHIND_WAIT = 2.0  # Seconds wait_for_user waits for a commit
+
+logger = logging.getLogger(__name__)
+
+# One click. ``completed`` is None for enrollments; ``at`` is the UTC time
+# of the click, stored instead of the (later) commit time.
+WriteEvent = namedtuple('WriteEvent', ['seq', 'kind', 'user_id', 'course_id', 'completed', 'at'])
+
+
+def _utc_timestamp():
+    """Return the current time formatted like SQLite's CURRENT_TIMESTAMP."""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+
+def apply_events(conn, events, track_summary=True):
+    """Write a batch of events in the caller's transaction.
+
+    Events for missing courses and duplicate enrollments are skipped.
+    For progress only the last event per (user, course) counts, and rows
+    already in that state are left alone.
+    """
+    enrollments = {}
+    progress = {}
+    for event in events:
+        key = (event.user_id, event.course_id)
+        if event.kind == 'enroll':
+            enrollments.setdefault(key, event)
+        else:
+            progress[key] = event
+
+    enrolled = Counter()
+    latest = {}  # user_id -> time of their latest applied event
+    for (user_id, course_id), event in enrollments.items():
+        cursor = conn.execute('''
+            INSERT INTO enrollments (user_id, course_id, enrolled_at)
+            SELECT ?, id, ? FROM courses WHERE id = ?
+            ON CONFLICT(user_id, course_id) DO NOTHING
+        ''', (user_id, event.at, course_id))
+        if cursor.rowcount:
+            enrolled[user_id] += 1
+            latest[user_id] = max(latest.get(user_id, event.at), event.at)
+
+    changes = defaultdict(list)
+    for (user_id, course_id), event in progress.items():
+        old = conn.execute(
+            'SELECT completed FROM course_progress WHERE user_id = ? AND course_id = ?',
+            (user_id, course_id)
+        ).fetchone()
+        old_status = old[0] if old else None
+        if old_status == event.completed:
+            continue
+        # Progress on a missing course is skipped, like its enrollments
+        cursor = conn.execute('''
+            INSERT INTO course_progress (user_id, course_id, completed, completed_at)
+            SELECT ?, id, ?, ? FROM courses WHERE id = ?
+            ON CONFLICT(user_id, course_id) DO UPDATE SET
+                completed = excluded.completed,
+                completed_at = excluded.completed_at
+        ''', (user_id, event.completed, event.at, course_id))
+        if cursor.rowcount:
+            changes[user_id].append((old_status, event.completed))
+            latest[user_id] = max(latest.get(user_id, event.at), event.at)
+
+    if enrolled or changes:
+        record_change(conn, 'progress')
+    if track_summary:
+        for user_id, count in enrolled.items():
+            record_enrollment(conn, user_id, count, at=latest[user_id])
+        for user_id, user_changes in changes.items():
+            record_progress_changes(conn, user_id, user_changes, at=latest[user_id])
+
+
+class WriteBehindQueue:
+    """An in-process event queue drained by one background writer thread.
+
+    ``connect(shard)`` opens the writer's connection to a shard and
+    ``shard_of(user_id)`` says which shard a user's rows live in (both see
+    database.get_user_db; without shards everything is shard 0).
+    ``spill_base`` is the path prefix of the spill files (one per process,
+    ``<base>-<pid>.jsonl``). ``changes`` is the process's ChangeCounters,
+    invalidated after every commit (the writer runs outside any request).
+    """
+
+    def __init__(self, connect, spill_base, interval=DEFAULT_WRITE_BEHIND_INTERVAL,
+                 max_batch=DEFAULT_WRITE_BEHIND_BATCH, track_summary=True, fsync=False,
+                 shard_of=lambda user_id: 0, changes=None):
+        self.connect = connect
+        self.shard_of = shard_of
+        self.changes = changes
+        self.spill_base = spill_base
+        self.interval = interval
+        self.max_batch = max_batch
+        self.track_summary = track_summary
+        self.fsync = fsync
+        self.enqueued = 0
+        self.committed = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_batch_size = 0
+        self.max_batch_seen = 0
+        self._seq = 0
+        self._queue = deque()
+        self._latest = {}  # (kind, user_id, course_id) -> newest pending event
+        self._user_pending = Counter()
+        self._cond = threading.Condition()
+        self._flush_requested = False
+        self._stopping = False
+        self._thread = None
+        self._spill = None
+        self._pid = None
+
+    # --- request side -------------------------------------------------------
+
+    def _start(self):
+        """Start the writer thread and open this process's spill file (lazily, per process)."""
+        if self._pid == os.getpid():
+            return
+        self._queue.clear()  # Events inherited over fork belong to the parent
+        self._latest.clear()
+        self._user_pending.clear()
+        self._spill = open(f'{self.spill_base}-{os.getpid()}.jsonl', 'a', encoding='utf-8')
+        fcntl.flock(self._spill, fcntl.LOCK_EX | fcntl.LOCK_NB)  # Marks the file as live
+        self._pid = os.getpid()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def enqueue(self, kind, user_id, course_id, completed=None):
+        """Record an 'enroll' or 'progress' event and return without committing."""
+        with self._cond:
+            self._start()
+            self._seq += 1
+            event = WriteEvent(self._seq, kind, user_id, course_id, completed, _utc_timestamp())
+            # Spill first, so a crash after this line cannot lose the click
+            self._write_spill(event._asdict())
+            self._queue.append(event)
+            self._latest[(kind, user_id, course_id)] = event
+            self._user_pending[user_id] += 1
+            self.enqueued += 1
+            if len(self._queue) == 1 or len(self._queue) >= self.max_batch:
+                self._cond.notify_all()
+        return event
+
+    def _write_spill(self, record):
+        """Append one JSON line to the spill file (the caller holds the lock)."""
+        self._spill.write(json.dumps(record) + '\n')
+        self._spill.flush()
+        if self.fsync:
+            os.fsync(self._spill.fileno())
+
+    def pending_enrollment(self, user_id, course_id):
+        """Check if an enrollment is queued but not yet committed."""
+        with self._cond:
+            return ('enroll', user_id, course_id) in self._latest
+
+    def pending_completion(self, user_id, course_id):
+        """Return the queued completed state of a course, or None if nothing is queued."""
+        with self._cond:
+            event = self._latest.get(('progress', user_id, course_id))
+            return None if event is None else event.completed
+
+    def wait_for_user(self, user_id, timeout=DEFAULT_WRITE_BEHIND_WAIT):
+        """Commit a user's queued events now and wait for them (up to ``timeout``).
+
+        Returns True if nothing of theirs is pending any more.
+        """
+        with self._cond:
+            if not self._user_pending[user_id]:
+                return True
+            self._flush_requested = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._user_pending[user_id], timeout)
+
+    def flush(self, timeout=None):
+        """Commit everything queued so far and wait for it."""
+        with self._cond:
+            if not self._queue:
+                return True
+            self._flush_requested = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._user_pending, timeout)
+
+    def stats(self):
+        """Return the queue counters as a dict."""
+        with self._cond:
+            return {
+                'queue_depth': len(self._queue),
+                'enqueued': self.enqueued,
+                'committed': self.committed,
+                'batches': self.batches,
+                'last_batch_size': self.last_batch_size,
+                'max_batch_size': self.max_batch_seen,
+                'avg_batch_size': self.committed / self.batches if self.batches else 0.0,
+                'errors': self.errors,
+            }
+
+    # --- writer side --------------------------------------------------------
+
+    def _next_batch(self):
+        """Wait for work and take up to ``max_batch`` events off the queue."""
+        with self._cond:
+            while not self._queue and not self._stopping:
+                self._cond.wait()
+            if not self._stopping:
+                # Give more events a moment to arrive, to commit them together
+                self._cond.wait_for(
+                    lambda: self._stopping or self._flush_requested
+                    or len(self._queue) >= self.max_batch,
+                    self.interval,
+                )
+            self._flush_requested = False
+            return [self._queue.popleft() for _ in range(min(len(self._queue), self.max_batch))]
+
+    def _committed(self, batch):
+        """Drop committed events from the read-your-writes view and the spill file."""
+        with self._cond:
+            for event in batch:
+                key = (event.kind, event.user_id, event.course_id)
+                if self._latest.get(key) is event:
+                    del self._latest[key]
+                self._user_pending[event.user_id] -= 1
+                if not self._user_pending[event.user_id]:
+                    del self._user_pending[event.user_id]
+            self.committed += len(batch)
+            self.batches += 1
+            self.last_batch_size = len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            if self._queue:
+                self._write_spill({'committed': batch[-1].seq})
+            else:
+                self._spill.truncate(0)
+            self._cond.notify_all()
+
+    def _apply(self, connections, events):
+        """Commit events, one transaction per shard; ``connections`` caches the connections."""
+        by_shard = defaultdict(list)
+        for event in events:
+            by_shard[self.shard_of(event.user_id)].append(event)
+        for shard, shard_events in sorted(by_shard.items()):
+            if shard not in connections:
+                connections[shard] = self.connect(shard)
+            write_with_retry(connections[shard],
+                             lambda c: apply_events(c, shard_events, self.track_summary))
+            if self.changes is not None:
+                self.changes.invalidate()
+
+    def _run(self):
+        """Writer thread: commit batches until stopped and drained."""
+        connections = {}
+        try:
+            while True:
+                batch = self._next_batch()
+                if not batch:
+                    if self._stopping:
+                        return
+                    continue
+                try:
+                    self._apply(connections, batch)
+                except Exception:
+                    logger.exception('Write-behind commit of %d events failed', len(batch))
+                    with self._cond:
+                        self.errors += 1
+                        self._queue.extendleft(reversed(batch))  # Retry them next round
+                        stopping = self._stopping
+                    if stopping:
+                        return  # Leave them in the spill file for the next start
+                    time.sleep(self.interval)
+                    continue
+                self._committed(batch)
+        finally:
+            for conn in connections.values():
+                conn.close()
+
+    def close(self):
+        """Flush pending events and stop the writer thread."""
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join()
+        with self._cond:
+            drained = not self._queue
+            self._spill.close()
+            if drained:
+                os.remove(self._spill.name)
+            self._pid = None
+
+    # --- recovery -----------------------------------------------------------
+
+    def replay_spill_files(self):
+        """Apply the events in spill files left by processes that died.
+
+        Returns the number of events replayed. Events before the file's last
+        commit marker are already in the database and skipped. Files of
+        live processes are locked and skipped.
+        """
+        replayed = 0
+        for path in sorted(glob.glob(f'{glob.escape(self.spill_base)}-*.jsonl')):
+            with open(path, 'r+', encoding='utf-8') as spill:
+                try:
+                    fcntl.flock(spill, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # A live worker owns it
+                events = []
+                committed = 0
+                for line in spill:
+                    try:
+                        record = json.loads(line)
+                        if 'committed' in record:
+                            committed = record['committed']
+                        else:
+                            events.append(WriteEvent(**record))
+                    except (ValueError, TypeError):
+                        break  # A torn last line from the crash
+                events = [event for event in events if event.seq > committed]
+                if events:
+                    connections = {}
+                    try:
+                        self._apply(connections, events)
+                    finally:
+                        for conn in connections.values():
+                            conn.close()
+                    logger.warning('Replayed %d write-behind events from %s', len(events), path)
+                replayed += len(events)
+            os.remove(path)
+        return replayed
+
+
+def init_write_behind(app):
+    """Create the write-behind queue for an app if ``WRITE_BEHIND`` is on."""
+    app.config.setdefault('WRITE_BEHIND', False)
+    app.config.setdefault('WRITE_BEHIND_INTERVAL', DEFAULT_WRITE_BEHIND_INTERVAL)
+    app.config.setdefault('WRITE_BEHIND_BATCH', DEFAULT_WRITE_BEHIND_BATCH)
+    app.config.setdefault('WRITE_BEHIND_SPILL', app.config['DATABASE'] + '-writes')
+    app.config.setdefault('WRITE_BEHIND_FSYNC', False)
+    if not app.config['WRITE_BEHIND']:
+        app.extensions['lms_write_behind'] = None
+        return
+
+    backend = get_backend(app)
+    queue = WriteBehindQueue(
+        connect=lambda shard: backend.shard_pool(shard).acquire(),
+        shard_of=backend.shard_index,
+        spill_base=app.config['WRITE_BEHIND_SPILL'],
+        interval=app.config['WRITE_BEHIND_INTERVAL'],
+        max_batch=app.config['WRITE_BEHIND_BATCH'],
+        track_summary=app.config.get('PROGRESS_SUMMARY', False),
+        fsync=app.config['WRITE_BEHIND_FSYNC'],
+        changes=app.extensions['lms_changes'],
+    )
+    queue.replay_spill_files()
+    atexit.register(queue.close)
+    app.extensions['lms_write_behind'] = queue
+
+
+def get_write_behind(app=None):
+    """Return the given (or current) app's write-behind queue, or None if the mode is off."""
+    app = app or current_app
+    return app.extensions.get('lms_write_behind')
+
+
+def write_behind_stats(app=None):
+    """Return the queue depth and batch counters, or None if the mode is off."""
+    queue = get_write_behind(app)
+    return queue.stats() if queue is not None else None
@@ -0,0 +1,13 @@
+"""WSGI entry point for pre-fork servers.
+
+    gunicorn --preload --workers 4 --threads 8 wsgi:app
+
+With ``--preload`` the master builds and warms the app once (see
+``app.warm_app``) and every worker shares that memory copy-on-write, so a
+new worker is ready as soon as it forks. Configure with ``LMS_*``
+environment variables, e.g. ``LMS_DATABASE=/srv/lms.db``.
+"""
+
+from app import create_app, warm_app
+
+app = warm_app(create_app())